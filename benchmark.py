@@ -0,0 +1,913 @@
+#!/usr/bin/env python3
+
+"""Micro benchmarks of the exporter hot paths.
+
+Usage: ./benchmark.py [name ...]
+
+Without arguments all benchmarks are executed.
+"""
+
+import os
+import sys
+import json
+import time
+
+from nxtools import *
+from pythonosc import osc_message
+
+benchmarks = {}
+
+
+def benchmark(func):
+    benchmarks[func.__name__[len("bench_"):].replace("_", "-")] = func
+    return func
+
+
+def measure(func, duration=1):
+    """Runs func repeatedly for about `duration` seconds, returns seconds per call"""
+    count = 0
+    start_time = time.perf_counter()
+    while True:
+        func()
+        count += 1
+        elapsed = time.perf_counter() - start_time
+        if elapsed > duration:
+            return elapsed / count
+
+
+#
+# Exposition rendering
+#
+
+@benchmark
+def bench_render():
+    from promexp.common import settings, HOSTNAME
+    from promexp.registry import MetricRegistry
+
+    def render_metric(name, value, **tags):
+        # String concatenation renderer used before MetricRegistry
+        result = ""
+        if settings.get("prefix"):
+            result+=str(settings["prefix"])+"_"
+        tags["hostname"] = settings.get("hostname") or HOSTNAME
+        tags.update(settings["tags"])
+        result += name + "{"
+        result += ", ".join(["{}=\"{}\"".format(k, tags[k]) for k in tags ])
+        result += "}"
+        result += " " + str(value) + "\n"
+        return result
+
+    print("{:>8}  {:>12}  {:>12}  {:>8}".format("series", "legacy [us]", "registry [us]", "speedup"))
+    for count in [10, 100, 1000, 10000]:
+        samples = [
+                ("casparcg_dropped_total", i * 1.5, {"channel" : i // 100, "layer" : i % 100})
+                for i in range(count)
+            ]
+
+        def legacy():
+            result = ""
+            for name, value, tags in samples:
+                result += render_metric(name, value, **tags)
+            return result.encode("utf-8")
+
+        registry = MetricRegistry(settings)
+
+        def interned():
+            registry.begin()
+            for name, value, tags in samples:
+                registry.add(name, value, **tags)
+            return registry.finish()
+
+        assert legacy() == interned()
+        t_legacy = measure(legacy)
+        t_registry = measure(interned)
+        print("{:>8}  {:>12.1f}  {:>12.1f}  {:>7.1f}x".format(
+            count,
+            t_legacy * 1000000,
+            t_registry * 1000000,
+            t_legacy / t_registry
+        ))
+
+
+#
+# HTTP serving
+#
+
+@benchmark
+def bench_http(scrapers=[1, 4, 16], requests=200):
+    import http.client
+    import http.server
+    import socket
+    import threading
+    import _thread
+
+    from promexp.server import MetricsRequestHandler, PooledHTTPServer
+    from promexp.response import CachedResponse
+
+    class Parent():
+        get_info = "Benchmark"
+
+        def __init__(self):
+            body = "".join(["metric_{}{{hostname=\"bench\"}} {}\n".format(i, i) for i in range(2000)])
+            self.cached_response = CachedResponse(1, body.encode("ascii"))
+            self.metrics = self
+
+        def response(self):
+            return self.cached_response
+
+    class LegacyRequestHandler(MetricsRequestHandler):
+        protocol_version = "HTTP/1.0"
+        timeout = 1
+
+    def scrape(port, count, latencies, keepalive):
+        conn = None
+        for i in range(count):
+            start_time = time.perf_counter()
+            if conn is None:
+                conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            conn.request("GET", "/metrics", headers={"Accept-Encoding" : "gzip"})
+            response = conn.getresponse()
+            response.read()
+            if not keepalive or response.will_close:
+                conn.close()
+                conn = None
+            latencies.append(time.perf_counter() - start_time)
+
+    def run(httpd, count, keepalive, idle_client):
+        httpd.parent = Parent()
+        httpd.request_timeout = 1
+        _thread.start_new_thread(httpd.serve_forever, ())
+        port = httpd.server_address[1]
+        if idle_client:
+            # Slow client: connects, sends a partial request and stalls
+            idle = socket.create_connection(("127.0.0.1", port))
+            idle.sendall(b"GET /metrics HTTP/1.1\r\n")
+        latencies = []
+        threads = [
+                threading.Thread(target=scrape, args=(port, requests, latencies, keepalive))
+                for i in range(count)
+            ]
+        start_time = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start_time
+        if idle_client:
+            idle.close()
+        httpd.shutdown()
+        httpd.server_close()
+        latencies.sort()
+        return (
+                len(latencies) / elapsed,
+                latencies[len(latencies) // 2] * 1000,
+                latencies[int(len(latencies) * 0.99)] * 1000
+            )
+
+    logging.file = open(os.devnull, "w")
+    print("{:>8}  {:<28}  {:<4}  {:>8}  {:>9}  {:>9}".format(
+        "scrapers", "server", "idle", "req/s", "p50 [ms]", "p99 [ms]")
+    )
+    servers = [
+        ("HTTPServer, HTTP/1.0", lambda: http.server.HTTPServer(("127.0.0.1", 0), LegacyRequestHandler), False),
+        ("PooledHTTPServer, keep-alive", lambda: PooledHTTPServer(("127.0.0.1", 0), MetricsRequestHandler), True),
+    ]
+    for idle_client in [False, True]:
+        for count in scrapers:
+            for title, factory, keepalive in servers:
+                rate, p50, p99 = run(factory(), count, keepalive, idle_client)
+                print("{:>8}  {:<28}  {:<4}  {:>8.0f}  {:>9.2f}  {:>9.2f}".format(
+                    count, title, "yes" if idle_client else "no", rate, p50, p99)
+                )
+    logging.file = sys.stderr
+
+
+@benchmark
+def bench_http_idle(idle_clients=[0, 2, 8, 24], workers=2):
+    import http.client
+    import _thread
+
+    from promexp.server import MetricsRequestHandler, PooledHTTPServer
+    from promexp.response import CachedResponse
+
+    class Parent():
+        get_info = "Benchmark"
+
+        def __init__(self):
+            self.cached_response = CachedResponse(1, b"metric 1\n")
+            self.metrics = self
+
+        def response(self):
+            return self.cached_response
+
+    def get(conn):
+        start_time = time.perf_counter()
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        response.read()
+        assert response.status == 200
+        return time.perf_counter() - start_time
+
+    logging.file = open(os.devnull, "w")
+    print("{} workers, 5 s idle timeout".format(workers))
+    print("{:>12}  {:>20}  {:>20}".format("idle clients", "new client [ms]", "idle client [ms]"))
+    try:
+        for count in idle_clients:
+            httpd = PooledHTTPServer(("127.0.0.1", 0), MetricsRequestHandler, workers=workers, request_timeout=5)
+            httpd.parent = Parent()
+            _thread.start_new_thread(httpd.serve_forever, ())
+            port = httpd.server_address[1]
+
+            # Scrapers which made a request and keep the connection open
+            idle = [http.client.HTTPConnection("127.0.0.1", port, timeout=10) for i in range(count)]
+            for conn in idle:
+                get(conn)
+
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+            new_latency = get(conn)
+            idle_latency = get(idle[0]) if idle else 0
+            print("{:>12}  {:>20.2f}  {:>20.2f}".format(count, 1000 * new_latency, 1000 * idle_latency))
+
+            for conn in idle + [conn]:
+                conn.close()
+            httpd.shutdown()
+            httpd.server_close()
+    finally:
+        logging.file = sys.stderr
+
+
+#
+# OSC ingest
+#
+
+def caspar_addresses(channels=4, layers=20):
+    """Returns OSC addresses CasparCG sends for every frame"""
+    layer_keys = [
+            "foreground/file/time",
+            "foreground/file/name",
+            "foreground/file/path",
+            "foreground/file/fps",
+            "foreground/paused",
+            "foreground/producer",
+            "background/producer",
+            "profiler/time",
+        ]
+    result = []
+    for id_channel in range(1, channels + 1):
+        result.append("/channel/{}/framerate".format(id_channel))
+        result.append("/channel/{}/output/consume_time".format(id_channel))
+        result.append("/channel/{}/profiler/time".format(id_channel))
+        result.append("/channel/{}/mixer/audio/nb_channels".format(id_channel))
+        for id_audio in range(1, 9):
+            result.append("/channel/{}/mixer/audio/{}/pFS".format(id_channel, id_audio))
+            result.append("/channel/{}/mixer/audio/{}/dBFS".format(id_channel, id_audio))
+        for id_layer in range(1, layers + 1):
+            for key in layer_keys:
+                result.append("/channel/{}/stage/layer/{}/{}".format(id_channel, id_layer, key))
+    return result
+
+
+def caspar_message(address):
+    """Returns OSC message datagram with CasparCG-like arguments for an address"""
+    from pythonosc import osc_message_builder
+
+    builder = osc_message_builder.OscMessageBuilder(address=address)
+    key = address.split("/")[-1]
+    if key in ["time", "fps"]:
+        builder.add_arg(12.5)
+        builder.add_arg(3600.0)
+    elif key == "framerate":
+        builder.add_arg(50)
+        builder.add_arg(1)
+    elif key in ["name", "path", "producer"]:
+        builder.add_arg("AMB_BROADCAST_PROMO_1080I50.mov")
+    elif key == "paused":
+        builder.add_arg(False)
+    elif key == "nb_channels":
+        builder.add_arg(8)
+    else:
+        builder.add_arg(0.0123)
+    return builder.build().dgram
+
+
+def caspar_bundles(channels=4, layers=20):
+    """Returns one bundle datagram per channel with all its per-frame messages"""
+    from pythonosc import osc_bundle_builder
+
+    result = []
+    for id_channel in range(1, channels + 1):
+        builder = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+        for address in caspar_addresses(1, layers):
+            address = address.replace("/channel/1/", "/channel/{}/".format(id_channel))
+            builder.add_content(osc_message.OscMessage(caspar_message(address)))
+        result.append(builder.build().dgram)
+    return result
+
+
+def caspar_dispatcher():
+    from pythonosc import dispatcher
+
+    handler = lambda *args: None
+    result = dispatcher.Dispatcher()
+    result.map("/channel/*/stage/layer/*/", handler)
+    result.map("/channel/*/framerate", handler)
+    result.map("/channel/*/mixer/audio/*", handler)
+    result.map("/channel/*/output/consume_time", handler)
+    result.set_default_handler(handler)
+    return result
+
+
+@benchmark
+def bench_osc_dispatch():
+    import re
+
+    def legacy_handlers_for_address(dispatcher, address_pattern):
+        # Address resolution used before compiled pattern caching
+        escaped_address_pattern = re.escape(address_pattern)
+        pattern = escaped_address_pattern.replace('\\?', '\\w?')
+        pattern = pattern.replace('\\*', r'[\w|\+]*')
+        pattern = pattern + '$'
+        patterncompiled = re.compile(pattern)
+        matched = False
+        for addr, handlers in dispatcher._map.items():
+            if (patterncompiled.match(addr)
+                    or (('*' in addr) and re.match(addr.replace('*', '[^/]*?/*'), address_pattern))):
+                yield from handlers
+                matched = True
+        if not matched and dispatcher._default_handler:
+            yield dispatcher._default_handler
+
+    dispatcher = caspar_dispatcher()
+    addresses = caspar_addresses()
+
+    def legacy():
+        for address in addresses:
+            for handler in legacy_handlers_for_address(dispatcher, address):
+                pass
+
+    def cached():
+        for address in addresses:
+            for handler in dispatcher.handlers_for_address(address):
+                pass
+
+    for address in addresses:
+        assert list(legacy_handlers_for_address(dispatcher, address)) == list(dispatcher.handlers_for_address(address))
+
+    print("{} distinct addresses".format(len(addresses)))
+    print("{:<24}  {:>12}".format("resolver", "messages/s"))
+    for title, func in [("legacy", legacy), ("compiled + LRU cache", cached)]:
+        print("{:<24}  {:>12.0f}".format(title, len(addresses) / measure(func)))
+
+
+@benchmark
+def bench_osc_parse():
+    from pythonosc import osc_packet
+
+    messages = [caspar_message(address) for address in caspar_addresses()]
+    bundles = caspar_bundles()
+    bundle_messages = sum([len(osc_packet.OscPacket(dgram).messages) for dgram in bundles])
+
+    def parse_messages():
+        for dgram in messages:
+            osc_packet.OscPacket(dgram)
+
+    def parse_bundles():
+        for dgram in bundles:
+            osc_packet.OscPacket(dgram)
+
+    print("{:<24}  {:>12}".format("datagrams", "messages/s"))
+    print("{:<24}  {:>12.0f}".format("single messages", len(messages) / measure(parse_messages)))
+    print("{:<24}  {:>12.0f}".format("bundle per channel", bundle_messages / measure(parse_bundles)))
+
+
+@benchmark
+def bench_caspar_snapshot(duration=2, readers=4):
+    import threading
+
+    from promexp.caspar import CasparMetricsProvider
+    from promexp.common import settings
+    from pythonosc import osc_message_builder
+
+    def drop_message(id_channel, id_layer):
+        builder = osc_message_builder.OscMessageBuilder(
+                address="/channel/{}/stage/layer/{}/profiler/time".format(id_channel, id_layer)
+            )
+        builder.add_arg(0.03)
+        builder.add_arg(0.02)
+        return builder.build().dgram
+
+    frame = [caspar_message(address) for address in caspar_addresses()]
+    drops = [drop_message(1 + i % 4, 1 + i % 997) for i in range(4000)]
+
+    class LegacyProvider():
+        # Nested dicts modified in place, as before CasparSnapshot
+        def __init__(self):
+            self.fps = {id_channel : (50, 1) for id_channel in range(1, 5)}
+            self.profiler = {}
+
+        def parse_stage(self, address, *args):
+            address = address.split("/")
+            id_channel, layer = int(address[2]), int(address[5])
+            if args[0] > args[1]:
+                if not id_channel in self.profiler:
+                    self.profiler[id_channel] = {}
+                if not layer in self.profiler[id_channel]:
+                    self.profiler[id_channel][layer] = 0
+                self.profiler[id_channel][layer] += 1
+
+        def create_dispatcher(self):
+            from pythonosc import dispatcher
+            result = dispatcher.Dispatcher()
+            result.map("/channel/*/stage/layer/*/profiler/time", self.parse_stage)
+            result.set_default_handler(lambda *args: None)
+            return result
+
+        def read(self):
+            return [
+                    (id_channel, id_layer, self.profiler[id_channel][id_layer])
+                    for id_channel in self.fps
+                    for id_layer in self.profiler.get(id_channel, {})
+                ]
+
+    def snapshot_read(provider):
+        caspar = provider.collect()
+        return [
+                (id_channel, id_layer, caspar["dropped"][id_channel][id_layer])
+                for id_channel in caspar["dropped"]
+                for id_layer in caspar["dropped"][id_channel]
+            ]
+
+    def run(provider, read):
+        dispatcher = provider.create_dispatcher()
+        should_run = True
+        written = [0]
+        reads = []
+        errors = []
+
+        def writer():
+            i = 0
+            while should_run:
+                for dgram in frame:
+                    dispatcher.call_handlers_for_packet(dgram, ("127.0.0.1", 6250))
+                dispatcher.call_handlers_for_packet(drops[i % len(drops)], ("127.0.0.1", 6250))
+                written[0] += len(frame) + 1
+                i += 1
+
+        def reader():
+            count = 0
+            last = {}
+            while should_run:
+                try:
+                    for id_channel, id_layer, value in read(provider):
+                        if value < last.get((id_channel, id_layer), 0):
+                            errors.append("counter went backwards")
+                        last[id_channel, id_layer] = value
+                except Exception as e:
+                    errors.append(e)
+                count += 1
+            reads.append(count)
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        should_run = False
+        for thread in threads:
+            thread.join()
+        return written[0] / duration, sum(reads) / duration, errors
+
+    provider = CasparMetricsProvider(dict(settings, caspar_host=None))
+    provider.fps = {id_channel : (50, 1) for id_channel in range(1, 5)}
+    provider.publish()
+
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(0.00001)
+    logging.file = open(os.devnull, "w")
+    print("{:<16}  {:>12}  {:>10}  {:>8}".format("state", "messages/s", "reads/s", "errors"))
+    try:
+        for title, target, read in [
+                    ("in-place dicts", LegacyProvider(), LegacyProvider.read),
+                    ("snapshots", provider, snapshot_read),
+                ]:
+            rate, read_rate, errors = run(target, read)
+            print("{:<16}  {:>12.0f}  {:>10.0f}  {:>8}".format(title, rate, read_rate, len(errors)))
+            if errors:
+                print("    first error: {!r}".format(errors[0]))
+    finally:
+        sys.setswitchinterval(switch_interval)
+        logging.file = sys.stderr
+
+
+@benchmark
+def bench_caspar_stage():
+    import tracemalloc
+
+    from promexp.stage import StageStore
+
+    def legacy_parse_stage(stage, *args):
+        # Nested dict store used before StageStore
+        address = args[0].split("/")
+        data =  args[1:]
+        id_channel = int(address[2])
+        layer = int(address[5])
+        key = "/".join(address[6:])
+        if not id_channel in stage:
+            stage[id_channel] = {}
+        if not layer in stage[id_channel]:
+            stage[id_channel][layer] = {}
+        stage[id_channel][layer][key] = data
+
+    print("{:>8}  {:<12}  {:>12}  {:>12}".format("layers", "store", "messages/s", "memory [kB]"))
+    for channels, layers in [(4, 20), (4, 100)]:
+        messages = [
+                (address, osc_message.OscMessage(caspar_message(address)).params)
+                for address in caspar_addresses(channels, layers)
+                if "/stage/layer/" in address
+            ]
+
+        def legacy():
+            stage = {}
+            for address, params in messages:
+                legacy_parse_stage(stage, address, *params)
+            return stage
+
+        def compact():
+            stage = StageStore()
+            for address, params in messages:
+                stage.update(address, params)
+            return stage
+
+        legacy_stage = legacy()
+        compact_stage = compact()
+
+        def legacy_frame():
+            for address, params in messages:
+                legacy_parse_stage(legacy_stage, address, *params)
+
+        def compact_frame():
+            for address, params in messages:
+                compact_stage.update(address, tuple(params))
+
+        for title, build, frame in [("nested dict", legacy, legacy_frame), ("StageStore", compact, compact_frame)]:
+            tracemalloc.start()
+            stage = build()
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            del stage
+            print("{:>8}  {:<12}  {:>12.0f}  {:>12.1f}".format(
+                channels * layers,
+                title,
+                len(messages) / measure(frame),
+                memory / 1024
+            ))
+
+
+@benchmark
+def bench_caspar_servers(servers=[1, 4, 12]):
+    from promexp.caspar import CasparMetricsProvider, OscDemux
+    from promexp.common import settings
+
+    frame = caspar_bundles() + [caspar_message(address) for address in caspar_addresses(1, 0)]
+    logging.file = open(os.devnull, "w")
+    print("{:>8}  {:>12}  {:>12}".format("servers", "datagrams/s", "messages/s"))
+    try:
+        for count in servers:
+            demux = OscDemux()
+            sources = []
+            for i in range(count):
+                provider = CasparMetricsProvider(dict(settings, caspar_host=None))
+                provider.address = "10.0.0.{}".format(i + 1)
+                provider.protocol = 2.2
+                provider.fps = {id_channel : (50, 1) for id_channel in range(1, 5)}
+                provider.publish()
+                demux.add(provider, [provider.address])
+                sources.append((provider.address, 6250))
+
+            def run():
+                for source in sources:
+                    for dgram in frame:
+                        demux.call_handlers_for_packet(dgram, source)
+
+            elapsed = measure(run)
+            messages = len(caspar_addresses()) + len(caspar_addresses(1, 0))
+            print("{:>8}  {:>12.0f}  {:>12.0f}".format(
+                count,
+                len(frame) * count / elapsed,
+                messages * count / elapsed
+            ))
+    finally:
+        logging.file = sys.stderr
+
+
+@benchmark
+def bench_peak_volume(scrape_interval=15, fps=50, duration=600):
+    import random
+
+    from promexp.caspar import CasparMetricsProvider
+    from promexp.common import settings
+    from promexp.peak import PeakWindow
+
+    class LegacyPeak():
+        # Max since the last read, reset on read
+        def __init__(self):
+            self.value = 0
+
+        def observe(self, value, now):
+            self.value = max(value, self.value)
+
+        def get(self, window, now):
+            value, self.value = self.value, 0
+            return value, None, None
+
+    # One pFS value per frame with a short spike about every 10 seconds,
+    # scraped by two Prometheus replicas offset by half an interval
+    random.seed(1)
+    samples = []
+    for i in range(duration * fps):
+        value = random.uniform(0.5, 1) if random.random() < 1 / (10 * fps) else random.uniform(0.1, 0.3)
+        samples.append((i / fps, value))
+    scrapes = [
+            (scrape_interval + i * scrape_interval / 2, i % 2)
+            for i in range(2 * (duration - scrape_interval) // scrape_interval)
+        ]
+
+    print("{:<14}  {:>14}  {:>12}".format("store", "correct peaks", "messages/s"))
+    for title, peak in [("reset on read", LegacyPeak()), ("PeakWindow", PeakWindow(scrape_interval))]:
+        correct = 0
+        i = 0
+        for scrape_time, replica in scrapes:
+            while i < len(samples) and samples[i][0] < scrape_time:
+                peak.observe(samples[i][1], samples[i][0])
+                i += 1
+            expected = max(v for t, v in samples[max(0, i - scrape_interval * fps):i])
+            if peak.get(scrape_interval, scrape_time - 1 / fps)[0] == expected:
+                correct += 1
+        rate = 1 / measure(lambda: peak.observe(0.5, time.monotonic()))
+        print("{:<14}  {:>13.0f}%  {:>12.0f}".format(title, 100 * correct / len(scrapes), rate))
+
+    provider = CasparMetricsProvider(dict(settings, caspar_host=None))
+    addresses = [address for address in caspar_addresses(4, 0) if "/mixer/audio/" in address]
+
+    def frame():
+        for address in addresses:
+            provider.parse_volume(address, 0.5)
+        provider.publish()
+
+    print("parse_volume: {:.0f} messages/s, collect: {:.3f} ms".format(
+            len(addresses) / measure(frame),
+            1000 * measure(provider.collect)
+        ))
+
+
+@benchmark
+def bench_state_file(channels=4, layers=20):
+    import shutil
+    import tempfile
+
+    from promexp.persist import StateFile
+
+    counters = [[id_channel, id_layer, 0, time.time()] for id_channel in range(1, channels + 1) for id_layer in range(1, layers + 1)]
+
+    def fsync_save(path, data):
+        # Rewrite and fsync the whole file, as a per-increment checkpoint would
+        with open(path, "w") as f:
+            f.write(json.dumps(data))
+            f.flush()
+            os.fsync(f.fileno())
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        print("{} counters".format(len(counters)))
+        print("{:<24}  {:>12}".format("checkpoint", "time [ms]"))
+        state = StateFile(os.path.join(tempdir, "state"))
+        for title, save in [
+                    ("rewrite + fsync", lambda data: fsync_save(os.path.join(tempdir, "state.json"), data)),
+                    ("StateFile.save", state.save),
+                ]:
+            def checkpoint():
+                counters[0][2] += 1
+                save({"dropped" : {"127.0.0.1:5250" : counters}})
+            print("{:<24}  {:>12.3f}".format(title, 1000 * measure(checkpoint)))
+        state.close()
+    finally:
+        shutil.rmtree(tempdir)
+
+
+#
+# AMCP
+#
+
+@benchmark
+def bench_amcp(channels=8, delay=0.002):
+    from nxtools.caspar import CasparCG
+    from tests.fake_amcp import FakeAmcpServer, fake_amcp_responses
+
+    video_modes = ["1080i5000"] * channels
+    server = FakeAmcpServer(fake_amcp_responses(video_modes), delay=delay)
+    caspar = CasparCG("127.0.0.1", server.port)
+    try:
+        # Response bodies must be consumed completely
+        response = caspar.query("INFO")
+        assert response.code == 200 and len(response.lines) == channels, response.data
+        response = caspar.query("INFO 1")
+        assert response.code == 201 and response.data.endswith("</channel>"), response.data
+        response = caspar.query("FOO")
+        assert response.code == 400 and response.data.endswith("FOO"), response.data
+        response = caspar.query("VERSION")
+        assert response.code == 201 and response.data.startswith("2.2.0"), response.data
+        queries = ["INFO {}".format(i) for i in range(1, channels + 1)]
+        assert [r.data for r in caspar.query_many(queries)] == [caspar.query(q).data for q in queries]
+
+        def sequential():
+            for query in queries:
+                caspar.query(query)
+
+        def pipelined():
+            caspar.query_many(queries)
+
+        print("{} INFO commands, {:.0f} ms simulated latency".format(channels, delay * 1000))
+        print("{:<24}  {:>12}".format("client", "time [ms]"))
+        for title, func in [("sequential query()", sequential), ("pipelined query_many()", pipelined)]:
+            print("{:<24}  {:>12.2f}".format(title, measure(func) * 1000))
+    finally:
+        caspar.close()
+        server.close()
+
+
+@benchmark
+def bench_caspar_discovery(channels=8, delay=0.002):
+    from nxtools.caspar import CasparCG
+    from promexp.caspar import CasparMetricsProvider
+    from promexp.common import settings
+    from tests.fake_amcp import FakeAmcpServer, fake_amcp_responses
+
+    def legacy_discovery(caspar):
+        # Sequential INFO [channel] walk used before bulk INFO discovery
+        caspar.query("VERSION")
+        result = {}
+        i = 1
+        while True:
+            response = caspar.query("INFO {}".format(i))
+            if not response:
+                break
+            result[i] = xml(response.data).find("video-mode").text
+            i += 1
+        return result
+
+    video_modes = ["1080i5000", "1080p5000", "2160p5994", "720p6000"] * (channels // 4)
+    responses = fake_amcp_responses(video_modes)
+    no_bulk_info = dict(responses)
+    del no_bulk_info["INFO"]
+
+    logging.file = open(os.devnull, "w")
+    print("{} channels, {:.0f} ms simulated latency".format(channels, delay * 1000))
+    print("{:<28}  {:>10}  {:>12}".format("discovery", "time [ms]", "round trips"))
+    try:
+        for title, server_responses, discover in [
+                    ("sequential INFO [channel]", responses, lambda port: legacy_discovery(CasparCG("127.0.0.1", port))),
+                    ("bulk INFO", responses, None),
+                    ("pipelined INFO [channel]", no_bulk_info, None),
+                ]:
+            server = FakeAmcpServer(server_responses, delay=delay)
+            if discover is None:
+                provider_settings = dict(settings, caspar_host="127.0.0.1", amcp_port=server.port)
+                discover = lambda port: CasparMetricsProvider(provider_settings, threaded=False).fps
+            start_time = time.perf_counter()
+            fps = discover(server.port)
+            elapsed = time.perf_counter() - start_time
+            assert len(fps) == len(video_modes), fps
+            print("{:<28}  {:>10.2f}  {:>12}".format(title, elapsed * 1000, server.round_trips))
+            server.close()
+    finally:
+        logging.file = sys.stderr
+
+
+@benchmark
+def bench_amcp_parse():
+    from nxtools.caspar import AmcpFramer
+
+    class LegacyAmcpFramer(AmcpFramer):
+        # Framer used before the resumable search: rescans and trims the buffer per response
+        def feed(self, data):
+            self.buffer += data
+
+        def next(self):
+            buf = self.buffer
+            end = buf.find(b"\r\n")
+            if end == -1:
+                return None
+            header = buf[:end].decode("utf-8", "replace")
+            code = int(header[:3])
+            if code == 200:
+                body_end = buf.find(b"\r\n\r\n", end)
+                if body_end == -1:
+                    return None
+                body = buf[end+2:body_end]
+                lines = body.decode("utf-8", "replace").split("\r\n") if body else []
+                consumed = body_end + 4
+            else:
+                lines = []
+                consumed = end + 2
+            del buf[:consumed]
+            return code, header, "\n".join(lines)
+
+    def cls_response(count):
+        lines = [
+                "\"MEDIA/AMB_BROADCAST_PROMO_{:06d}\"  MOVIE  123456789 20200101120000 1500 1/25".format(i)
+                for i in range(count)
+            ]
+        return ("200 CLS OK\r\n" + "\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+
+    def parse(framer_class, data, chunk_size):
+        framer = framer_class()
+        result = None
+        for i in range(0, len(data), chunk_size):
+            framer.feed(data[i:i+chunk_size])
+            result = framer.next() or result
+        return result
+
+    print("{:>8}  {:>8}  {:>10}  {:>14}  {:>14}".format("files", "chunk", "size [kB]", "legacy [ms]", "resumable [ms]"))
+    for count in [1000, 10000, 50000]:
+        data = cls_response(count)
+        for chunk_size in [1460, 65536]:
+            assert parse(LegacyAmcpFramer, data, chunk_size) == parse(AmcpFramer, data, chunk_size)
+            t_legacy = measure(lambda: parse(LegacyAmcpFramer, data, chunk_size), .5)
+            t_framer = measure(lambda: parse(AmcpFramer, data, chunk_size), .5)
+            print("{:>8}  {:>8}  {:>10.0f}  {:>14.2f}  {:>14.2f}".format(
+                count,
+                chunk_size,
+                len(data) / 1024,
+                t_legacy * 1000,
+                t_framer * 1000
+            ))
+
+
+#
+# Logging
+#
+
+@benchmark
+def bench_log_throttle():
+    from nxtools.logging import Logging
+
+    logger = Logging()
+    logger.show_time = True
+    logger.file = open(os.devnull, "w")
+
+    def direct():
+        logger.warning("CasparCG: {} drop frame detected on channel {} layer {}".format("10.0.0.1", 1, 10))
+
+    def throttled():
+        logger.throttle.warning(("stage", "10.0.0.1", 1, 10), "CasparCG:", "10.0.0.1", "drop frame detected on channel", 1, "layer", 10)
+
+    print("{:<24}  {:>12}".format("logger", "messages/s"))
+    for title, func in [("logging.warning", direct), ("logging.throttle", throttled)]:
+        print("{:<24}  {:>12.0f}".format(title, 1 / measure(func)))
+
+
+@benchmark
+def bench_log_file():
+    import shutil
+    import tempfile
+
+    from nxtools.logging import Logging, log_to_file
+    from nxtools.timeutils import format_time
+
+    def legacy_log_to_file(path, **kwargs):
+        # Handler used before FileLogWriter: reopens the file for every record
+        path = path.format(date=format_time(time.time(), "%Y-%m-%d"))
+        dirname, fname = os.path.split(path)
+        if not os.path.exists(dirname):
+            os.makedirs(dirname)
+        with open(path, "a") as f:
+            f.write("{}  {}  {}\n".format(format_time(time.time()), "WARNING  ", kwargs["message"]))
+
+    tempdir = tempfile.mkdtemp()
+    try:
+        print("{:<24}  {:>12}".format("handler", "messages/s"))
+        path = os.path.join(tempdir, "{date}", "test.log")
+        for title, handler in [
+                    ("reopen per record", lambda **kwargs: legacy_log_to_file(path, **kwargs)),
+                    ("FileLogWriter", log_to_file(path, queue_size=100000)),
+                ]:
+            logger = Logging()
+            logger.file = open(os.devnull, "w")
+            logger.add_handler(handler)
+            rate = 1 / measure(lambda: logger.warning("CasparCG: dropped frame on channel 1"))
+            if hasattr(handler, "close"):
+                handler.close()
+                rate = "{:.0f} ({} dropped)".format(rate, handler.dropped)
+            else:
+                rate = "{:.0f}".format(rate)
+            print("{:<24}  {:>12}".format(title, rate))
+    finally:
+        shutil.rmtree(tempdir)
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or list(benchmarks)
+    for name in names:
+        if name not in benchmarks:
+            critical_error("Unknown benchmark {}. Available: {}".format(name, ", ".join(benchmarks)))
+        logging.info("Running benchmark: {}".format(name))
+        benchmarks[name]()
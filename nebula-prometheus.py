@@ -5,13 +5,12 @@ import sys
 import time
 import json
 import psutil
-import traceback
 
-from http.server import HTTPServer, BaseHTTPRequestHandler
 import _thread as thread
 
 from nxtools import *
 from promexp import Metrics, settings, BANNER
+from promexp.server import MetricsRequestHandler, PooledHTTPServer
 
 logging.show_time = True
 
@@ -21,43 +20,21 @@ try:
 except:
     pass
 
+if settings.get("log_path"):
+    logging.add_handler(log_to_file(settings["log_path"], max_size=settings.get("log_max_size")))
 
 
-class MetricsRequestHandler(BaseHTTPRequestHandler):
-    def log_request(self, code):
-        logging.debug("HTTP request {} finished with status {}".format(self.path, code))
-
-    def make_response(self, data, status=200, mime="text/txt"):
-        if type(data) == str:
-            data = data.encode("utf-8")
-        self.send_response(status)
-        self.send_header('Content-type', mime)
-        self.send_header('Content-length', len(data))
-        self.end_headers()
-        self.wfile.write(data)
-
-
-    def do_GET(self):
-        if self.path.startswith("/metrics"):
-            try:
-                m = self.server.parent.metrics()
-            except Exception:
-                self.make_response("Unable to get metrics\n\n{}".format(traceback.format_exc()), 500)
-                return
-            self.make_response(m)
-            return
-        elif self.path.startswith("/shutdown"):
-            logging.warning("Shutdown requested")
-            self.server.should_run = False
-            return
-
-        self.make_response(self.server.parent.get_info)
-
 
 class MetricsServer():
     def __init__(self):
         self.metrics = Metrics()
-        self.httpd = HTTPServer((settings["host"], settings["port"]), MetricsRequestHandler)
+        self.httpd = PooledHTTPServer(
+                (settings["host"], settings["port"]),
+                MetricsRequestHandler,
+                workers=settings["http_workers"],
+                max_connections=settings["http_max_connections"],
+                request_timeout=settings["http_timeout"]
+            )
         self.httpd.parent = self
         self.httpd.should_run = True
         logging.info("Starting HTTP server: {}:{}".format(settings["host"], settings["port"]))
@@ -74,6 +51,16 @@ if __name__ == '__main__':
     if "--daemon" in sys.argv:
         logging.file = os.devnull
 
+    if "--asyncio" in sys.argv:
+        from promexp.aio import AsyncMetricsServer
+        server = AsyncMetricsServer()
+        try:
+            server.run()
+        except KeyboardInterrupt:
+            print()
+        logging.info("Shutting down")
+        sys.exit(0)
+
     server = MetricsServer()
     while server.httpd.should_run:
         try:
@@ -1,2 +1,3 @@
 from .caspar import CasparCG
 from .caspar import CasparResponse
+from .caspar import AmcpFramer
@@ -1,10 +1,13 @@
-import telnetlib
+import re
+import socket
+import threading
 
-from nxtools import logging, log_traceback, PYTHON_VERSION, decode_if_py3, encode_if_py3
+from nxtools import logging, log_traceback
 
 __all__ = [
         "CasparCG",
-        "CasparResponse"
+        "CasparResponse",
+        "AmcpFramer"
     ]
 
 class CasparResponse(object):
@@ -17,6 +20,13 @@ class CasparResponse(object):
     def response(self):
         return self.code
 
+    @property
+    def lines(self):
+        """Returns lines of multi-line response body"""
+        if self.code >= 300 or not self.data:
+            return []
+        return self.data.split("\n")
+
     @property
     def is_error(self):
         """Returns True if query failed"""
@@ -36,68 +46,169 @@ class CasparResponse(object):
         return self.is_success
 
 
+HEADER_RE = re.compile(rb"^\d{3} ")
+
+
+class AmcpFramer(object):
+    """Splits AMCP byte stream to responses
+
+    200 responses carry lines terminated by an empty line,
+    201 responses carry one line, other responses are a single header line.
+    400 responses of CasparCG 2.1+ are followed by a line with the failed
+    command. It is returned as the body, unless the line is a response
+    header (servers which do not send it).
+
+    Received data is appended to one buffer. The search for the end of
+    an incomplete response continues where the previous one stopped and
+    consumed data is discarded in bulk, so a long response arriving
+    in many chunks is parsed in linear time.
+    """
+    def __init__(self):
+        self.buffer = bytearray()
+        self.pos = 0        # start of the unparsed data
+        self.scanned = 0    # position where the pending terminator search continues
+        self.header = None  # (code, header) of a response waiting for its body
+
+    def feed(self, data):
+        # Bytes before the pending terminator search are not needed anymore
+        cut = min(self.pos, self.scanned)
+        if cut and (cut == len(self.buffer) or (cut > 65536 and cut * 2 > len(self.buffer))):
+            del self.buffer[:cut]
+            self.pos -= cut
+            self.scanned -= cut
+        self.buffer += data
+
+    def next(self):
+        """Returns (code, header, body) of the next complete response or None.
+
+        Body is a string with lines separated by \\n, or None for responses without body.
+        """
+        buf = self.buffer
+        if self.header is None:
+            end = buf.find(b"\r\n", self.scanned)
+            if end == -1:
+                self.scanned = max(self.pos, len(buf) - 1)
+                return None
+            header = buf[self.pos:end].decode("utf-8", "replace")
+            try:
+                code = int(header[:3])
+            except ValueError:
+                code = 0
+            self.header = code, header
+            self.pos = end + 2
+            # Empty 200 body: the header line end is followed by an empty line
+            self.scanned = end if code == 200 else self.pos
+
+        code, header = self.header
+        if code == 200:
+            end = buf.find(b"\r\n\r\n", self.scanned)
+            if end == -1:
+                self.scanned = max(self.pos - 2, len(buf) - 3)
+                return None
+            body = buf[self.pos:end].decode("utf-8", "replace").replace("\r\n", "\n")
+            self.pos = end + 4
+        elif code in [201, 400]:
+            end = buf.find(b"\r\n", self.scanned)
+            if end == -1:
+                self.scanned = max(self.pos, len(buf) - 1)
+                return None
+            line = buf[self.pos:end]
+            if code == 400 and HEADER_RE.match(line):
+                body = None
+            else:
+                body = line.decode("utf-8", "replace")
+                self.pos = end + 2
+        else:
+            body = None
+        self.header = None
+        if self.pos == len(buf):
+            del buf[:]
+            self.pos = 0
+        self.scanned = self.pos
+        return code, header, body
+
+
 class CasparCG(object):
-    """CasparCG client object"""
+    """CasparCG client object
+
+    Thread safe. Commands passed to query_many() are pipelined:
+    they are sent at once and their responses are read in order.
+    """
     def __init__(self, host, port=5250, timeout=5):
         assert isinstance(port, int) and port <= 65535, "Invalid port number"
         self.host = host
         self.port = port
         self.timeout = timeout
-        self.connection = False
+        self.connection = None
+        self.framer = AmcpFramer()
+        self.lock = threading.RLock()
 
     def connect(self):
         """Create connection to CasparCG Server"""
-        try:
-            self.connection = telnetlib.Telnet(self.host, self.port, timeout=self.timeout)
-        except Exception:
-            log_traceback()
-            return False
-        return True
+        with self.lock:
+            self.close()
+            try:
+                self.connection = socket.create_connection((self.host, self.port), timeout=self.timeout)
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            except Exception:
+                log_traceback()
+                self.connection = None
+                return False
+            self.framer = AmcpFramer()
+            return True
+
+    def close(self):
+        with self.lock:
+            if self.connection:
+                try:
+                    self.connection.close()
+                except Exception:
+                    pass
+            self.connection = None
+
+    def read_response(self):
+        while True:
+            response = self.framer.next()
+            if response:
+                break
+            data = self.connection.recv(65536)
+            if not data:
+                raise ConnectionError("Connection closed by server")
+            self.framer.feed(data)
+
+        code, header, body = response
+        if code == 202:
+            return CasparResponse(202, "No result")
+        elif code in [200, 201]:
+            return CasparResponse(code, body)
+        elif code >= 400:
+            if body:
+                return CasparResponse(code, "{}: {}".format(header, body))
+            return CasparResponse(code, header)
+        return CasparResponse(500, "Unexpected result: {}".format(header))
 
     def query(self, query, **kwargs):
         """Send AMCP command"""
-        if not self.connection:
-            if not self.connect():
-                return CasparResponse(500, "Unable to connect CasparCG server")
+        return self.query_many([query], **kwargs)[0]
 
-        query = query.strip()
+    def query_many(self, queries, **kwargs):
+        """Send AMCP commands at once, returns list of their responses"""
+        queries = [query.strip() for query in queries]
         if kwargs.get("verbose", True):
-            if not query.startswith("INFO"):
-                logging.debug("Executing AMCP: {}".format(query))
-        query += "\r\n"
-
-        if PYTHON_VERSION >= 3:
-            query = bytes(query.encode("utf-8"))
-            delim = bytes("\r\n".encode("utf-8"))
-        else:
-            delim = "\r\n"
-
-        try:
-            self.connection.write(query)
-            result = self.connection.read_until(delim).strip()
-        except Exception:
-            log_traceback()
-            return CasparResponse(500, "Query failed")
-
-        if PYTHON_VERSION >= 3:
-            result = result.decode("UTF-8")
-
-        if not result:
-            return CasparResponse(500, "No result")
-
-        try:
-            if result[0:3] == "202":
-                return CasparResponse(202, "No result")
-
-            elif result[0:3] in ["201", "200"]:
-                stat = int(result[0:3])
-                result = decode_if_py3(self.connection.read_until(delim)).strip()
-                return CasparResponse(stat, result)
-
-            elif int(result[0:1]) > 3:
-                stat = int(result[0:3])
-                return CasparResponse(stat, result)
-        except Exception:
-            log_traceback()
-            return CasparResponse(500, "Malformed result: {}".format(result))
-        return CasparResponse(500, "Unexpected result: {}".format(result))
+            for query in queries:
+                if not query.startswith("INFO"):
+                    logging.debug("Executing AMCP: {}".format(query))
+        payload = "".join([query + "\r\n" for query in queries]).encode("utf-8")
+
+        with self.lock:
+            if not self.connection:
+                if not self.connect():
+                    return [CasparResponse(500, "Unable to connect CasparCG server") for query in queries]
+            try:
+                self.connection.sendall(payload)
+                return [self.read_response() for query in queries]
+            except Exception as e:
+                # Responses of the remaining commands would be out of sync
+                logging.error("CasparCG: query failed: {}".format(e))
+                self.close()
+                return [CasparResponse(500, "Query failed") for query in queries]
@@ -1,16 +1,22 @@
 __all__ = [
         "Logging",
+        "LogThrottle",
         "logging",
         "log_traceback",
         "critical_error",
-        "log_to_file"
+        "log_to_file",
+        "FileLogWriter"
     ]
 
 import os
 import sys
 import time
+import queue
+import atexit
+import _thread
+import threading
 import traceback
-import functools
+import collections
 
 from .common import PLATFORM
 from .text import indent
@@ -25,28 +31,270 @@ def null_handler(**kwargs):
     return True
 
 
-def log_to_file(log_path):
-    def log_to_file_handler(path, **kwargs):
-        placeholders = {
-            "date" : format_time(time.time(), "%Y-%m-%d")
+class FileLogWriter():
+    """
+    Log handler writing to a file from a background thread
+
+    Records are passed through a bounded queue. When the queue is full,
+    records are dropped and their number is written to the log later.
+    The writer thread keeps the file open and writes records in batches.
+    When a batch cannot be written, its records are counted as `failed`,
+    the error is reported to stderr (once until writing succeeds again)
+    and the file is reopened for the next batch.
+
+    `log_path` may contain a `{date}` placeholder (YYYY-MM-DD), a new file
+    is opened when the date changes. When `max_size` (bytes) is set, the
+    file is rotated to `.1` ... `.{backup_count}` suffixes when it grows
+    over the limit.
+    """
+    LABELS = {
+           DEBUG     : "DEBUG    ",
+           INFO      : "INFO     ",
+           WARNING   : "WARNING  ",
+           ERROR     : "ERROR    ",
+           GOOD_NEWS : "GOOD NEWS"
         }
-        path = path.format(**placeholders)
-        dirname, fname = os.path.split(path)
-        if not os.path.exists(dirname):
+
+    def __init__(self, log_path, max_size=None, backup_count=5, queue_size=4096, batch_size=256):
+        self.log_path = log_path
+        self.max_size = max_size
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.queue = queue.Queue(queue_size)
+        self.dropped = 0
+        self.reported_dropped = 0
+        self.failed = 0
+        self.reported_failed = 0
+        self.failing = False
+        self.path = None
+        self.file = None
+        self.thread = threading.Thread(target=self.writer, daemon=True)
+        self.thread.start()
+        atexit.register(self.close)
+
+    def __call__(self, **kwargs):
+        try:
+            self.queue.put_nowait((time.time(), kwargs["message_type"], kwargs["message"]))
+        except queue.Full:
+            self.dropped += 1
+        return True
+
+    def open(self, tstamp):
+        path = self.log_path.format(date=format_time(tstamp, "%Y-%m-%d"))
+        if path == self.path:
+            return
+        self.close_file()
+        dirname = os.path.dirname(path)
+        if dirname and not os.path.exists(dirname):
             os.makedirs(dirname)
+        self.file = open(path, "a")
+        self.path = path
+
+    def close_file(self):
+        """Closes the file. The next batch opens it again."""
+        if self.file:
+            try:
+                self.file.close()
+            except Exception:
+                pass
+        self.file = None
+        self.path = None
+
+    def rotate(self):
+        path = self.path
+        self.close_file()
+        for i in range(self.backup_count - 1, 0, -1):
+            if os.path.exists("{}.{}".format(path, i)):
+                os.replace("{}.{}".format(path, i), "{}.{}".format(path, i + 1))
+        if self.backup_count:
+            os.replace(path, path + ".1")
+        else:
+            os.remove(path)
+        self.file = open(path, "a")
+        self.path = path
+
+    def write(self, records):
+        self.open(records[-1][0])
+        lines = []
+        dropped = self.dropped
+        if dropped != self.reported_dropped:
+            lines.append("{}  {}  {} log records dropped\n".format(
+                format_time(time.time()),
+                self.LABELS[WARNING],
+                dropped - self.reported_dropped
+            ))
+            self.reported_dropped = dropped
+        failed = self.failed
+        if failed != self.reported_failed:
+            lines.append("{}  {}  {} log records could not be written\n".format(
+                format_time(time.time()),
+                self.LABELS[WARNING],
+                failed - self.reported_failed
+            ))
+        for tstamp, message_type, message in records:
+            lines.append("{}  {}  {}\n".format(format_time(tstamp), self.LABELS[message_type], message))
+        self.file.write("".join(lines))
+        self.file.flush()
+        self.reported_failed = failed
+        if self.max_size and self.file.tell() > self.max_size:
+            self.rotate()
+
+    def writer(self):
+        while True:
+            records = [self.queue.get()]
+            while len(records) < self.batch_size:
+                try:
+                    records.append(self.queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = None in records
+            if stop:
+                records = records[:records.index(None)]
+            if records:
+                try:
+                    self.write(records)
+                except Exception as e:
+                    self.failed += len(records)
+                    self.close_file()
+                    if not self.failing:
+                        self.failing = True
+                        sys.stderr.write("Unable to write log file {}: {}\n".format(self.log_path, e))
+                else:
+                    self.failing = False
+            if stop:
+                break
+
+    def close(self, timeout=2):
+        """Writes pending records and closes the file"""
+        if not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self.thread.join(timeout)
+        if self.file:
+            self.file.close()
+
+
+def log_to_file(log_path, **kwargs):
+    """
+    Returns a FileLogWriter handler. See FileLogWriter for arguments.
+    """
+    return FileLogWriter(log_path, **kwargs)
+
+
+# Throttling
+
+class LogThrottle():
+    """
+    Aggregates repeated log messages
+
+    The first message of a key is logged, further messages of the same key
+    are only counted and summarized once per `window` seconds. A key which
+    was quiet for a whole window is forgotten, so its next message is
+    logged again.
+
+    Callers only update a counter or append to a deque: messages are
+    formatted and written by a background thread, so logging never blocks
+    the caller. Counts are approximate: concurrent increments of one key
+    may be lost, and repeats racing with a summary which forgets their
+    key are not reported. Errors of the background thread are written to
+    stderr, once until writing succeeds again.
+    """
+    def __init__(self, logger, window=5, tick=.5):
+        self.logger = logger
+        self.window = window
+        self.tick = tick
+        self.entries = {}
+        self.reported = {}
+        self.pending = collections.deque()
+        self.running = False
+        self.lock = threading.Lock()
+        self.failing = False
 
-        with open(path, "a") as f:
-            tstamp = format_time(time.time())
-            ltype = {
-                   0 : "DEBUG    ",
-                   1 : "INFO     ",
-                   2 : "WARNING  ",
-                   3 : "ERROR    ",
-                   4 : "GOOD NEWS"
-                }[kwargs["message_type"]]
-            f.write("{}  {}  {}\n".format(tstamp, ltype, kwargs["message"]))
+    def start(self):
+        if self.running:
+            return
+        with self.lock:
+            if self.running:
+                return
+            self.running = True
+        _thread.start_new_thread(self.flusher, ())
 
-    return functools.partial(log_to_file_handler, log_path)
+    def log(self, msgtype, key, *args):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = [1, msgtype, args]
+            self.pending.append((msgtype, args))
+            self.start()
+            return
+        entry[0] += 1
+        entry[2] = args
+
+    def debug(self, key, *args):
+        self.log(DEBUG, key, *args)
+
+    def info(self, key, *args):
+        self.log(INFO, key, *args)
+
+    def warning(self, key, *args):
+        self.log(WARNING, key, *args)
+
+    def error(self, key, *args):
+        self.log(ERROR, key, *args)
+
+    def flush(self):
+        """Writes first messages of new keys"""
+        while self.pending:
+            msgtype, args = self.pending.popleft()
+            self.logger._send(msgtype, *args)
+
+    def summarize(self):
+        """Writes number of repeated messages since the last summary.
+
+        Quiet keys are forgotten by replacing the entries dict with a new
+        one, so it is never modified in place while callers use it.
+        """
+        entries = self.entries
+        items = list(entries.items())
+        active = {}
+        for key, entry in items:
+            count, msgtype, args = entry
+            last = self.reported.get(key, 1)
+            if count > last:
+                self.logger._send(
+                        msgtype,
+                        *args,
+                        "(repeated {} times in last {}s)".format(count - last, self.window)
+                    )
+                self.reported[key] = count
+                active[key] = entry
+            else:
+                self.reported.pop(key, None)
+        self.entries = active
+        # Keep keys added while summarizing
+        if len(entries) != len(items):
+            summarized = set(key for key, entry in items)
+            for key, entry in list(entries.items()):
+                if key not in summarized:
+                    active.setdefault(key, entry)
+
+    def flusher(self):
+        summarized = time.time()
+        while True:
+            time.sleep(self.tick)
+            try:
+                self.flush()
+                if time.time() - summarized >= self.window:
+                    summarized = time.time()
+                    self.summarize()
+            except Exception as e:
+                if not self.failing:
+                    self.failing = True
+                    sys.stderr.write("Unable to write throttled log messages: {!r}\n".format(e))
+            else:
+                self.failing = False
 
 
 # Logging
@@ -61,6 +309,7 @@ class Logging():
         self.user = user
         self.handlers = []
         self.file = sys.stderr
+        self.throttle = LogThrottle(self)
         self.formats = {
             INFO      : "{2}INFO       {0} {1}",
             DEBUG     : "{2}\033[34mDEBUG      {0} {1}\033[0m",
@@ -0,0 +1,334 @@
+#!/usr/bin/env python3
+
+"""Synthetic CasparCG OSC load generator.
+
+Sends OSC traffic resembling a CasparCG server playing clips on every
+layer of every channel: per layer file time, producer and profiler
+messages, per channel frame rate, consume time, channel profiler and
+audio levels. Every 1/--drops channel frames, one layer reports a
+dropped frame (layer profiler time over the frame duration).
+
+With --metrics, exporter counters are read before and after the run to
+check that every datagram and every injected drop was received. With
+--search, the send rate is raised step by step until the exporter
+stops keeping up, and the highest sustainable rate is reported.
+
+Examples:
+    ./osc-generator.py --channels 4 --layers 20 --fps 50 --duration 10
+    ./osc-generator.py --protocol 2.0.7 --metrics http://localhost:9731/metrics --search
+"""
+
+import sys
+import json
+import time
+import random
+import argparse
+import fractions
+import urllib.request
+
+from nxtools import *
+
+from promexp.common import settings
+from pythonosc import osc_message_builder
+from pythonosc import osc_bundle_builder
+from pythonosc import udp_client
+
+CLIP = "AMB_BROADCAST_PROMO_1080I50.mov"
+CLIP_DURATION = 3600.0
+
+try:
+    with open("settings.json") as f:
+        settings.update(json.load(f))
+except:
+    pass
+
+
+def message(address, *args):
+    builder = osc_message_builder.OscMessageBuilder(address=address)
+    for arg in args:
+        builder.add_arg(arg)
+    return builder.build()
+
+
+def layer_messages(protocol, id_channel, id_layer, position, frame_duration, dropped):
+    prefix = "/channel/{}/stage/layer/{}/".format(id_channel, id_layer)
+    expected = frame_duration
+    real = frame_duration * (1.5 if dropped else random.uniform(0.2, 0.6))
+    if protocol == "2.0.7":
+        return [
+                message(prefix + "file/time", position, CLIP_DURATION),
+                message(prefix + "file/frame", int(position / frame_duration), int(CLIP_DURATION / frame_duration)),
+                message(prefix + "file/fps", 1 / frame_duration),
+                message(prefix + "file/path", CLIP),
+                message(prefix + "paused", False),
+                message(prefix + "producer", "ffmpeg"),
+                message(prefix + "profiler/time", real, expected),
+            ]
+    # 2.1 and 2.2 share the layer layout
+    return [
+            message(prefix + "foreground/file/time", position, CLIP_DURATION),
+            message(prefix + "foreground/file/name", CLIP),
+            message(prefix + "foreground/file/path", CLIP),
+            message(prefix + "foreground/file/fps", 1 / frame_duration),
+            message(prefix + "foreground/paused", False),
+            message(prefix + "foreground/producer", "ffmpeg"),
+            message(prefix + "background/producer", "empty"),
+            message(prefix + "profiler/time", real, expected),
+        ]
+
+
+def channel_messages(id_channel, framerate, frame_duration, dropped, audio_channels=8):
+    prefix = "/channel/{}/".format(id_channel)
+    consume_time = frame_duration * (1.2 if dropped else random.uniform(0.3, 0.7))
+    result = [
+            message(prefix + "framerate", framerate.numerator, framerate.denominator),
+            message(prefix + "output/consume_time", consume_time),
+            message(prefix + "profiler/time", frame_duration * random.uniform(0.2, 0.6), frame_duration),
+            message(prefix + "mixer/audio/nb_channels", audio_channels),
+        ]
+    for id_audio in range(1, audio_channels + 1):
+        level = random.uniform(0.05, 0.5)
+        result.append(message(prefix + "mixer/audio/{}/pFS".format(id_audio), level))
+        result.append(message(prefix + "mixer/audio/{}/dBFS".format(id_audio), -20.0))
+    return result
+
+
+def bundle(messages, max_size):
+    """Returns list of bundles containing the messages, each at most max_size bytes"""
+    result = []
+    builder = None
+    size = 0
+    for msg in messages:
+        if builder is None or size + 4 + msg.size > max_size:
+            if builder is not None:
+                result.append(builder.build())
+            builder = osc_bundle_builder.OscBundleBuilder(osc_bundle_builder.IMMEDIATELY)
+            size = 16
+        builder.add_content(msg)
+        size += 4 + msg.size
+    result.append(builder.build())
+    return result
+
+
+class Frame(object):
+    __slots__ = ["bundles", "messages", "drops"]
+
+    def __init__(self, bundles, messages, drops):
+        self.bundles = bundles
+        self.messages = messages
+        self.drops = drops
+
+
+def build_frames(args):
+    """Returns a cycle of Frames (one second of traffic) of all channels"""
+    framerate = fractions.Fraction(args.fps).limit_denominator(1001)
+    frame_duration = float(1 / framerate)
+    drop_interval = int(round(1 / args.drops)) if args.drops > 0 else 0
+    channel_frames = 0
+    frames = []
+    for id_frame in range(max(1, int(round(args.fps)))):
+        position = id_frame * frame_duration
+        bundles = []
+        messages = 0
+        drops = 0
+        for id_channel in range(1, args.channels + 1):
+            channel_frames += 1
+            dropped_layer = None
+            if drop_interval and channel_frames % drop_interval == 0:
+                dropped_layer = random.randint(1, args.layers)
+            channel = []
+            for id_layer in range(1, args.layers + 1):
+                channel.extend(layer_messages(
+                        args.protocol,
+                        id_channel,
+                        id_layer,
+                        position,
+                        frame_duration,
+                        id_layer == dropped_layer
+                    ))
+            channel.extend(channel_messages(id_channel, framerate, frame_duration, dropped_layer is not None))
+            bundles.extend(bundle(channel, args.max_size))
+            messages += len(channel)
+            drops += dropped_layer is not None
+        frames.append(Frame(bundles, messages, drops))
+    return frames
+
+
+class RunStats(object):
+    def __init__(self):
+        self.frames = 0
+        self.datagrams = 0
+        self.messages = 0
+        self.bytes = 0
+        self.drops = 0
+        self.send_errors = 0
+        self.lag = 0
+        self.elapsed = 0
+
+
+def run(client, frames, fps, duration):
+    """Sends frames at `fps` frames per second for `duration` seconds"""
+    stats = RunStats()
+    start_time = time.perf_counter()
+    id_frame = 0
+    while True:
+        deadline = start_time + id_frame / fps
+        now = time.perf_counter()
+        if now - start_time >= duration:
+            break
+        if deadline > now:
+            time.sleep(deadline - now)
+        else:
+            stats.lag = max(stats.lag, now - deadline)
+        frame = frames[id_frame % len(frames)]
+        for content in frame.bundles:
+            try:
+                client.send(content)
+            except OSError:
+                stats.send_errors += 1
+                continue
+            stats.datagrams += 1
+            stats.bytes += content.size
+        stats.messages += frame.messages
+        stats.drops += frame.drops
+        stats.frames += 1
+        id_frame += 1
+    stats.elapsed = time.perf_counter() - start_time
+    return stats
+
+
+def read_counters(url, osc_port):
+    """Returns exporter counters relevant to OSC ingest"""
+    prefix = settings["prefix"] + "_" if settings.get("prefix") else ""
+    result = {"received" : 0, "dropped" : 0, "rcvbuf_errors" : 0, "casparcg_dropped" : 0}
+    port_label = 'osc_port="{}"'.format(osc_port)
+    with urllib.request.urlopen(url, timeout=10) as response:
+        for line in response.read().decode("utf-8").split("\n"):
+            if not line or line.startswith("#"):
+                continue
+            name, _, value = line.rpartition(" ")
+            if name.startswith(prefix + "osc_received_total{") and port_label in name:
+                result["received"] += float(value)
+            elif name.startswith(prefix + "osc_dropped_total{") and port_label in name:
+                result["dropped"] += float(value)
+            elif name.startswith(prefix + "udp_rcvbuf_errors_total"):
+                result["rcvbuf_errors"] += float(value)
+            elif name.startswith(prefix + "casparcg_dropped_total{"):
+                result["casparcg_dropped"] += float(value)
+    return result
+
+
+def measure_step(args, client, frames, fps):
+    """Runs one step. Returns (RunStats, exporter counter deltas or None)"""
+    before = read_counters(args.metrics, args.port) if args.metrics else None
+    stats = run(client, frames, fps, args.duration)
+    if not args.metrics:
+        return stats, None
+    time.sleep(args.settle)
+    after = read_counters(args.metrics, args.port)
+    return stats, {key : after[key] - before[key] for key in after}
+
+
+def generator_failed(stats, fps):
+    """Returns True if the generator itself could not send at the requested rate"""
+    return bool(stats.send_errors) or stats.frames < 0.98 * fps * stats.elapsed
+
+
+def exporter_failed(stats, delta):
+    """Returns True if the exporter lost datagrams or drops"""
+    if delta is None:
+        return False
+    return (
+            delta["received"] < stats.datagrams
+            or delta["dropped"] > 0
+            or delta["rcvbuf_errors"] > 0
+            or delta["casparcg_dropped"] < stats.drops
+        )
+
+
+def report(stats, delta, fps):
+    line = "{:>8.1f}  {:>10.0f}  {:>12.0f}  {:>8}  {:>8.1f}".format(
+            fps,
+            stats.datagrams / stats.elapsed,
+            stats.messages / stats.elapsed,
+            stats.drops,
+            1000 * stats.lag
+        )
+    if delta is not None:
+        line += "  {:>10.0f}  {:>8.0f}  {:>8.0f}  {:>8.0f}".format(
+                delta["received"],
+                delta["dropped"],
+                delta["rcvbuf_errors"],
+                delta["casparcg_dropped"]
+            )
+    if exporter_failed(stats, delta):
+        line += "  overloaded"
+    elif generator_failed(stats, fps):
+        line += "  generator limit"
+    print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic CasparCG OSC load generator")
+    parser.add_argument("--host", default="127.0.0.1", help="exporter address")
+    parser.add_argument("--port", type=int, default=settings["osc_port"], help="exporter OSC port")
+    parser.add_argument("--protocol", choices=["2.0.7", "2.1", "2.2"], default="2.2")
+    parser.add_argument("--channels", type=int, default=4)
+    parser.add_argument("--layers", type=int, default=20)
+    parser.add_argument("--fps", type=float, default=50)
+    parser.add_argument("--drops", type=float, default=0.01, help="fraction of channel frames with a dropped frame")
+    parser.add_argument("--max-size", type=int, default=8192, help="maximum bundle size in bytes")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per run or search step")
+    parser.add_argument("--metrics", help="exporter /metrics URL used to verify received counters")
+    parser.add_argument("--settle", type=float, default=3, help="seconds to wait for exporter counters after a run")
+    parser.add_argument("--search", action="store_true", help="raise the rate by --step until the exporter is overloaded")
+    parser.add_argument("--step", type=float, default=1.5)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    frames = build_frames(args)
+    client = udp_client.UDPClient(args.host, args.port)
+    logging.info("Sending CasparCG {} OSC to {}:{}: {} channels, {} layers, {} datagrams and {} messages per frame".format(
+            args.protocol,
+            args.host,
+            args.port,
+            args.channels,
+            args.layers,
+            len(frames[0].bundles),
+            frames[0].messages
+        ))
+
+    header = "{:>8}  {:>10}  {:>12}  {:>8}  {:>8}".format("fps", "dgrams/s", "messages/s", "drops", "lag [ms]")
+    if args.metrics:
+        header += "  {:>10}  {:>8}  {:>8}  {:>8}".format("received", "dropped", "rcvbuf", "detected")
+    print(header)
+
+    fps = args.fps
+    best = None
+    while True:
+        stats, delta = measure_step(args, client, frames, fps)
+        report(stats, delta, fps)
+        if exporter_failed(stats, delta):
+            break
+        best = stats
+        if generator_failed(stats, fps):
+            if args.search:
+                logging.warning("The generator cannot send faster, the exporter was not overloaded")
+            break
+        if not args.search:
+            break
+        fps *= args.step
+
+    if args.search:
+        if best is None:
+            logging.error("The exporter is overloaded already at {} fps".format(args.fps))
+            sys.exit(1)
+        logging.goodnews("Maximum sustainable rate: {:.0f} messages/s ({:.0f} datagrams/s)".format(
+                best.messages / best.elapsed,
+                best.datagrams / best.elapsed
+            ))
+
+
+if __name__ == '__main__':
+    main()
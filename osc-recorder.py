@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+"""Records CasparCG OSC traffic and replays it through the exporter handlers.
+
+Usage:
+    ./osc-recorder.py record FILE [SECONDS]
+    ./osc-recorder.py replay FILE [--realtime] [--no-profile]
+
+`record` listens on `osc_port` (the exporter must not be running)
+until interrupted or for the given number of seconds.
+
+`replay` feeds the recorded datagrams to CasparMetricsProvider handlers
+(one provider per recorded source address) as fast as possible, or with
+the recorded timing when --realtime is given, and reports the ingest
+rate. Then the recording is replayed once more with instrumented
+handlers to report CPU time and net allocated memory blocks
+(sys.getallocatedblocks) per handler.
+"""
+
+import os
+import sys
+import json
+import time
+import socket
+
+from nxtools import *
+
+from promexp.common import settings
+from promexp.caspar import CasparMetricsProvider, OscDemux
+from promexp.recording import OscRecordWriter, read_recording
+from pythonosc import osc_packet
+
+HANDLERS = [
+        "parse_stage",
+        "parse_framerate",
+        "parse_volume",
+        "parse_consume_time",
+        "parse_channel_profiler",
+        "parse_null",
+    ]
+
+try:
+    with open("settings.json") as f:
+        settings.update(json.load(f))
+except:
+    pass
+
+
+def record(path, duration=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if settings.get("osc_rcvbuf"):
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, settings["osc_rcvbuf"])
+    sock.bind(("0.0.0.0", settings["osc_port"]))
+    sock.settimeout(1)
+
+    start_time = time.time()
+    writer = OscRecordWriter(path, start_time)
+    logging.info("Recording OSC from port {} to {}".format(settings["osc_port"], path))
+    try:
+        while duration is None or time.time() - start_time < duration:
+            try:
+                data, client_address = sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            writer.write(data, client_address, time.time())
+    except KeyboardInterrupt:
+        print()
+    finally:
+        writer.close()
+        sock.close()
+    logging.goodnews("Recorded {} datagrams ({} bytes) in {:.1f}s".format(
+            writer.count,
+            writer.size,
+            time.time() - start_time
+        ))
+
+
+class HandlerProfile(object):
+    __slots__ = ["calls", "cpu_time", "blocks"]
+
+    def __init__(self):
+        self.calls = 0
+        self.cpu_time = 0
+        self.blocks = 0
+
+
+def profiled(handler, profile):
+    def wrapper(*args):
+        blocks = sys.getallocatedblocks()
+        start_time = time.thread_time_ns()
+        handler(*args)
+        profile.cpu_time += time.thread_time_ns() - start_time
+        profile.blocks += sys.getallocatedblocks() - blocks
+        profile.calls += 1
+    return wrapper
+
+
+def create_demux(sources, profiles=None):
+    """Returns OscDemux with one provider per source address"""
+    demux = OscDemux()
+    for source in sources:
+        provider = CasparMetricsProvider(dict(settings, caspar_host=None))
+        provider.address = source
+        if profiles is not None:
+            for name in HANDLERS:
+                profile = profiles.setdefault(name, HandlerProfile())
+                setattr(provider, name, profiled(getattr(provider, name), profile))
+        demux.add(provider, [source])
+    return demux
+
+
+def replay(records, demux, realtime=False):
+    """Returns (wall time, CPU time, maximum lag behind the recorded timing)"""
+    lag = 0
+    first_ts = records[0][0]
+    start_time = time.perf_counter()
+    start_cpu = time.thread_time()
+    for ts, client_address, data in records:
+        if realtime:
+            delay = ts - first_ts - (time.perf_counter() - start_time)
+            if delay > 0:
+                time.sleep(delay)
+            else:
+                lag = max(lag, -delay)
+        demux.call_handlers_for_packet(data, client_address)
+    return time.perf_counter() - start_time, time.thread_time() - start_cpu, lag
+
+
+def profile_overhead(count=10000):
+    """Returns (cpu_time, blocks) the profiling wrapper itself adds per call"""
+    profile = HandlerProfile()
+    wrapper = profiled(lambda *args: None, profile)
+    for i in range(count):
+        wrapper("/channel/1/framerate", 50, 1)
+    return profile.cpu_time / count, profile.blocks / count
+
+
+def main(path, realtime=False, profile=True):
+    records = list(read_recording(path))
+    if not records:
+        critical_error("{} contains no datagrams".format(path))
+    messages = 0
+    for ts, client_address, data in records:
+        try:
+            messages += len(osc_packet.OscPacket(data).messages)
+        except osc_packet.ParseError:
+            pass
+    sources = sorted(set(client_address[0] for ts, client_address, data in records))
+    logging.info("Replaying {} datagrams ({} messages) from {} recorded over {:.1f}s".format(
+            len(records),
+            messages,
+            ", ".join(sources),
+            records[-1][0] - records[0][0]
+        ))
+
+    logging.file = open(os.devnull, "w")
+    try:
+        elapsed, cpu_time, lag = replay(records, create_demux(sources), realtime)
+    finally:
+        logging.file = sys.stderr
+    print("{:<16}  {:>12}".format("mode", "realtime" if realtime else "fast"))
+    print("{:<16}  {:>12.0f}".format("datagrams/s", len(records) / elapsed))
+    print("{:<16}  {:>12.0f}".format("messages/s", messages / elapsed))
+    print("{:<16}  {:>12.1f}".format("CPU [%]", 100 * cpu_time / elapsed))
+    if realtime:
+        print("{:<16}  {:>12.1f}".format("max lag [ms]", 1000 * lag))
+    if not profile:
+        return
+
+    profiles = {}
+    overhead_time, overhead_blocks = profile_overhead()
+    logging.file = open(os.devnull, "w")
+    try:
+        replay(records, create_demux(sources, profiles))
+    finally:
+        logging.file = sys.stderr
+
+    print()
+    print("{:<24}  {:>10}  {:>10}  {:>10}  {:>16}".format("handler", "calls", "CPU [ms]", "us/call", "net blocks/call"))
+    handlers_time = 0
+    for name, handler_profile in sorted(profiles.items(), key=lambda item: -item[1].cpu_time):
+        if not handler_profile.calls:
+            continue
+        handler_time = max(0, handler_profile.cpu_time - overhead_time * handler_profile.calls) / 1e9
+        handlers_time += handler_time
+        print("{:<24}  {:>10}  {:>10.1f}  {:>10.2f}  {:>16.2f}".format(
+                name,
+                handler_profile.calls,
+                1000 * handler_time,
+                1000000 * handler_time / handler_profile.calls,
+                handler_profile.blocks / handler_profile.calls - overhead_blocks
+            ))
+    print("{:<24}  {:>10}  {:>10.1f}".format("parsing and dispatch", "", 1000 * max(0, cpu_time - handlers_time)))
+
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    if len(args) < 2 or args[0] not in ["record", "replay"]:
+        print(__doc__)
+        sys.exit(1)
+    if args[0] == "record":
+        record(args[1], float(args[2]) if len(args) > 2 else None)
+    else:
+        main(args[1], realtime="--realtime" in sys.argv, profile="--no-profile" not in sys.argv)
@@ -1,5 +1,7 @@
 import time
 import psutil
+import functools
+import threading
 
 from nxtools import *
 
@@ -7,115 +9,221 @@ from .common import *
 from .disk import DiskMetricsProvider
 from .network import NetworkMetricsProvider
 from .gpu import GpuMetricsProvider
-from .caspar import CasparMetricsProvider
-
-
-def render_metric(name, value, **tags):
-    result = ""
-    if settings.get("prefix"):
-        result+=str(settings["prefix"])+"_"
-    tags["hostname"] = settings.get("hostname") or HOSTNAME
-    tags.update(settings["tags"])
-    result += name + "{"
-    result += ", ".join(["{}=\"{}\"".format(k, tags[k]) for k in tags ])
-    result += "}"
-    result += " " + str(value) + "\n"
-    return result
-
-
+from .caspar import CasparMonitor
+from .collector import Collector
+from .registry import MetricRegistry
+from .response import ResponseCache
 
 
 class Metrics():
-    def __init__(self):
+    def __init__(self, threaded=True):
+        """With threaded=False, collection and CasparCG monitoring are not started.
+        They are driven by an event loop instead (see promexp.aio)."""
         logging.info("Loading GPU metrics provider")
         self.gpu_provider = GpuMetricsProvider(settings)
         logging.info("Loading disk metrics provider")
         self.disk_provider = DiskMetricsProvider(settings)
         logging.info("Loading CasparCG metrics provider")
-        self.caspar_provider = CasparMetricsProvider(settings)
+        self.caspar_monitor = CasparMonitor(settings, threaded)
         self.network_metrics = NetworkMetricsProvider(settings)
-
-        self.mem = None
-        self.swp = None
-        self.cpu = None
-        self.gpu = None
-        self.diskio = [0,0]
-        self.last_update = 0
-
-    def update(self):
-        self.mem = psutil.virtual_memory()
-        self.swp = psutil.swap_memory()
-        self.cpu = psutil.cpu_percent()
-        self.gpu = self.gpu_provider()
-        self.diskio = psutil.disk_io_counters()
+        self.registry = MetricRegistry(settings)
+        self.lock = threading.Lock()
+        self.response_cache = ResponseCache(self, lambda: self.collector.generation)
+
+        self.collector = Collector(settings.get("collector_workers") or 4)
+        self.add_job("system", self.collect_system)
+        self.add_job("gpu", self.gpu_provider)
+        self.add_job("network", self.network_metrics)
+        for disk in self.disk_provider.disks:
+            self.add_job(
+                    "disk:" + disk["mountpoint"],
+                    functools.partial(self.disk_provider.get_usage, disk),
+                    "disk"
+                )
+        for provider in self.caspar_monitor.providers:
+            self.add_job(self.caspar_job_name(provider), provider.collect, "caspar", blocking=False)
+        if self.caspar_monitor.providers:
+            self.add_job("caspar_osc", self.caspar_monitor.collect, "caspar", blocking=False)
+        if self.caspar_monitor.state:
+            self.add_job("state", self.caspar_monitor.save)
+        if threaded:
+            self.collector.start()
+
+    def add_job(self, name, func, kind=None, blocking=True):
+        kind = kind or name
+        interval = (settings.get("intervals") or {}).get(kind, 2)
+        timeout = (settings.get("timeouts") or {}).get(kind, 5)
+        self.collector.add(name, func, interval, timeout, blocking, kind)
+
+    def caspar_job_name(self, provider):
+        return "caspar:{}:{}".format(provider.address, provider.port)
+
+    def collect_system(self):
+        return {
+                "mem" : psutil.virtual_memory(),
+                "cpu" : psutil.cpu_percent(),
+                "diskio" : psutil.disk_io_counters(),
+            }
 
     def __call__(self):
-        if time.time() - self.last_update > 2:
-            self.update()
-            self.last_update = time.time()
-
-        result = ""
-        result += render_metric("uptime_seconds", time.time() - BOOT_TIME)
-        result += render_metric("cpu_usage", self.cpu)
-        result += render_metric("memory_bytes_total", self.mem.total)
-        result += render_metric("memory_bytes_free", self.mem.available)
-        result += render_metric("memory_usage", 100*((self.mem.total-self.mem.available)/self.mem.total))
-        result += render_metric("disk_read_bytes", self.diskio.read_bytes)
-        result += render_metric("disk_write_bytes", self.diskio.write_bytes)
+        with self.lock:
+            return self.render()
+
+    def response(self):
+        """Returns a CachedResponse of the current snapshot generation"""
+        return self.response_cache.get()
+
+    def render(self):
+        snapshot = self.collector.snapshot
+        collected_at = self.collector.collected_at
+
+        registry = self.registry
+        registry.begin()
+        registry.add("uptime_seconds", time.time() - BOOT_TIME)
+
+        for provider in collected_at:
+            registry.add("collector_collected_at_seconds", collected_at[provider], provider=provider)
+
+        flight = self.response_cache.flight
+        registry.add("scrape_renders_total", flight.fresh, result="fresh")
+        registry.add("scrape_renders_total", flight.coalesced, result="coalesced")
+        registry.add("scrape_renders_total", self.response_cache.cached, result="cached")
+
+        status = self.collector.status
+        for provider in status:
+            up, timeout = status[provider]
+            registry.add("collector_up", up, provider=provider)
+            registry.add("collector_timeout", timeout, provider=provider)
+
+        system = snapshot.get("system")
+        if system:
+            mem = system["mem"]
+            registry.add("cpu_usage", system["cpu"])
+            registry.add("memory_bytes_total", mem.total)
+            registry.add("memory_bytes_free", mem.available)
+            registry.add("memory_usage", 100*((mem.total-mem.available)/mem.total))
+            if system["diskio"]:
+                registry.add("disk_read_bytes", system["diskio"].read_bytes)
+                registry.add("disk_write_bytes", system["diskio"].write_bytes)
 
         #
         # Disk usage
         #
 
-        for disk in self.disk_provider():
+        for mountpoint in self.disk_provider.disks:
+            disk = snapshot.get("disk:" + mountpoint["mountpoint"])
+            if not disk:
+                continue
             tags = {
                     "mountpoint" : disk["mountpoint"].replace("\\", "/"),
                     "fstype" : disk["fstype"],
                 }
-            result += render_metric("disk_bytes_total", disk["total"] , **tags)
-            result += render_metric("disk_bytes_free", disk["free"], **tags)
-            result += render_metric("disk_usage", disk["usage"], **tags)
+            registry.add("disk_bytes_total", disk["total"] , **tags)
+            registry.add("disk_bytes_free", disk["free"], **tags)
+            registry.add("disk_usage", disk["usage"], **tags)
 
         # Network
 
-        for interface in self.network_metrics():
-            result += render_metric("network_sent_bytes_total", interface["sent"], interface=interface["iface"] )
-            result += render_metric("network_recv_bytes_total", interface["recv"], interface=interface["iface"] )
+        for interface in snapshot.get("network") or []:
+            registry.add("network_sent_bytes_total", interface["sent"], interface=interface["iface"] )
+            registry.add("network_recv_bytes_total", interface["recv"], interface=interface["iface"] )
 
         #
         # NVIDIA GPU
         #
 
-        for i, gpu in enumerate(self.gpu):
+        for i, gpu in enumerate(snapshot.get("gpu") or []):
             metrics = gpu["utilization"]
             for key in metrics:
                 value = metrics[key]
                 if key == "gpu":
                     key = "usage"
-                result += render_metric("gpu_{}".format(key), value, gpu_id=i)
+                registry.add("gpu_{}".format(key), value, gpu_id=i)
+            if "memory" in gpu:
+                registry.add("gpu_memory_used_bytes", gpu["memory"]["used"], gpu_id=i)
+                registry.add("gpu_memory_total_bytes", gpu["memory"]["total"], gpu_id=i)
+            if "temperature" in gpu:
+                registry.add("gpu_temperature_celsius", gpu["temperature"], gpu_id=i)
+            if "power" in gpu:
+                registry.add("gpu_power_watts", gpu["power"], gpu_id=i)
+            for clock, value in gpu.get("clocks", {}).items():
+                registry.add("gpu_clock_mhz", value, gpu_id=i, clock=clock)
+            if "encoder_sessions" in gpu:
+                registry.add("gpu_encoder_sessions", gpu["encoder_sessions"], gpu_id=i)
 
         #
         # CasparCG
         #
 
-        if self.caspar_provider.address:
-            result += render_metric(
-                    "casparcg_idle_seconds",
-                    time.time() - self.caspar_provider.last_osc_ts,
-                    casparcg_host=self.caspar_provider.address,
-                    casparcg_version=self.caspar_provider.protocol,
-                )
+        for provider in self.caspar_monitor.providers:
+            caspar = snapshot.get(self.caspar_job_name(provider))
+            if caspar:
+                self.render_caspar(registry, provider, caspar)
+
+        caspar_osc = snapshot.get("caspar_osc")
+        if caspar_osc:
+            for osc_port, counters in caspar_osc["osc"].items():
+                for key, value in counters.items():
+                    registry.add("osc_{}_total".format(key), value, osc_port=osc_port)
+            if caspar_osc["rcvbuf_errors"] is not None:
+                registry.add("udp_rcvbuf_errors_total", caspar_osc["rcvbuf_errors"])
+
+        return registry.finish()
+
+    def render_caspar(self, registry, provider, caspar):
+        registry.add(
+                "casparcg_idle_seconds",
+                time.time() - caspar["last_osc_ts"],
+                casparcg_host=provider.address,
+                casparcg_version=provider.protocol,
+            )
+
+        for key, value in caspar["osc"].items():
+            registry.add("casparcg_osc_{}_total".format(key), value, casparcg_host=provider.address)
+
+        for (id_channel, id_audio), values in caspar["peak_volume"].items():
+            tags = {
+                    "casparcg_host" : provider.address,
+                    "casparcg_version" : provider.protocol,
+                    "channel" : id_channel,
+                    "audio_channel" : id_audio,
+                }
+            for window, (value_max, value_min, value_mean) in values.items():
+                tags["window"] = "{:g}s".format(window)
+                registry.add("casparcg_peak_volume", value_max, **tags)
+                registry.add("casparcg_peak_volume_min", value_min, **tags)
+                registry.add("casparcg_peak_volume_mean", value_mean, **tags)
 
-            for id_channel in self.caspar_provider.fps:
-                tags = {
-                        "casparcg_host" : self.caspar_provider.address,
-                        "casparcg_version" : self.caspar_provider.protocol,
-                        "channel" : id_channel,
-                    }
-                result += render_metric("casparcg_peak_volume", self.caspar_provider.get_peak_volume(id_channel), **tags)
-                for id_layer in self.caspar_provider.profiler.get(id_channel, {}):
-                    value = self.caspar_provider.profiler[id_channel][id_layer]
-                    tags["layer"] = id_layer
-                    result += render_metric("casparcg_dropped_total", value, **tags)
-
-        return result
+        for id_channel in caspar["dropped"]:
+            tags = {
+                    "casparcg_host" : provider.address,
+                    "casparcg_version" : provider.protocol,
+                    "channel" : id_channel,
+                }
+            for id_layer in caspar["dropped"][id_channel]:
+                value = caspar["dropped"][id_channel][id_layer]
+                tags["layer"] = id_layer
+                registry.add("casparcg_dropped_total", value, **tags)
+                created = caspar["dropped_created"].get((id_channel, id_layer))
+                if created:
+                    registry.add("casparcg_dropped_created", created, **tags)
+
+        buckets = caspar["frame_time_buckets"]
+        for id_channel, (counts, total) in caspar["consume_time"].items():
+            tags = {
+                    "casparcg_host" : provider.address,
+                    "casparcg_version" : provider.protocol,
+                    "channel" : id_channel,
+                }
+            registry.add_histogram("casparcg_consume_time_ratio", buckets, counts, total, **tags)
+        for (id_channel, id_layer), (counts, total) in caspar["render_time"].items():
+            tags = {
+                    "casparcg_host" : provider.address,
+                    "casparcg_version" : provider.protocol,
+                    "channel" : id_channel,
+                }
+            if id_layer is None:
+                registry.add_histogram("casparcg_channel_render_time_ratio", buckets, counts, total, **tags)
+            else:
+                tags["layer"] = id_layer
+                registry.add_histogram("casparcg_render_time_ratio", buckets, counts, total, **tags)
@@ -0,0 +1,247 @@
+__all__ = ["AsyncMetricsServer", "DaemonExecutor"]
+
+import time
+import queue
+import socket
+import _thread
+import asyncio
+import traceback
+import concurrent.futures
+
+from http import HTTPStatus
+
+from nxtools import *
+
+from pythonosc import osc_server
+
+from . import Metrics
+from .common import settings, BANNER
+from .response import etag_matches
+
+
+class DaemonExecutor(concurrent.futures.Executor):
+    """Executor running calls in daemon threads.
+
+    Unlike ThreadPoolExecutor, a call stuck in a hung syscall
+    (unresponsive mountpoint, nvidia-smi) does not prevent the exporter
+    from shutting down.
+    """
+
+    def __init__(self, workers=4):
+        self.queue = queue.Queue()
+        for i in range(workers):
+            _thread.start_new_thread(self.worker, ())
+
+    def submit(self, func, *args, **kwargs):
+        future = concurrent.futures.Future()
+        self.queue.put((future, func, args, kwargs))
+        return future
+
+    def worker(self):
+        while True:
+            future, func, args, kwargs = self.queue.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                result = func(*args, **kwargs)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                future.set_result(result)
+
+
+class AsyncMetricsServer():
+    """Runs the exporter in a single asyncio event loop.
+
+    OSC datagrams, the AMCP heartbeat, collector scheduling and HTTP
+    requests are all handled by the loop thread, so CasparCG state is
+    never modified while /metrics is being rendered. Blocking calls
+    (psutil, GPU, disk and AMCP queries) run in DaemonExecutors, one
+    per provider kind and one for AMCP heartbeats, so hung disk calls
+    do not delay other providers.
+    """
+
+    def __init__(self):
+        self.metrics = Metrics(threaded=False)
+        self.executors = {
+                kind : DaemonExecutor(size)
+                for kind, size in self.metrics.collector.pool_sizes().items()
+            }
+        self.heartbeat_executor = DaemonExecutor(max(1, len(self.metrics.caspar_monitor.providers)))
+        self.max_connections = settings["http_max_connections"]
+        self.request_timeout = settings["http_timeout"]
+        self.connections = 0
+        self.rejected = 0
+        self.should_run = True
+        self.loop = None
+        self.stopped = None
+
+    @property
+    def get_info(self):
+        return BANNER.format(**settings)
+
+    def run(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.loop.run_until_complete(self.serve())
+        finally:
+            self.loop.close()
+
+    def stop(self):
+        self.should_run = False
+        if self.stopped:
+            self.stopped.set()
+
+    async def serve(self):
+        self.stopped = asyncio.Event()
+        tasks = [self.loop.create_task(self.collect())]
+
+        monitor = self.metrics.caspar_monitor
+        for provider in monitor.providers:
+            tasks.append(self.loop.create_task(self.heartbeat(provider)))
+        transports = []
+        for osc_port, demux in monitor.demuxes.items():
+            server = osc_server.AsyncIOOSCUDPServer((monitor.osc_address, osc_port), demux, self.loop)
+            transport, protocol = await server.create_serve_endpoint()
+            sock = transport.get_extra_info("socket")
+            if monitor.osc_rcvbuf and sock is not None:
+                sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, monitor.osc_rcvbuf)
+            monitor.servers[osc_port] = server
+            transports.append(transport)
+            logging.info("CasparCG: listening for OSC on port {}".format(osc_port))
+
+        logging.info("Starting HTTP server: {}:{}".format(settings["host"], settings["port"]))
+        httpd = await asyncio.start_server(self.handle, settings["host"] or None, settings["port"])
+        if not self.should_run:
+            self.stopped.set()
+        await self.stopped.wait()
+
+        httpd.close()
+        await httpd.wait_closed()
+        for transport in transports:
+            transport.close()
+        for task in tasks:
+            task.cancel()
+
+    async def collect(self):
+        collector = self.metrics.collector
+        while True:
+            for job in collector.schedule():
+                if job.blocking:
+                    self.loop.run_in_executor(self.executors[job.kind], collector.execute, job)
+                else:
+                    collector.execute(job)
+            await asyncio.sleep(collector.sleep_time())
+
+    async def heartbeat(self, provider):
+        while True:
+            try:
+                await self.loop.run_in_executor(self.heartbeat_executor, provider.check_connection)
+            except Exception:
+                log_traceback()
+            await asyncio.sleep(5)
+
+    #
+    # HTTP
+    #
+
+    async def handle(self, reader, writer):
+        if self.connections >= self.max_connections:
+            self.rejected += 1
+            logging.warning("HTTP: too many connections, rejecting {}".format(writer.get_extra_info("peername")[0]))
+            writer.close()
+            return
+        self.connections += 1
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            while self.should_run:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.request_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, asyncio.LimitOverrunError):
+                    break
+                keep_alive = self.handle_request(head, writer)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, OSError) as e:
+            logging.debug("HTTP: connection failed: {}".format(e))
+        finally:
+            self.connections -= 1
+            writer.close()
+
+    def handle_request(self, head, writer):
+        """Writes response to a request. Returns False if the connection should be closed."""
+        lines = head.decode("latin-1").split("\r\n")
+        try:
+            method, path, version = lines[0].split(" ")
+        except ValueError:
+            self.make_response(writer, "Bad request\n", 400, keep_alive=False)
+            return False
+        headers = {}
+        for line in lines[1:]:
+            key, _, value = line.partition(":")
+            if key:
+                headers[key.strip().lower()] = value.strip()
+
+        connection = headers.get("connection", "").lower()
+        if version == "HTTP/1.1":
+            keep_alive = connection != "close"
+        else:
+            keep_alive = connection == "keep-alive"
+
+        if method not in ["GET", "HEAD"]:
+            self.make_response(writer, "Method not allowed\n", 405, keep_alive=keep_alive)
+        elif path.startswith("/metrics"):
+            self.send_metrics(writer, headers, keep_alive, method == "HEAD")
+        elif path.startswith("/shutdown"):
+            logging.warning("Shutdown requested")
+            self.make_response(writer, "Shutting down\n", keep_alive=False)
+            self.loop.call_soon(self.stop)
+            return False
+        else:
+            self.make_response(writer, self.get_info, keep_alive=keep_alive)
+        logging.debug("HTTP request {} finished".format(path))
+        return keep_alive
+
+    def send_metrics(self, writer, headers, keep_alive, head_only=False):
+        try:
+            response = self.metrics.response()
+        except Exception:
+            self.make_response(writer, "Unable to get metrics\n\n{}".format(traceback.format_exc()), 500, keep_alive=keep_alive)
+            return
+        body, etag, encoding = response.get(headers.get("accept-encoding"))
+        response_headers = {"ETag" : etag, "Vary" : "Accept-Encoding"}
+        if etag_matches(headers.get("if-none-match"), etag):
+            self.make_response(writer, b"", 304, headers=response_headers, keep_alive=keep_alive, head_only=True)
+            return
+        if encoding:
+            response_headers["Content-Encoding"] = encoding
+        self.make_response(
+                writer,
+                body,
+                mime="text/plain; version=0.0.4; charset=utf-8",
+                headers=response_headers,
+                keep_alive=keep_alive,
+                head_only=head_only
+            )
+
+    def make_response(self, writer, data, status=200, mime="text/txt", headers={}, keep_alive=True, head_only=False):
+        if type(data) == str:
+            data = data.encode("utf-8")
+        status = HTTPStatus(status)
+        head = "HTTP/1.1 {} {}\r\n".format(status.value, status.phrase)
+        head += "Date: {}\r\n".format(time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime()))
+        if status != HTTPStatus.NOT_MODIFIED:
+            head += "Content-type: {}\r\n".format(mime)
+            head += "Content-length: {}\r\n".format(len(data))
+        for key, value in headers.items():
+            head += "{}: {}\r\n".format(key, value)
+        if not keep_alive:
+            head += "Connection: close\r\n"
+        head += "\r\n"
+        writer.write(head.encode("latin-1"))
+        if not head_only:
+            writer.write(data)
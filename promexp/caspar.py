@@ -1,7 +1,11 @@
 #!/usr/bin/env python3
 
+import re
 import time
+import socket
+import atexit
 import _thread
+import threading
 import fractions
 
 from nxtools import *
@@ -11,25 +15,124 @@ from nxtools.caspar.caspar import CasparResponse
 from pythonosc import dispatcher
 from pythonosc import osc_server
 
+from .network import get_udp_rcvbuf_errors
+from .stage import StageStore
+from .histogram import Histogram
+from .peak import PeakWindow
+from .persist import StateFile
+
+default_layer_info = {
+        "current" : False,
+        "cued" : False,
+        "paused" : False,
+        "pos" : 0,
+        "dur" : 0,
+        "live" : False
+    }
+
+
+def parse_video_mode(video_mode):
+    """Returns (numerator, denominator) frame rate of a CasparCG video mode.
+
+    Modes are PAL, NTSC or [lines][i|p][field or frame rate * 100],
+    such as 1080i5000 (25 fps), 2160p5994 (60000/1001 fps) or 720p6000.
+    """
+    if video_mode == "PAL":
+        return (25, 1)
+    if video_mode == "NTSC":
+        return (30000, 1001)
+    match = re.search(r"(\d+)([ip])(\d{4})$", video_mode or "")
+    if not match:
+        logging.warning("CasparCG: unknown video mode {}, assuming 25 fps".format(video_mode))
+        return (25, 1)
+    rate = int(match.group(3))
+    if rate % 100:
+        # NTSC rates: 2398, 2997, 5994
+        fps = fractions.Fraction(round(rate / 100) * 1000, 1001)
+    else:
+        fps = fractions.Fraction(rate // 100)
+    if match.group(2) == "i":
+        fps /= 2
+    return (fps.numerator, fps.denominator)
+
+
+class CasparSnapshot(object):
+    """Immutable state of the CasparCG server as seen by the OSC thread.
+
+    The dicts are never modified after the snapshot is published.
+    """
+
+    __slots__ = [
+            "generation",
+            "fps",
+            "dropped",
+            "dropped_created",
+            "peak_volume",
+            "last_osc_ts",
+            "consume_time",
+            "render_time"
+        ]
+
+    def __init__(
+                self,
+                generation=0,
+                fps={},
+                dropped={},
+                dropped_created={},
+                peak_volume={},
+                last_osc_ts=0,
+                consume_time={},
+                render_time={}
+            ):
+        self.generation = generation
+        self.fps = fps
+        self.dropped = dropped
+        self.dropped_created = dropped_created
+        self.peak_volume = peak_volume
+        self.last_osc_ts = last_osc_ts
+        self.consume_time = consume_time
+        self.render_time = render_time
+
 
 class CasparMetricsProvider(object):
-    def __init__(self, settings):
-        self.stage = {}
+    """CasparCG monitoring.
+
+    Channel state is modified only by the thread running OSC handlers.
+    At the end of each channel frame (and when the frame rate or drop
+    counters change) the handlers publish a new CasparSnapshot, which
+    other threads read without locking. `fps`, `profiler` and the
+    histogram and peak volume dicts are replaced (copy-on-write) rather
+    than modified, so a published snapshot may share them. Histograms
+    and peak windows themselves keep counting; readers copy them with
+    Histogram.get() and PeakWindow.get().
+    """
+
+    def __init__(self, settings, threaded=True):
+        self.stage = StageStore(settings.get("caspar_layer_timeout") or 10)
         self.fps = {}
         self.profiler = {}
+        self.profiler_created = {}
         self.peak_volume = {}
+        self.peak_volume_keys = {}
+        self.peak_volume_windows = tuple(float(w) for w in settings.get("peak_volume_windows") or [15])
+        self.frame_time_buckets = tuple(float(b) for b in settings.get("frame_time_buckets") or [1])
+        self.consume_time = {}
+        self.render_time = {}
+        self.channel_ids = {}
+        self.snapshot = CasparSnapshot()
 
         self.address = settings["caspar_host"]
         self.port = settings["amcp_port"]
-        self.osc_address = "0.0.0.0"
         self.osc_port = settings["osc_port"]
+        self.osc_received = 0
+        self.osc_invalid = 0
         self.last_osc_ts = 0
 
         if not self.address:
             return
 
         self.connect()
-        response = self.query("VERSION")
+        version, info = self.caspar.query_many(["VERSION", "INFO"])
         protocols = {
                 "2.3" : 2.2,
                 "2.2" : 2.2,
@@ -38,7 +141,7 @@ class CasparMetricsProvider(object):
                 "2.0.6" : 2.06
             }
         for p in protocols:
-            if response.data.startswith(p):
+            if version and version.data.startswith(p):
                 logging.info("CasparCG: using parsed protocol {}".format(protocols[p]))
                 self.protocol = protocols[p]
                 break
@@ -46,41 +149,47 @@ class CasparMetricsProvider(object):
             self.protocol = 2.2
             logging.info("CasparCG: using default protocol 2.06")
 
-        i = 1
-        mode_to_fps = {
-                "PAL" : (25, 1),
-                "NTSC" : (30000, 1001),
-                "1080i5000" : (25, 1),
-                "1080p5000" : (50, 1),
-                "1080i5994" : (30000, 1001),
-                "1080p5994" : (50000, 1001),
-            }
+        self.fps = self.parse_channel_list(info) or self.discover_channels()
+        for id_channel, fps in self.fps.items():
+            logging.info("CasparCG: {} channel {} FPS: {}".format(self.address, id_channel, fps))
+        self.publish()
 
-        while True:
-            response = self.query("INFO {}".format(i))
-            if not response:
-                break
-            x = xml(response.data)
-            video_mode = x.find("video-mode").text
-            fps = mode_to_fps[video_mode]
-            logging.info("CasparCG: parsed channel {} FPS: {}".format(i, fps))
-            self.fps[i] = fps
-            i += 1
-
-        self.start()
+        if threaded:
+            self.start()
         logging.debug("CasparCG: initialization completed")
 
 
+    def parse_channel_list(self, response):
+        """Returns {id_channel : fps} from bulk INFO response ("1 1080i5000 PLAYING" lines)"""
+        result = {}
+        for line in response.lines:
+            elements = line.split()
+            if len(elements) < 2 or not elements[0].isdigit():
+                continue
+            result[int(elements[0])] = parse_video_mode(elements[1])
+        return result
+
+    def discover_channels(self, batch_size=8):
+        """Returns {id_channel : fps} using pipelined INFO [channel] requests"""
+        result = {}
+        while True:
+            first = len(result) + 1
+            queries = ["INFO {}".format(i) for i in range(first, first + batch_size)]
+            for id_channel, response in enumerate(self.caspar.query_many(queries), first):
+                if not response:
+                    return result
+                video_mode = xml(response.data).find("video-mode")
+                result[id_channel] = parse_video_mode(video_mode.text if video_mode is not None else "")
+
     def start(self):
         _thread.start_new_thread(self.heartbeat, ())
-        _thread.start_new_thread(self.main, ())
 
 
     def connect(self):
         logging.info("CasparCG: connecting to server {}:{}".format(self.address, self.port))
         self.caspar = CasparCG(self.address, self.port)
         if self.caspar.connect():
-            logging.goodnews("CasparCG: connected")
+            logging.goodnews("CasparCG: connected to {}".format(self.address))
 
 
     def query(self, *args, **kwargs):
@@ -88,90 +197,209 @@ class CasparMetricsProvider(object):
             return CasparResponse(500, "Not connected")
         return self.caspar.query(*args, **kwargs)
 
+    def check_connection(self):
+        response = self.query("VERSION", verbose=False)
+        if not response:
+            self.connect()
+
     def heartbeat(self):
         while True:
             try:
-                response = self.query("VERSION", verbose=False)
-                if not response:
-                    self.connect()
+                self.check_connection()
                 time.sleep(5)
             except Exception:
                 log_traceback()
 
 
-    def main(self):
+    def create_dispatcher(self):
         self.dispatcher = dispatcher.Dispatcher()
-        self.osc = osc_server.BlockingOSCUDPServer(
-                    (self.osc_address, self.osc_port),
-                    self.dispatcher
-                )
-
         self.dispatcher.map("/channel/*/stage/layer/*/", self.parse_stage)
         self.dispatcher.map("/channel/*/framerate", self.parse_framerate)
         self.dispatcher.map("/channel/*/mixer/audio/*", self.parse_volume)
         self.dispatcher.map("/channel/*/output/consume_time", self.parse_consume_time)
-
+        self.dispatcher.map("/channel/*/profiler/time", self.parse_channel_profiler)
         self.dispatcher.set_default_handler(self.parse_null)
-        self.osc.serve_forever()
+        return self.dispatcher
 
     def parse_null(self, *args):
         pass
 
     def parse_framerate(self, *args):
+        self.stage.tick(time.time())
         address = args[0].split("/")
         id_channel = int(address[2])
         data = args[1:]
         if self.fps.get(id_channel) != data:
             logging.info("CasparCG: channel {} FPS changed to".format(id_channel, data))
-            self.fps[id_channel] = data
+            fps = dict(self.fps)
+            fps[id_channel] = data
+            self.fps = fps
+            self.publish()
 
-    def parse_volume(self, *args):
-        address = args[0].split("/")
-        id_channel = int(address[2])
-        if len(address) == 7 and address[6] == "pFS":
-            self.peak_volume[id_channel] = max(args[1], self.peak_volume.get(id_channel, 0))
+    def parse_volume(self, address, *args):
+        try:
+            key = self.peak_volume_keys[address]
+        except KeyError:
+            key = self.peak_volume_keys[address] = self.parse_volume_address(address)
+        if key is None or not args:
+            return
+        try:
+            window = self.peak_volume[key]
+        except KeyError:
+            peak_volume = dict(self.peak_volume)
+            window = peak_volume[key] = PeakWindow(max(self.peak_volume_windows))
+            self.peak_volume = peak_volume
+        window.observe(args[0], time.monotonic())
+
+    def parse_volume_address(self, address):
+        """Returns (id_channel, id_audio) of a /channel/*/mixer/audio/*/pFS address or None"""
+        address = address.split("/")
+        if len(address) != 7 or address[6] != "pFS":
+            return None
+        try:
+            return int(address[2]), int(address[5])
+        except ValueError:
+            return None
 
 
-    def parse_consume_time(self, *args):
-        self.last_osc_ts = time.time()
-        address = args[0].split("/")
-        id_channel = int(address[2])
-        data = args[1]
+    def get_channel_id(self, address):
+        try:
+            return self.channel_ids[address]
+        except KeyError:
+            id_channel = self.channel_ids[address] = int(address.split("/")[2])
+            return id_channel
 
-        if data > 1/self.get_fps(id_channel):
-            logging.warning("CasparCG: dropped frame on channel {}".format(id_channel))
+    def get_histogram(self, name, key):
+        """Returns histogram of given key, creating a new one copy-on-write"""
+        histograms = getattr(self, name)
+        try:
+            return histograms[key]
+        except KeyError:
+            histograms = dict(histograms)
+            histogram = histograms[key] = Histogram(self.frame_time_buckets)
+            setattr(self, name, histograms)
+            return histogram
 
+    def parse_consume_time(self, address, data, *args):
+        self.last_osc_ts = time.time()
+        self.stage.tick(self.last_osc_ts)
+        id_channel = self.get_channel_id(address)
+        fps_n, fps_d = self.fps.get(id_channel, (25, 1))
+        ratio = data * fps_n / fps_d
+        self.get_histogram("consume_time", id_channel).observe(ratio)
 
-    def parse_stage(self, *args):
-        address = args[0].split("/")
-        data =  args[1:]
-        id_channel = int(address[2])
-        layer = int(address[5])
-        key = "/".join(address[6:])
-        if not id_channel in self.stage:
-            self.stage[id_channel] = {}
+        if ratio > 1:
+            logging.throttle.warning(
+                    ("consume", self.address, id_channel),
+                    "CasparCG:", self.address, "dropped frame on channel", id_channel
+                )
+        self.publish()
+
+    def parse_channel_profiler(self, address, treal, texp, *args):
+        self.stage.tick(time.time())
+        if texp > 0:
+            self.get_histogram("render_time", (self.get_channel_id(address), None)).observe(treal / texp)
 
-        if not layer in self.stage[id_channel]:
-            self.stage[id_channel][layer] = {}
 
-        self.stage[id_channel][layer][key] = data
+    def parse_stage(self, address, *args):
+        parsed = self.stage.update(address, args)
+        if parsed is None:
+            return
+        layer_key, key, slots = parsed
 
         if key == "profiler/time":
-            treal, texp = data
+            treal, texp = args
+            if texp > 0:
+                self.get_histogram("render_time", layer_key).observe(treal / texp)
             if treal > texp:
-                if not id_channel in self.profiler:
-                    self.profiler[id_channel] = {}
-                if not layer in self.profiler[id_channel]:
-                    self.profiler[id_channel][layer] = 0
-
-                logging.warning("CasparCG: drop frame detected on channel {} layer {}".format(id_channel, layer))
-                self.profiler[id_channel][layer] += 1
+                id_channel, layer = layer_key
+                profiler = dict(self.profiler)
+                layers = profiler[id_channel] = dict(profiler.get(id_channel, {}))
+                if layer not in layers:
+                    created = dict(self.profiler_created)
+                    created[layer_key] = time.time()
+                    self.profiler_created = created
+                layers[layer] = layers.get(layer, 0) + 1
+                self.profiler = profiler
+
+                logging.throttle.warning(
+                        ("stage", self.address, id_channel, layer),
+                        "CasparCG:", self.address, "drop frame detected on channel", id_channel, "layer", layer
+                    )
+                self.publish()
+
+
+    def publish(self):
+        """Publishes a new snapshot. Called only from the thread running OSC handlers."""
+        snapshot = self.snapshot
+        self.snapshot = CasparSnapshot(
+                snapshot.generation + 1,
+                self.fps,
+                self.profiler,
+                self.profiler_created,
+                self.peak_volume,
+                self.last_osc_ts,
+                self.consume_time,
+                self.render_time
+            )
+
+    def collect(self):
+        """Returns the current state for the metrics collector.
+
+        Peak volume is {(id_channel, id_audio) : {window : (max, min, mean)}}
+        of pFS values received in last `window` seconds.
+        """
+        snapshot = self.snapshot
+        now = time.monotonic()
+        peak_volume = {}
+        for key, peak_window in snapshot.peak_volume.items():
+            values = {}
+            for window in self.peak_volume_windows:
+                value = peak_window.get(window, now)
+                if value is not None:
+                    values[window] = value
+            if values:
+                peak_volume[key] = values
+        return {
+                "generation" : snapshot.generation,
+                "last_osc_ts" : snapshot.last_osc_ts,
+                "osc" : {
+                        "received" : self.osc_received,
+                        "invalid" : self.osc_invalid,
+                    },
+                "peak_volume" : peak_volume,
+                "dropped" : snapshot.dropped,
+                "dropped_created" : snapshot.dropped_created,
+                "consume_time" : {
+                        id_channel : histogram.get()
+                        for id_channel, histogram in snapshot.consume_time.items()
+                    },
+                "render_time" : {
+                        key : histogram.get()
+                        for key, histogram in snapshot.render_time.items()
+                    },
+                "frame_time_buckets" : self.frame_time_buckets,
+            }
 
-
-    def get_peak_volume(self, id_channel):
-        result = self.peak_volume.get(id_channel, 0)
-        self.peak_volume[id_channel] = 0
-        return result
+    def dump_dropped(self):
+        """Returns drop counters of the latest snapshot as [[id_channel, layer, value, created], ...]"""
+        snapshot = self.snapshot
+        return [
+                [id_channel, layer, value, snapshot.dropped_created.get((id_channel, layer), 0)]
+                for id_channel, layers in snapshot.dropped.items()
+                for layer, value in layers.items()
+            ]
+
+    def restore_dropped(self, counters):
+        """Restores drop counters returned by dump_dropped(). Must be called before OSC is received."""
+        profiler = {}
+        profiler_created = {}
+        for id_channel, layer, value, created in counters:
+            profiler.setdefault(id_channel, {})[layer] = value
+            profiler_created[id_channel, layer] = created
+        self.profiler = profiler
+        self.profiler_created = profiler_created
+        self.publish()
 
     def get_fps(self, id_channel):
         fps_n, fps_d = self.fps.get(id_channel, (25, 1))
@@ -179,34 +407,26 @@ class CasparMetricsProvider(object):
 
 
     def get_layer(self, id_channel=1, id_layer=10):
-        try:
-            lsrc = self.stage[id_channel][id_layer]
-        except KeyError:
-            return default_layer_info
+        lsrc = self.stage.get(id_channel, id_layer)
+        if lsrc is None:
+            return dict(default_layer_info)
 
-        current = lsrc.get("foreground/file/name")
-        current = os.path.splitext(current[0])[0] if current else False
+        current = lsrc.fg_name
+        current = os.path.splitext(current)[0] if current else False
 
-        cued = lsrc.get("background/file/name")
-        cued = os.path.splitext(cued[0])[0] if cued else False
+        cued = lsrc.bg_name
+        cued = os.path.splitext(cued)[0] if cued else False
 
-        paused = lsrc.get("foreground/paused")
-        paused = paused[0] if paused else False
+        paused = lsrc.fg_paused
 
-        fg_producer = lsrc.get("foreground/producer")
-        if fg_producer and fg_producer[0] == "decklink":
-            is_live = True
-        else:
-            is_live = False
+        is_live = lsrc.fg_producer == "decklink"
 
-        bkg_producer = lsrc.get("background/producer")
-        bkg_producer = bkg_producer[0] if bkg_producer else "empty"
+        bkg_producer = lsrc.bg_producer or "empty"
         if bkg_producer == "empty":
-            if "background/file/name" in lsrc:
-                del(lsrc["background/file/name"])
+            lsrc.bg_name = None
             cued = False
 
-        poss, durs = lsrc.get("foreground/file/time", (0,0))
+        poss, durs = lsrc.fg_time, lsrc.fg_duration
 
         if is_live:
             pos = dur = 0
@@ -223,3 +443,146 @@ class CasparMetricsProvider(object):
                 "dur" : dur,
                 "live" : is_live
             }
+
+
+class OscDemux(object):
+    """Routes OSC datagrams received on one port to CasparCG providers by source address.
+
+    Used as the dispatcher of an OSC server. When the port is used by
+    a single server, datagrams from any source are routed to it.
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.providers = []
+        self.default = None
+        self.unknown = 0
+
+    def add(self, provider, addresses):
+        self.providers.append(provider)
+        route = (provider, provider.create_dispatcher())
+        for address in addresses:
+            self.routes[address] = route
+        self.default = next(iter(self.routes.values())) if len(self.providers) == 1 else None
+
+    def call_handlers_for_packet(self, data, client_address):
+        route = self.routes.get(client_address[0], self.default)
+        if route is None:
+            self.unknown += 1
+            return True
+        provider, dispatcher = route
+        provider.osc_received += 1
+        if dispatcher.call_handlers_for_packet(data, client_address) is False:
+            provider.osc_invalid += 1
+            return False
+        return True
+
+
+def resolve_addresses(host):
+    try:
+        return socket.gethostbyname_ex(host)[2]
+    except OSError as e:
+        logging.error("CasparCG: unable to resolve {}: {}".format(host, e))
+        return [host]
+
+
+class CasparMonitor(object):
+    """Monitors one or more CasparCG servers.
+
+    Every server has its own CasparMetricsProvider (state, AMCP
+    connection and heartbeat). OSC is received by one server per
+    distinct osc_port, and datagrams are routed to the providers
+    by their source address (OscDemux). All providers sharing
+    a port are updated by the same thread.
+
+    If `state_path` is set, drop counters are periodically saved
+    (save()) and restored on startup, so they survive exporter restarts.
+    """
+
+    def __init__(self, settings, threaded=True):
+        self.osc_address = "0.0.0.0"
+        self.osc_rcvbuf = settings.get("osc_rcvbuf")
+        self.osc_queue_size = settings.get("osc_queue_size") or 1024
+        self.providers = []
+        self.demuxes = {}
+        self.servers = {}
+        self.state = None
+        self.state_lock = threading.Lock()
+        if settings.get("state_path"):
+            self.state = StateFile(settings["state_path"])
+            atexit.register(self.save_at_exit)
+
+        servers = settings.get("caspar_servers") or []
+        if not servers and settings.get("caspar_host"):
+            servers = [{"host" : settings["caspar_host"]}]
+
+        for server in servers:
+            provider = CasparMetricsProvider(
+                    dict(
+                        settings,
+                        caspar_host=server["host"],
+                        amcp_port=server.get("amcp_port", settings["amcp_port"]),
+                        osc_port=server.get("osc_port", settings["osc_port"])
+                    ),
+                    threaded
+                )
+            self.providers.append(provider)
+            if self.state:
+                provider.restore_dropped(self.state.data.get("dropped", {}).get(self.state_key(provider), []))
+            if provider.osc_port not in self.demuxes:
+                self.demuxes[provider.osc_port] = OscDemux()
+            self.demuxes[provider.osc_port].add(provider, resolve_addresses(provider.address))
+
+        if threaded:
+            for osc_port in self.demuxes:
+                _thread.start_new_thread(self.listen, (osc_port,))
+
+    def listen(self, osc_port):
+        server = osc_server.BatchingOSCUDPServer(
+                    (self.osc_address, osc_port),
+                    self.demuxes[osc_port],
+                    rcvbuf=self.osc_rcvbuf,
+                    queue_size=self.osc_queue_size
+                )
+        self.servers[osc_port] = server
+        logging.info("CasparCG: listening for OSC on port {}, receive buffer size is {} bytes".format(
+            osc_port,
+            server.rcvbuf
+        ))
+        server.serve_forever()
+
+    def state_key(self, provider):
+        return "{}:{}".format(provider.address, provider.port)
+
+    def save(self):
+        """Saves drop counters of all providers to the state file"""
+        with self.state_lock:
+            data = {
+                    "dropped" : {
+                            self.state_key(provider) : provider.dump_dropped()
+                            for provider in self.providers
+                        }
+                }
+            return {"saved" : self.state.save(data)}
+
+    def save_at_exit(self):
+        try:
+            self.save()
+        except Exception:
+            log_traceback("Unable to save state file {}".format(self.state.path))
+
+    def collect(self):
+        """Returns OSC listener counters for the metrics collector"""
+        return {
+                "osc" : {
+                        osc_port : {
+                            "received" : server.received,
+                            "parsed" : server.parsed,
+                            "invalid" : server.invalid,
+                            "dropped" : server.dropped,
+                            "unknown_source" : self.demuxes[osc_port].unknown,
+                        }
+                        for osc_port, server in list(self.servers.items())
+                    },
+                "rcvbuf_errors" : get_udp_rcvbuf_errors(),
+            }
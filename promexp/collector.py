@@ -0,0 +1,146 @@
+__all__ = ["Collector"]
+
+import time
+import queue
+import _thread
+import threading
+
+from nxtools import *
+
+
+class CollectorJob():
+    def __init__(self, name, func, interval, timeout, blocking=True, kind=None):
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self.timeout = timeout
+        self.blocking = blocking
+        self.kind = kind or name
+        self.next_run = 0
+        self.started_at = 0
+        self.running = False
+
+
+class Collector():
+    """Refreshes metrics providers in the background.
+
+    Every provider is called on its own interval. Blocking providers
+    run in a bounded worker pool of their kind (disk, gpu...), so calls
+    hung on unreachable mountpoints can only delay other providers of
+    the same kind. Non-blocking providers run in the scheduler thread.
+    Results are published as a new snapshot dict, so readers
+    (/metrics requests) never wait for a provider and always see
+    the last complete value of each one.
+
+    A provider which does not return within its timeout after it
+    started is flagged (`timeout` status) and is not scheduled again
+    until the hung call returns, so a stuck mountpoint or nvidia-smi
+    occupies at most one worker.
+    """
+
+    def __init__(self, workers=4):
+        self.jobs = []
+        self.workers = workers
+        self.queues = {}
+        self.lock = threading.Lock()
+        self.snapshot = {}
+        self.collected_at = {}
+        self.status = {}
+        self.generation = 0
+
+    def add(self, name, func, interval=2, timeout=5, blocking=True, kind=None):
+        """Adds a provider. Non-blocking providers may be called from an event loop directly."""
+        self.jobs.append(CollectorJob(name, func, interval, timeout, blocking, kind))
+
+    def pool_sizes(self):
+        """Returns {kind : number of workers} of blocking providers"""
+        counts = {}
+        for job in self.jobs:
+            if job.blocking:
+                counts[job.kind] = counts.get(job.kind, 0) + 1
+        return {kind : min(self.workers, count) for kind, count in counts.items()}
+
+    def get(self, name, default=None):
+        return self.snapshot.get(name, default)
+
+    def start(self):
+        # Plain daemon threads: a worker stuck in a hung syscall
+        # must not prevent the exporter from shutting down.
+        for kind, size in self.pool_sizes().items():
+            jobs = self.queues[kind] = queue.Queue()
+            for i in range(size):
+                _thread.start_new_thread(self.worker, (jobs,))
+        _thread.start_new_thread(self.main, ())
+
+    def set_status(self, job, up, timeout):
+        if self.status.get(job.name) == (up, timeout):
+            return
+        with self.lock:
+            status = dict(self.status)
+            status[job.name] = (up, timeout)
+            self.status = status
+
+    def execute(self, job):
+        job.started_at = time.time()
+        try:
+            value = job.func()
+        except Exception as e:
+            logging.error("Collector: {} provider failed: {}".format(job.name, e))
+            self.set_status(job, 0, 0)
+        else:
+            self.publish(job, value)
+        job.running = False
+
+    def worker(self, jobs):
+        while True:
+            self.execute(jobs.get())
+
+    def publish(self, job, value):
+        # Publish copies, so readers holding the previous dicts are not affected.
+        # The lock only serializes workers, readers never take it.
+        with self.lock:
+            snapshot = dict(self.snapshot)
+            snapshot[job.name] = value
+            collected_at = dict(self.collected_at)
+            collected_at[job.name] = time.time()
+            self.snapshot = snapshot
+            self.collected_at = collected_at
+            self.generation += 1
+        self.set_status(job, 1, 0)
+
+    def run(self, job):
+        if job.blocking:
+            self.queues[job.kind].put(job)
+        else:
+            self.execute(job)
+
+    def schedule(self):
+        """Returns jobs due to run and marks them running. Flags started jobs which timed out."""
+        now = time.time()
+        result = []
+        for job in self.jobs:
+            if job.running:
+                if not job.started_at:
+                    continue
+                if now - job.started_at > job.timeout and self.status.get(job.name) != (0, 1):
+                    logging.warning("Collector: {} provider timed out".format(job.name))
+                    self.set_status(job, 0, 1)
+                continue
+            if job.next_run > now:
+                continue
+            job.next_run = now + job.interval
+            job.started_at = 0
+            job.running = True
+            result.append(job)
+        return result
+
+    def sleep_time(self):
+        """Returns seconds until the next job is due"""
+        next_run = min([job.next_run for job in self.jobs] or [time.time() + 1])
+        return min(1, max(0.05, next_run - time.time()))
+
+    def main(self):
+        while True:
+            for job in self.schedule():
+                self.run(job)
+            time.sleep(self.sleep_time())
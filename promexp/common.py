@@ -13,8 +13,15 @@ PLATFORM = "windows" if sys.platform == "win32" else "unix"
 
 settings = {
     "caspar_host" : None,
+    "caspar_servers" : [],
     "amcp_port" : 5250,
     "osc_port" : 6250,
+    "osc_rcvbuf" : 4194304,
+    "osc_queue_size" : 1024,
+    "caspar_layer_timeout" : 10,
+    "frame_time_buckets" : [0.25, 0.5, 0.75, 0.9, 1, 1.1, 1.25, 1.5, 2, 4],
+    "peak_volume_windows" : [1, 15],
+    "state_path" : None,
     "prefix" : PREFIX,
     "port" : 9731,
     "tags" : {},
@@ -22,6 +29,15 @@ settings = {
     "hostname" : None,
     "version" : VERSION,
     "smi_path" : None,
+    "gpu_mode" : "nvml",
     "disk_usage" : True,
-    "network_usage" : True
+    "network_usage" : True,
+    "intervals" : {},
+    "timeouts" : {},
+    "collector_workers" : 4,
+    "http_workers" : 8,
+    "http_max_connections" : 32,
+    "http_timeout" : 30,
+    "log_path" : None,
+    "log_max_size" : 10485760
 }
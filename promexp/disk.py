@@ -27,12 +27,15 @@ class DiskMetricsProvider():
                     "fstype" : disk.fstype,
                 })
 
+    def get_usage(self, disk):
+        usage = psutil.disk_usage(disk["mountpoint"])
+        return {
+                **disk,
+                "total" : usage.total,
+                "free" : usage.free,
+                "usage" : usage.percent
+            }
+
     def __call__(self):
         for disk in self.disks:
-            usage = psutil.disk_usage(disk["mountpoint"])
-            disk.update({
-                    "total" : usage.total,
-                    "free" : usage.free,
-                    "usage" : usage.percent
-                })
-            yield disk
+            yield self.get_usage(disk)
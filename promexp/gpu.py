@@ -1,12 +1,117 @@
 __all__ = ["GpuMetricsProvider"]
 
 import os
+import time
+import _thread
 import subprocess
 
 from nxtools import *
 
+from .nvml import NvmlBackend
+
+
+class NvidiaSmiSampler():
+    """Streams utilization from one long-running nvidia-smi process.
+
+    nvidia-smi is started in loop mode (-lms) with CSV output and its lines
+    are parsed in a reader thread as they arrive. The latest values of each
+    GPU are kept in memory. When the process dies, it is restarted with
+    exponential backoff.
+    """
+
+    fields = [
+            "index",
+            "pci.bus_id",
+            "utilization.gpu",
+            "utilization.memory",
+            "utilization.encoder",
+            "utilization.decoder",
+        ]
+
+    def __init__(self, smi_path, interval=1, max_backoff=60):
+        self.smi_path = smi_path
+        self.interval = interval
+        self.max_backoff = max_backoff
+        self.gpus = {}
+        self.proc = None
+
+    @property
+    def command(self):
+        return [
+                self.smi_path,
+                "--query-gpu=" + ",".join(self.fields),
+                "--format=csv,noheader,nounits",
+                "-lms", str(int(self.interval * 1000))
+            ]
+
+    def start(self):
+        _thread.start_new_thread(self.main, ())
+
+    def main(self):
+        backoff = 1
+        while True:
+            start_time = time.time()
+            try:
+                self.proc = subprocess.Popen(
+                        self.command,
+                        stdout=subprocess.PIPE,
+                        stderr=subprocess.DEVNULL
+                    )
+                for line in self.proc.stdout:
+                    self.parse_line(line)
+                logging.warning("nvidia-smi exited with code {}".format(self.proc.wait()))
+            except Exception:
+                log_traceback("Unable to run nvidia-smi")
+            self.gpus = {}
+            if time.time() - start_time > self.max_backoff:
+                backoff = 1
+            time.sleep(backoff)
+            backoff = min(backoff * 2, self.max_backoff)
+
+    def parse_line(self, line):
+        values = [v.strip() for v in line.decode("utf-8", "replace").split(",")]
+        if len(values) != len(self.fields):
+            return
+        try:
+            index = int(values[0])
+        except ValueError:
+            return
+        utilization = {}
+        for field, value in zip(self.fields[2:], values[2:]):
+            try:
+                utilization[field.split(".")[1]] = float(value)
+            except ValueError:
+                # [N/A] or [Not Supported]
+                continue
+        gpus = dict(self.gpus)
+        gpus[index] = {
+                "id" : values[1],
+                "utilization" : utilization,
+                "updated_at" : time.time()
+            }
+        self.gpus = gpus
+
+    def __call__(self):
+        max_age = max(5, self.interval * 5)
+        gpus = self.gpus
+        return [
+                gpus[index]
+                for index in sorted(gpus)
+                if time.time() - gpus[index]["updated_at"] < max_age
+            ]
+
+
 class GpuMetricsProvider():
     def __init__(self, settings):
+        self.nvml = None
+        if settings.get("gpu_mode") == "nvml":
+            try:
+                self.nvml = NvmlBackend()
+            except Exception as e:
+                logging.info("NVML is not available ({}), falling back to nvidia-smi".format(e))
+            else:
+                logging.info("NVML loaded. GPU metrics will be available.")
+
         smi_paths = [
                 "c:\\Program Files\\NVIDIA Corporation\\NVSMI\\nvidia-smi.exe",
                 "/usr/bin/nvidia-smi",
@@ -24,12 +129,30 @@ class GpuMetricsProvider():
         else:
             self.smi_path = None
 
+        self.timeout = (settings.get("timeouts") or {}).get("gpu", 5)
+        self.sampler = None
+
+        if self.smi_path and settings.get("gpu_mode") == "stream":
+            logging.info("Starting nvidia-smi sampler")
+            self.sampler = NvidiaSmiSampler(
+                    self.smi_path,
+                    interval=(settings.get("intervals") or {}).get("gpu", 2)
+                )
+            self.sampler.start()
+
 
     def __call__(self, request_modes=["utilization"]):
+        if self.nvml:
+            return self.nvml()
         if not self.smi_path:
             return {}
+        if self.sampler:
+            return self.sampler()
         try:
-            rawdata = subprocess.check_output([self.smi_path, "-q", "-d", "utilization"])
+            rawdata = subprocess.check_output(
+                    [self.smi_path, "-q", "-d", "utilization"],
+                    timeout=self.timeout
+                )
         except Exception:
             return {}
 
@@ -0,0 +1,27 @@
+__all__ = ["Histogram"]
+
+import bisect
+
+
+class Histogram(object):
+    """Prometheus histogram with fixed bucket bounds.
+
+    Counts are kept per bucket (not cumulative) in a preallocated list,
+    so observe() only increments one item. The list never changes size,
+    so it may be copied by another thread while samples are added.
+    """
+
+    __slots__ = ["bounds", "counts", "sum"]
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+
+    def get(self):
+        """Returns (counts, sum) copy"""
+        return list(self.counts), self.sum
@@ -1,4 +1,4 @@
-__all__ = ["NetworkMetricsProvider"]
+__all__ = ["NetworkMetricsProvider", "get_udp_rcvbuf_errors"]
 
 import psutil
 
@@ -21,6 +21,20 @@ elif type(settings["network_usage"]) == list:
 
 
 
+def get_udp_rcvbuf_errors():
+    """Returns number of UDP datagrams the kernel dropped because a receive buffer was full.
+
+    The counter is system-wide. Returns None where /proc/net/snmp is not available.
+    """
+    try:
+        with open("/proc/net/snmp") as f:
+            lines = [line.split() for line in f if line.startswith("Udp:")]
+        header, values = lines[0], lines[1]
+        return int(values[header.index("RcvbufErrors")])
+    except (OSError, IndexError, ValueError):
+        return None
+
+
 class NetworkMetricsProvider():
     def __init__(self, settings):
         pass
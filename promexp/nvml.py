@@ -0,0 +1,143 @@
+__all__ = ["NvmlBackend", "NvmlError"]
+
+import os
+import ctypes
+
+from ctypes import byref, c_uint, c_ulonglong, c_void_p, c_char
+
+from .common import PLATFORM
+
+NVML_SUCCESS = 0
+NVML_TEMPERATURE_GPU = 0
+
+NVML_CLOCKS = {
+        "graphics" : 0,
+        "sm" : 1,
+        "memory" : 2,
+        "video" : 3,
+    }
+
+
+class NvmlError(Exception):
+    def __init__(self, code):
+        self.code = code
+        super().__init__("NVML error {}".format(code))
+
+
+class NvmlUtilization(ctypes.Structure):
+    _fields_ = [
+            ("gpu", c_uint),
+            ("memory", c_uint),
+        ]
+
+
+class NvmlMemory(ctypes.Structure):
+    _fields_ = [
+            ("total", c_ulonglong),
+            ("free", c_ulonglong),
+            ("used", c_ulonglong),
+        ]
+
+
+class NvmlPciInfo(ctypes.Structure):
+    _fields_ = [
+            ("busIdLegacy", c_char * 16),
+            ("domain", c_uint),
+            ("bus", c_uint),
+            ("device", c_uint),
+            ("pciDeviceId", c_uint),
+            ("pciSubSystemId", c_uint),
+            ("busId", c_char * 32),
+        ]
+
+
+def load_library():
+    if PLATFORM == "windows":
+        paths = [
+                os.path.join(os.environ.get("WINDIR", "c:\\Windows"), "System32", "nvml.dll"),
+                "c:\\Program Files\\NVIDIA Corporation\\NVSMI\\nvml.dll",
+            ]
+        for path in paths:
+            if os.path.exists(path):
+                return ctypes.CDLL(path)
+        raise OSError("nvml.dll not found")
+    return ctypes.CDLL("libnvidia-ml.so.1")
+
+
+class NvmlBackend():
+    """Queries NVIDIA GPUs through libnvidia-ml.
+
+    The library is initialized and device handles are opened once.
+    Values a device does not support are omitted from the result.
+
+    `lib` may be any object providing the used nvml* functions
+    (ctypes calling convention, return code as result), which allows
+    using a stub instead of the real library.
+    """
+
+    def __init__(self, lib=None):
+        self.lib = lib or load_library()
+        self.check(self.lib.nvmlInit_v2())
+        count = c_uint()
+        self.check(self.lib.nvmlDeviceGetCount_v2(byref(count)))
+        self.devices = []
+        for index in range(count.value):
+            handle = c_void_p()
+            self.check(self.lib.nvmlDeviceGetHandleByIndex_v2(c_uint(index), byref(handle)))
+            pci = NvmlPciInfo()
+            if self.lib.nvmlDeviceGetPciInfo_v3(handle, byref(pci)) == NVML_SUCCESS:
+                device_id = pci.busId.decode("ascii")
+            else:
+                device_id = str(index)
+            self.devices.append((device_id, handle))
+
+    def check(self, code):
+        if code != NVML_SUCCESS:
+            raise NvmlError(code)
+
+    def get_device(self, device_id, handle):
+        lib = self.lib
+        result = {"id" : device_id, "utilization" : {}}
+
+        utilization = NvmlUtilization()
+        if lib.nvmlDeviceGetUtilizationRates(handle, byref(utilization)) == NVML_SUCCESS:
+            result["utilization"]["gpu"] = utilization.gpu
+            result["utilization"]["memory"] = utilization.memory
+
+        for key, func in [
+                    ("encoder", lib.nvmlDeviceGetEncoderUtilization),
+                    ("decoder", lib.nvmlDeviceGetDecoderUtilization)
+                ]:
+            value = c_uint()
+            period = c_uint()
+            if func(handle, byref(value), byref(period)) == NVML_SUCCESS:
+                result["utilization"][key] = value.value
+
+        memory = NvmlMemory()
+        if lib.nvmlDeviceGetMemoryInfo(handle, byref(memory)) == NVML_SUCCESS:
+            result["memory"] = {"used" : memory.used, "total" : memory.total}
+
+        value = c_uint()
+        if lib.nvmlDeviceGetTemperature(handle, c_uint(NVML_TEMPERATURE_GPU), byref(value)) == NVML_SUCCESS:
+            result["temperature"] = value.value
+
+        if lib.nvmlDeviceGetPowerUsage(handle, byref(value)) == NVML_SUCCESS:
+            result["power"] = value.value / 1000
+
+        clocks = {}
+        for key, clock_type in NVML_CLOCKS.items():
+            if lib.nvmlDeviceGetClockInfo(handle, c_uint(clock_type), byref(value)) == NVML_SUCCESS:
+                clocks[key] = value.value
+        if clocks:
+            result["clocks"] = clocks
+
+        sessions = c_uint()
+        fps = c_uint()
+        latency = c_uint()
+        if lib.nvmlDeviceGetEncoderStats(handle, byref(sessions), byref(fps), byref(latency)) == NVML_SUCCESS:
+            result["encoder_sessions"] = sessions.value
+
+        return result
+
+    def __call__(self):
+        return [self.get_device(device_id, handle) for device_id, handle in self.devices]
@@ -0,0 +1,71 @@
+__all__ = ["PeakWindow"]
+
+import math
+
+
+class PeakWindow(object):
+    """Max, min and mean of a value over sliding time windows.
+
+    Values are aggregated into a ring of preallocated buckets of
+    `resolution` seconds covering `length` seconds, so observe() is
+    O(1). Reading has no side effect: every reader gets the same result
+    for the same window.
+
+    Written by one thread only. Readers skip a bucket which was reused
+    while they were reading it.
+    """
+
+    __slots__ = ["resolution", "size", "ids", "maxs", "mins", "sums", "counts"]
+
+    def __init__(self, length, resolution=0.1):
+        self.resolution = resolution
+        self.size = max(1, int(math.ceil(length / resolution)))
+        self.ids = [-1] * self.size
+        self.maxs = [0] * self.size
+        self.mins = [0] * self.size
+        self.sums = [0] * self.size
+        self.counts = [0] * self.size
+
+    def observe(self, value, now):
+        bucket = int(now / self.resolution)
+        slot = bucket % self.size
+        if self.ids[slot] == bucket:
+            if value > self.maxs[slot]:
+                self.maxs[slot] = value
+            if value < self.mins[slot]:
+                self.mins[slot] = value
+            self.sums[slot] += value
+            self.counts[slot] += 1
+        else:
+            self.ids[slot] = -1
+            self.maxs[slot] = value
+            self.mins[slot] = value
+            self.sums[slot] = value
+            self.counts[slot] = 1
+            self.ids[slot] = bucket
+
+    def get(self, window, now):
+        """Returns (max, min, mean) of values observed in last `window` seconds, or None"""
+        last = int(now / self.resolution)
+        first = last - min(self.size, max(1, int(round(window / self.resolution)))) + 1
+        result_max = result_min = None
+        total = count = 0
+        for bucket in range(first, last + 1):
+            slot = bucket % self.size
+            if self.ids[slot] != bucket:
+                continue
+            value_max = self.maxs[slot]
+            value_min = self.mins[slot]
+            value_sum = self.sums[slot]
+            value_count = self.counts[slot]
+            if self.ids[slot] != bucket:
+                continue
+            if result_max is None or value_max > result_max:
+                result_max = value_max
+            if result_min is None or value_min < result_min:
+                result_min = value_min
+            total += value_sum
+            count += value_count
+        if not count:
+            return None
+        return result_max, result_min, total / count
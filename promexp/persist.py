@@ -0,0 +1,115 @@
+__all__ = ["StateFile"]
+
+import os
+import json
+import mmap
+import zlib
+import struct
+
+from nxtools import *
+
+MAGIC = b"NPS1"
+HEADER = struct.Struct("<4sQII")
+
+
+class StateFile(object):
+    """Small JSON state kept in a memory-mapped file.
+
+    The file consists of two equally sized slots, each with a header
+    (magic, sequence number, payload length, CRC32) and a payload.
+    save() writes the slot not holding the latest state and flushes
+    the mapping, so an interrupted write never damages the previous
+    state. load() uses the valid slot with the higher sequence number.
+
+    When the state outgrows a slot, the file is rebuilt with larger
+    slots in a temporary file, which then atomically replaces it.
+    """
+
+    def __init__(self, path, slot_size=16384):
+        self.path = path
+        self.slot_size = slot_size
+        self.sequence = 0
+        self.payload = None
+        self.map = None
+        self.data = self.load()
+
+    def load(self):
+        """Returns the latest valid state or an empty dict"""
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            return {}
+        except OSError as e:
+            logging.error("Unable to read state file {}: {}".format(self.path, e))
+            return {}
+
+        slot_size = len(raw) // 2
+        latest = None
+        for offset in [0, slot_size]:
+            if slot_size < HEADER.size:
+                break
+            magic, sequence, length, crc = HEADER.unpack_from(raw, offset)
+            payload = raw[offset + HEADER.size:offset + HEADER.size + length]
+            if magic != MAGIC or length > slot_size - HEADER.size or zlib.crc32(payload) != crc:
+                continue
+            if latest is None or sequence > latest[0]:
+                latest = sequence, payload
+
+        if latest is None:
+            logging.warning("State file {} contains no valid state".format(self.path))
+            return {}
+        try:
+            data = json.loads(latest[1].decode("utf-8"))
+        except ValueError as e:
+            logging.error("Unable to parse state file {}: {}".format(self.path, e))
+            return {}
+        self.sequence, self.payload = latest
+        self.slot_size = max(self.slot_size, slot_size)
+        return data
+
+    def open(self):
+        with open(self.path, "r+b") as f:
+            self.map = mmap.mmap(f.fileno(), 2 * self.slot_size)
+
+    def rebuild(self, payload):
+        """Writes a new file with both slots containing the payload"""
+        if self.map is not None:
+            self.map.close()
+            self.map = None
+        while HEADER.size + len(payload) > self.slot_size:
+            self.slot_size *= 2
+        slot = HEADER.pack(MAGIC, self.sequence, len(payload), zlib.crc32(payload)) + payload
+        slot += bytes(self.slot_size - len(slot))
+        dirname = os.path.dirname(self.path)
+        if dirname and not os.path.exists(dirname):
+            os.makedirs(dirname)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "wb") as f:
+            f.write(slot * 2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.path)
+        self.open()
+
+    def save(self, data):
+        """Stores the state. Returns False if it did not change since the last save."""
+        payload = json.dumps(data, separators=(",", ":"), sort_keys=True).encode("utf-8")
+        if payload == self.payload:
+            return False
+        self.sequence += 1
+        if self.map is None or HEADER.size + len(payload) > self.slot_size:
+            self.rebuild(payload)
+        else:
+            offset = (self.sequence % 2) * self.slot_size
+            end = offset + HEADER.size + len(payload)
+            self.map[offset + HEADER.size:end] = payload
+            self.map[offset:offset + HEADER.size] = HEADER.pack(MAGIC, self.sequence, len(payload), zlib.crc32(payload))
+            self.map.flush()
+        self.payload = payload
+        return True
+
+    def close(self):
+        if self.map is not None:
+            self.map.close()
+            self.map = None
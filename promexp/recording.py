@@ -0,0 +1,60 @@
+__all__ = ["OscRecordWriter", "read_recording"]
+
+import socket
+import struct
+
+MAGIC = b"OSCREC1\n"
+HEADER = struct.Struct("<d")
+RECORD = struct.Struct("<I4sH")
+MAX_DELAY = 2**32 - 1
+
+
+class OscRecordWriter(object):
+    """Writes received OSC datagrams to a compact binary log.
+
+    The file starts with a magic string and the start time (double).
+    Every record is the delay since the previous record in microseconds
+    (uint32), the IPv4 source address (4 bytes, zeros for other address
+    families), the datagram length (uint16) and the datagram itself.
+    """
+
+    def __init__(self, path, start_time):
+        self.file = open(path, "wb")
+        self.file.write(MAGIC + HEADER.pack(start_time))
+        self.clock = int(start_time * 1000000)
+        self.count = 0
+        self.size = 0
+
+    def write(self, data, client_address, timestamp):
+        now = int(timestamp * 1000000)
+        delay = min(MAX_DELAY, max(0, now - self.clock))
+        self.clock += delay
+        try:
+            source = socket.inet_aton(client_address[0])
+        except OSError:
+            source = bytes(4)
+        self.file.write(RECORD.pack(delay, source, len(data)))
+        self.file.write(data)
+        self.count += 1
+        self.size += RECORD.size + len(data)
+
+    def close(self):
+        self.file.close()
+
+
+def read_recording(path):
+    """Yields (timestamp, client_address, data) of records written by OscRecordWriter"""
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError("{} is not an OSC recording".format(path))
+        clock = int(HEADER.unpack(f.read(HEADER.size))[0] * 1000000)
+        while True:
+            head = f.read(RECORD.size)
+            if len(head) < RECORD.size:
+                return
+            delay, source, length = RECORD.unpack(head)
+            data = f.read(length)
+            if len(data) < length:
+                return
+            clock += delay
+            yield clock / 1000000, (socket.inet_ntoa(source), 0), data
@@ -0,0 +1,73 @@
+__all__ = ["MetricRegistry"]
+
+from .common import HOSTNAME
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+
+
+class MetricRegistry():
+    """Renders metrics in the Prometheus text exposition format.
+
+    The `prefix_name{labels} ` part of each series is formatted, escaped
+    and encoded only once and then reused for every scrape. Values are
+    appended to a single buffer, which is reused between scrapes.
+
+    Cached prefixes are dropped when the global tags (prefix, hostname,
+    settings tags) change. Call begin() before and finish() after adding
+    samples. The registry is not thread safe.
+    """
+
+    def __init__(self, settings, max_series=50000):
+        self.settings = settings
+        self.max_series = max_series
+        self.series = {}
+        self.global_tags = None
+        self.buffer = bytearray()
+
+    def begin(self):
+        global_tags = (
+                self.settings.get("prefix"),
+                self.settings.get("hostname") or HOSTNAME,
+                tuple(self.settings["tags"].items())
+            )
+        if global_tags != self.global_tags or len(self.series) > self.max_series:
+            self.series = {}
+            self.global_tags = global_tags
+        del self.buffer[:]
+
+    def render_prefix(self, name, tags):
+        prefix, hostname, global_tags = self.global_tags
+        tags = dict(tags)
+        tags["hostname"] = hostname
+        tags.update(global_tags)
+        result = "{}_{}".format(prefix, name) if prefix else name
+        result += "{"
+        result += ", ".join(["{}=\"{}\"".format(k, escape_label(v)) for k, v in tags.items()])
+        result += "} "
+        return result.encode("utf-8")
+
+    def add(self, name, value, **tags):
+        key = (name, *tags.items())
+        try:
+            prefix = self.series[key]
+        except KeyError:
+            prefix = self.series[key] = self.render_prefix(name, tags)
+        self.buffer += prefix
+        self.buffer += str(value).encode("ascii")
+        self.buffer += b"\n"
+
+    def add_histogram(self, name, bounds, counts, total, **tags):
+        """Adds _bucket, _sum and _count series. `counts` are per bucket, the last one is +Inf"""
+        count = 0
+        for bound, value in zip(bounds, counts):
+            count += value
+            self.add(name + "_bucket", count, **tags, le=bound)
+        count += counts[-1]
+        self.add(name + "_bucket", count, **tags, le="+Inf")
+        self.add(name + "_sum", total, **tags)
+        self.add(name + "_count", count, **tags)
+
+    def finish(self):
+        return bytes(self.buffer)
@@ -0,0 +1,104 @@
+__all__ = ["ResponseCache", "CachedResponse"]
+
+import gzip
+import zlib
+
+from .singleflight import SingleFlight
+
+
+class CachedResponse():
+    """Rendered /metrics body of one snapshot generation.
+
+    Both identity and gzip representations are kept, so every scraper
+    within the same generation is served the same pre-compressed bytes.
+    """
+
+    def __init__(self, generation, body):
+        self.generation = generation
+        self.body = body
+        self.gzip_body = gzip.compress(body, compresslevel=6, mtime=0)
+        self.etag = "\"{:x}-{:08x}\"".format(generation, zlib.crc32(body))
+        self.gzip_etag = self.etag[:-1] + "-gz\""
+
+    def get(self, accept_encoding=""):
+        """Returns (body, etag, content_encoding) for given Accept-Encoding header"""
+        if accepts_gzip(accept_encoding):
+            return self.gzip_body, self.gzip_etag, "gzip"
+        return self.body, self.etag, None
+
+
+def parse_qvalue(params):
+    """Returns q-value of Accept-Encoding coding parameters. Missing or invalid q is 1."""
+    for param in params.split(";"):
+        name, _, value = param.partition("=")
+        if name.strip().lower() != "q":
+            continue
+        try:
+            return float(value.strip())
+        except ValueError:
+            return 1
+    return 1
+
+
+def accepts_gzip(accept_encoding):
+    """Returns True if Accept-Encoding allows gzip. An explicit gzip entry overrides `*`."""
+    gzip_q = None
+    any_q = None
+    for coding in (accept_encoding or "").split(","):
+        coding, _, params = coding.partition(";")
+        coding = coding.strip().lower()
+        if coding == "gzip":
+            gzip_q = max(gzip_q or 0, parse_qvalue(params))
+        elif coding == "*":
+            any_q = max(any_q or 0, parse_qvalue(params))
+    if gzip_q is not None:
+        return gzip_q > 0
+    return bool(any_q and any_q > 0)
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+class ResponseCache():
+    """Renders the metrics body once per snapshot generation.
+
+    `render` returns the body bytes, `get_generation` returns the current
+    snapshot generation. The body is rendered again only when the
+    generation changes. Requests arriving while a generation is being
+    rendered wait for that render instead of starting their own.
+    """
+
+    def __init__(self, render, get_generation):
+        self.render = render
+        self.get_generation = get_generation
+        self.response = None
+        self.flight = SingleFlight()
+        self.cached = 0
+
+    def build(self, generation):
+        response = self.response
+        if response and response.generation == generation:
+            return response
+        response = CachedResponse(generation, self.render())
+        if not self.response or self.response.generation < generation:
+            self.response = response
+        return response
+
+    def get(self):
+        generation = self.get_generation()
+        response = self.response
+        if response and response.generation == generation:
+            self.cached += 1
+            return response
+        return self.flight.do(generation, lambda: self.build(generation))
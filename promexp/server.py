@@ -0,0 +1,190 @@
+__all__ = ["MetricsRequestHandler", "PooledHTTPServer"]
+
+import time
+import queue
+import socket
+import selectors
+import _thread
+import threading
+import traceback
+
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from nxtools import *
+
+from .response import etag_matches
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        self.timeout = getattr(self.server, "request_timeout", None)
+        super().setup()
+        # Headers and body are written separately. Without TCP_NODELAY, the body
+        # of a keep-alive response waits for the client's delayed ACK.
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_request(self, code):
+        logging.debug("HTTP request {} finished with status {}".format(self.path, code))
+
+    def log_message(self, format, *args):
+        logging.debug("HTTP: {}".format(format % args))
+
+    def make_response(self, data, status=200, mime="text/txt", headers={}):
+        if type(data) == str:
+            data = data.encode("utf-8")
+        self.send_response(status)
+        self.send_header('Content-type', mime)
+        self.send_header('Content-length', len(data))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_metrics(self, response):
+        body, etag, encoding = response.get(self.headers.get("Accept-Encoding"))
+        headers = {"ETag" : etag, "Vary" : "Accept-Encoding"}
+        if etag_matches(self.headers.get("If-None-Match"), etag):
+            self.send_response(304)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.end_headers()
+            return
+        if encoding:
+            headers["Content-Encoding"] = encoding
+        self.make_response(body, mime="text/plain; version=0.0.4; charset=utf-8", headers=headers)
+
+    def do_GET(self):
+        if self.path.startswith("/metrics"):
+            try:
+                response = self.server.parent.metrics.response()
+            except Exception:
+                self.make_response("Unable to get metrics\n\n{}".format(traceback.format_exc()), 500)
+                return
+            self.send_metrics(response)
+            return
+        elif self.path.startswith("/shutdown"):
+            logging.warning("Shutdown requested")
+            self.server.should_run = False
+            self.close_connection = True
+            self.make_response("Shutting down\n")
+            return
+
+        self.make_response(self.server.parent.get_info)
+
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server handling requests in a bounded pool of threads.
+
+    A worker handles one request at a time, so one slow client does not
+    block other scrapers. Between requests, idle HTTP/1.1 keep-alive
+    connections are watched by a selector thread instead of occupying
+    a worker, and are queued again when the next request arrives.
+    Connections idle for `request_timeout` seconds, which is also the
+    socket read/write timeout, are closed. Connections over
+    `max_connections` (handled, queued and idle) are closed immediately.
+    """
+
+    def __init__(self, server_address, handler_class, workers=8, max_connections=32, request_timeout=30):
+        super().__init__(server_address, handler_class)
+        self.request_timeout = request_timeout
+        self.queue = queue.Queue()
+        self.idle = queue.Queue()
+        self.connections = threading.BoundedSemaphore(max_connections)
+        self.rejected = 0
+        self.selector = selectors.DefaultSelector()
+        self.wakeup_receiver, self.wakeup_sender = socket.socketpair()
+        self.wakeup_receiver.setblocking(False)
+        self.selector.register(self.wakeup_receiver, selectors.EVENT_READ)
+        for i in range(workers):
+            _thread.start_new_thread(self.worker, ())
+        _thread.start_new_thread(self.watch_idle, ())
+
+    def process_request(self, request, client_address):
+        if not self.connections.acquire(blocking=False):
+            self.rejected += 1
+            logging.warning("HTTP: too many connections, rejecting {}".format(client_address[0]))
+            self.shutdown_request(request)
+            return
+        # The handler is set up once per connection. Its buffered rfile
+        # and wfile are kept between requests.
+        handler = self.RequestHandlerClass.__new__(self.RequestHandlerClass)
+        handler.request = request
+        handler.client_address = client_address
+        handler.server = self
+        try:
+            handler.setup()
+        except OSError:
+            self.shutdown_request(request)
+            self.connections.release()
+            return
+        self.queue.put(handler)
+
+    def worker(self):
+        while True:
+            handler = self.queue.get()
+            try:
+                handler.close_connection = True
+                handler.handle_one_request()
+                keep_alive = not handler.close_connection
+            except Exception:
+                self.handle_error(handler.request, handler.client_address)
+                keep_alive = False
+            if not keep_alive:
+                self.close_connection(handler)
+            elif self.has_buffered_request(handler):
+                self.queue.put(handler)
+            else:
+                self.idle.put(handler)
+                self.wakeup_sender.send(b"\0")
+
+    def has_buffered_request(self, handler):
+        """Returns True if the next (pipelined) request is already in the handler's read buffer"""
+        handler.request.settimeout(0)
+        try:
+            return bool(handler.rfile.peek(1))
+        except OSError:
+            return False
+        finally:
+            handler.request.settimeout(self.request_timeout)
+
+    def watch_idle(self):
+        """Queues idle keep-alive connections when they become readable, closes expired ones"""
+        while True:
+            while True:
+                try:
+                    handler = self.idle.get_nowait()
+                except queue.Empty:
+                    break
+                self.selector.register(handler.request, selectors.EVENT_READ, (handler, time.monotonic()))
+
+            for key, events in self.selector.select(timeout=1):
+                if key.fileobj is self.wakeup_receiver:
+                    try:
+                        self.wakeup_receiver.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                self.selector.unregister(key.fileobj)
+                self.queue.put(key.data[0])
+
+            deadline = time.monotonic() - self.request_timeout
+            for key in list(self.selector.get_map().values()):
+                if key.data is not None and key.data[1] < deadline:
+                    self.selector.unregister(key.fileobj)
+                    self.close_connection(key.data[0])
+
+    def close_connection(self, handler):
+        try:
+            handler.finish()
+        except Exception:
+            pass
+        self.shutdown_request(handler.request)
+        self.connections.release()
+
+    def handle_error(self, request, client_address):
+        logging.debug("HTTP: connection from {} failed: {}".format(
+            client_address[0],
+            traceback.format_exc().strip().split("\n")[-1])
+        )
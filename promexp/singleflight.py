@@ -0,0 +1,53 @@
+__all__ = ["SingleFlight"]
+
+import threading
+
+
+class SingleFlightCall():
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight():
+    """Coalesces concurrent calls with the same key onto one execution.
+
+    The first caller of a key runs the function, callers arriving while
+    it is in progress wait for it and share its result (or exception).
+    `fresh` and `coalesced` count both kinds of calls.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.fresh = 0
+        self.coalesced = 0
+
+    def do(self, key, func):
+        with self.lock:
+            call = self.calls.get(key)
+            if call is None:
+                call = self.calls[key] = SingleFlightCall()
+                self.fresh += 1
+                leader = True
+            else:
+                self.coalesced += 1
+                leader = False
+
+        if not leader:
+            call.event.wait()
+            if call.error:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func()
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self.lock:
+                del self.calls[key]
+            call.event.set()
+        return call.result
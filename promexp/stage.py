@@ -0,0 +1,141 @@
+__all__ = ["StageStore", "LayerState"]
+
+import sys
+import time
+
+
+class LayerState(object):
+    """State of one CasparCG layer.
+
+    Values of known OSC keys are stored in fixed slots (first argument
+    of the message, or both arguments for time pairs). Other keys go to
+    the `extra` dict, which is created only when needed.
+    """
+
+    __slots__ = [
+            "fg_name",
+            "fg_path",
+            "fg_time",
+            "fg_duration",
+            "fg_fps",
+            "fg_paused",
+            "fg_producer",
+            "bg_name",
+            "bg_producer",
+            "profiler_real",
+            "profiler_expected",
+            "updated_at",
+            "extra",
+        ]
+
+    def __init__(self, updated_at=0):
+        self.fg_name = None
+        self.fg_path = None
+        self.fg_time = 0
+        self.fg_duration = 0
+        self.fg_fps = 0
+        self.fg_paused = False
+        self.fg_producer = None
+        self.bg_name = None
+        self.bg_producer = None
+        self.profiler_real = 0
+        self.profiler_expected = 0
+        self.updated_at = updated_at
+        self.extra = None
+
+
+LAYER_SLOTS = {
+        "foreground/file/name" : ("fg_name",),
+        "foreground/file/path" : ("fg_path",),
+        "foreground/file/time" : ("fg_time", "fg_duration"),
+        "foreground/file/fps" : ("fg_fps",),
+        "foreground/paused" : ("fg_paused",),
+        "foreground/producer" : ("fg_producer",),
+        "background/file/name" : ("bg_name",),
+        "background/producer" : ("bg_producer",),
+        "profiler/time" : ("profiler_real", "profiler_expected"),
+    }
+
+
+class StageStore(object):
+    """Per channel/layer state received from CasparCG /channel/*/stage/layer/* messages.
+
+    Parsed addresses are cached, so an update does not split or
+    allocate anything. Layers which did not receive any message
+    for `max_age` seconds are evicted by tick().
+
+    update() does not read the time: layers are stamped with the clock
+    set by the last tick(). The owner calls tick() from per-frame
+    channel messages (CasparMetricsProvider: output/consume_time,
+    framerate and channel profiler/time), so a server sending none of
+    them never evicts layers.
+
+    Used only from the thread running OSC handlers.
+    """
+
+    def __init__(self, max_age=10, max_addresses=50000):
+        self.max_age = max_age
+        self.max_addresses = max_addresses
+        self.layers = {}
+        self.addresses = {}
+        self.layer_keys = {}
+        self.clock = time.time()
+        self.evicted_at = 0
+
+    def parse_address(self, address):
+        """Returns ((id_channel, id_layer), key, slots) or None for an invalid address"""
+        elements = address.split("/")
+        try:
+            id_channel = int(elements[2])
+            id_layer = int(elements[5])
+        except (IndexError, ValueError):
+            return None
+        key = sys.intern("/".join(elements[6:]))
+        layer_key = (id_channel, id_layer)
+        layer_key = self.layer_keys.setdefault(layer_key, layer_key)
+        return layer_key, key, LAYER_SLOTS.get(key)
+
+    def update(self, address, args):
+        """Stores values of one OSC message.
+
+        Returns ((id_channel, id_layer), key, slots) of the address or None for an invalid address
+        """
+        try:
+            layer_key, key, slots = self.addresses[address]
+        except KeyError:
+            parsed = self.parse_address(address)
+            if parsed is None:
+                return None
+            if len(self.addresses) >= self.max_addresses:
+                self.addresses = {}
+                self.layer_keys = {}
+            self.addresses[address] = parsed
+            layer_key, key, slots = parsed
+
+        try:
+            layer = self.layers[layer_key]
+        except KeyError:
+            layer = self.layers[layer_key] = LayerState()
+        layer.updated_at = self.clock
+
+        if slots is None:
+            if layer.extra is None:
+                layer.extra = {}
+            layer.extra[key] = args
+        else:
+            for slot, value in zip(slots, args):
+                setattr(layer, slot, value)
+        return layer_key, key, slots
+
+    def get(self, id_channel, id_layer):
+        return self.layers.get((id_channel, id_layer))
+
+    def tick(self, now):
+        """Advances the clock. Evicts stale layers at most once per second."""
+        self.clock = now
+        if now - self.evicted_at < 1:
+            return
+        self.evicted_at = now
+        deadline = now - self.max_age
+        for layer_key in [k for k, layer in self.layers.items() if layer.updated_at < deadline]:
+            del self.layers[layer_key]
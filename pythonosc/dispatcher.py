@@ -2,6 +2,7 @@
 """
 
 import collections
+import functools
 import logging
 import re
 import time
@@ -63,9 +64,24 @@ class Dispatcher(object):
     Maps OSC addresses to handler functions and invokes the correct handler when a message comes in.
     """
 
-    def __init__(self) -> None:
+    def __init__(self, cache_size: int = 4096) -> None:
+        """
+        Args:
+            cache_size: Maximum number of resolved addresses kept in the address->handlers cache
+        """
         self._map = collections.defaultdict(list)
+        self._patterns = {}
         self._default_handler = None
+        self._cache_size = cache_size
+        self._invalidate()
+
+    def _invalidate(self) -> None:
+        """Drops resolved addresses after the mapping has changed.
+
+        A new cache object is created rather than cleared, so a resolution running
+        concurrently with the change cannot store a stale result into the new cache.
+        """
+        self._resolve_cached = functools.lru_cache(maxsize=self._cache_size)(self._resolve)
 
     def map(self, address: str, handler: FunctionType, *args: Union[Any, List[Any]],
             needs_reply_address: bool = False) -> Handler:
@@ -95,6 +111,9 @@ class Dispatcher(object):
         # regarding multiple mappings
         handlerobj = Handler(handler, list(args), needs_reply_address)
         self._map[address].append(handlerobj)
+        if '*' in address and address not in self._patterns:
+            self._patterns[address] = re.compile(address.replace('*', '[^/]*?/*'))
+        self._invalidate()
         return handlerobj
 
     @overload
@@ -132,6 +151,8 @@ class Dispatcher(object):
         except ValueError as e:
             if str(e) == "list.remove(x): x not in list":
                 raise ValueError("Address '%s' doesn't have handler '%s' mapped to it" % (address, handler)) from e
+        finally:
+            self._invalidate()
 
     def handlers_for_address(self, address_pattern: str) -> Generator[None, Handler, None]:
         """Yields handlers matching an address
@@ -143,7 +164,12 @@ class Dispatcher(object):
         Returns:
             Generator yielding Handlers matching address_pattern
         """
-        # First convert the address_pattern into a matchable regexp.
+        yield from self._resolve_cached(address_pattern)
+
+    @staticmethod
+    @functools.lru_cache(maxsize=256)
+    def _compile_address_pattern(address_pattern: str):
+        """Converts an incoming OSC address pattern into a compiled regexp."""
         # '?' in the OSC Address Pattern matches any single character.
         # Let's consider numbers and _ "characters" too here, it's not said
         # explicitly in the specification but it sounds good.
@@ -151,24 +177,34 @@ class Dispatcher(object):
         pattern = escaped_address_pattern.replace('\\?', '\\w?')
         # '*' in the OSC Address Pattern matches any sequence of zero or more
         # characters.
-        pattern = pattern.replace('\\*', '[\w|\+]*')
+        pattern = pattern.replace('\\*', r'[\w|\+]*')
         # The rest of the syntax in the specification is like the re module so
         # we're fine.
         pattern = pattern + '$'
-        patterncompiled = re.compile(pattern)
+        return re.compile(pattern)
+
+    def _resolve(self, address_pattern: str) -> Tuple[Handler, ...]:
+        """Returns all handlers matching an address, uncached."""
+        if '?' in address_pattern or '*' in address_pattern:
+            match_pattern = self._compile_address_pattern(address_pattern).match
+        else:
+            # Without wildcards, the escaped pattern only matches the same address.
+            match_pattern = address_pattern.__eq__
         matched = False
+        result = []
 
         for addr, handlers in self._map.items():
-            if (patterncompiled.match(addr)
-                    or (('*' in addr) and re.match(addr.replace('*', '[^/]*?/*'), address_pattern))):
-                yield from handlers
+            pattern = self._patterns.get(addr)
+            if match_pattern(addr) or (pattern is not None and pattern.match(address_pattern)):
+                result.extend(handlers)
                 matched = True
 
         if not matched and self._default_handler:
             logging.debug('No handler matched but default handler present, added it.')
-            yield self._default_handler
+            result.append(self._default_handler)
+        return tuple(result)
 
-    def call_handlers_for_packet(self, data: bytes, client_address: Tuple[str, int]) -> None:
+    def call_handlers_for_packet(self, data: bytes, client_address: Tuple[str, int]) -> bool:
         """Invoke handlers for all messages in OSC packet
 
         The incoming OSC Packet is decoded and the handlers for each included message is found and invoked.
@@ -176,6 +212,9 @@ class Dispatcher(object):
         Args:
             data: Data of packet
             client_address: Address of client this packet originated from
+
+        Returns:
+            False if the packet could not be parsed, True otherwise
         """
 
         # Get OSC messages from all bundles or standalone message.
@@ -183,8 +222,7 @@ class Dispatcher(object):
             packet = osc_packet.OscPacket(data)
             for timed_msg in packet.messages:
                 now = time.time()
-                handlers = self.handlers_for_address(
-                    timed_msg.message.address)
+                handlers = self._resolve_cached(timed_msg.message.address)
                 if not handlers:
                     continue
                 # If the message is to be handled later, then so be it.
@@ -193,7 +231,8 @@ class Dispatcher(object):
                 for handler in handlers:
                     handler.invoke(client_address, timed_msg.message)
         except osc_packet.ParseError:
-            pass
+            return False
+        return True
 
     def set_default_handler(self, handler: FunctionType, needs_reply_address: bool = False) -> None:
         """Sets the default handler
@@ -205,3 +244,4 @@ class Dispatcher(object):
             needs_reply_address: Whether the callback shall be passed the client address
         """
         self._default_handler = None if (handler is None) else Handler(handler, [], needs_reply_address)
+        self._invalidate()
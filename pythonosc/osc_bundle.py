@@ -47,21 +47,25 @@ class OscBundle(object):
             # The size is an int32 representing the number of 8-bit bytes in the
             # contents, and will always be a multiple of 4. The contents are either
             # an OSC Message or an OSC Bundle.
-            while self._dgram[index:]:
+            dgram = self._dgram
+            while index < len(dgram):
                 # Get the sub content size.
-                content_size, index = osc_types.get_int(self._dgram, index)
-                # Get the datagram for the sub content.
-                content_dgram = self._dgram[index:index + content_size]
-                # Increment our position index up to the next possible content.
-                index += content_size
-                # Parse the content into an OSC message or bundle.
-                if OscBundle.dgram_is_bundle(content_dgram):
-                    contents.append(OscBundle(content_dgram))
-                elif osc_message.OscMessage.dgram_is_message(content_dgram):
-                    contents.append(osc_message.OscMessage(content_dgram))
+                content_size, index = osc_types.get_int(dgram, index)
+                # Like slicing, a content size past the datagram is clamped to its end.
+                end_index = min(index + max(content_size, 0), len(dgram))
+                # Parse the content into an OSC message or bundle. Messages are parsed
+                # in place, nested bundles get their own copy of the datagram.
+                if index == end_index:
+                    logging.warning("Empty content in dgram %s" % dgram)
+                elif dgram.startswith(_BUNDLE_PREFIX, index, end_index):
+                    contents.append(OscBundle(dgram[index:end_index]))
+                elif dgram.startswith(b"/", index, end_index):
+                    contents.append(osc_message.OscMessage.from_buffer(dgram, index, end_index))
                 else:
                     logging.warning(
-                        "Could not identify content type of dgram %s" % content_dgram)
+                        "Could not identify content type of dgram %s" % dgram[index:end_index])
+                # Increment our position index up to the next possible content.
+                index = end_index
         except (osc_types.ParseError, osc_message.ParseError, IndexError) as e:
             raise ParseError("Could not parse a content datagram: %s" % e)
 
@@ -10,6 +10,20 @@ class ParseError(Exception):
     """Base exception raised when a datagram parsing error occurs."""
 
 
+# Parsers of parameter types which are read from the datagram, by type tag.
+_PARAM_GETTERS = {
+    "i": osc_types.get_int,  # Integer.
+    "h": osc_types.get_int,  # Integer.
+    "f": osc_types.get_float,  # Float.
+    "d": osc_types.get_double,  # Double.
+    "s": osc_types.get_string,  # String.
+    "b": osc_types.get_blob,  # Blob.
+    "r": osc_types.get_rgba,  # RGBA.
+    "m": osc_types.get_midi,  # MIDI.
+    "t": osc_types.get_timetag,  # osc time tag.
+}
+
+
 class OscMessage(object):
     """Representation of a parsed datagram representing an OSC message.
 
@@ -19,18 +33,40 @@ class OscMessage(object):
 
     def __init__(self, dgram: bytes) -> None:
         self._dgram = dgram
+        self._start = 0
+        self._end = len(dgram)
         self._parameters = []
         self._parse_datagram()
 
+    @classmethod
+    def from_buffer(cls, buffer: bytes, start_index: int, end_index: int) -> 'OscMessage':
+        """Parses a message stored in buffer[start_index:end_index] without copying it.
+
+        Used for the elements of OSC bundles. The datagram of the message is only
+        sliced out of the buffer when the ``dgram`` property is accessed.
+
+        Raises:
+          ParseError if the datagram could not be parsed.
+        """
+        message = cls.__new__(cls)
+        message._dgram = buffer
+        message._start = start_index
+        message._end = end_index
+        message._parameters = []
+        message._parse_datagram()
+        return message
+
     def _parse_datagram(self) -> None:
+        dgram = self._dgram
+        end = self._end
         try:
-            self._address_regexp, index = osc_types.get_string(self._dgram, 0)
-            if not self._dgram[index:]:
+            self._address_regexp, index = osc_types.get_string(dgram, self._start)
+            if index >= end:
                 # No params is legit, just return now.
                 return
 
             # Get the parameters types.
-            type_tag, index = osc_types.get_string(self._dgram, index)
+            type_tag, index = osc_types.get_string(dgram, index)
             if type_tag.startswith(','):
                 type_tag = type_tag[1:]
 
@@ -38,24 +74,9 @@ class OscMessage(object):
             param_stack = [params]
             # Parse each parameter given its type.
             for param in type_tag:
-                if param == "i":  # Integer.
-                    val, index = osc_types.get_int(self._dgram, index)
-                elif param == "h":  # Integer.
-                    val, index = osc_types.get_int(self._dgram, index)
-                elif param == "f":  # Float.
-                    val, index = osc_types.get_float(self._dgram, index)
-                elif param == "d":  # Double.
-                    val, index = osc_types.get_double(self._dgram, index)
-                elif param == "s":  # String.
-                    val, index = osc_types.get_string(self._dgram, index)
-                elif param == "b":  # Blob.
-                    val, index = osc_types.get_blob(self._dgram, index)
-                elif param == "r":  # RGBA.
-                    val, index = osc_types.get_rgba(self._dgram, index)
-                elif param == "m":  # MIDI.
-                    val, index = osc_types.get_midi(self._dgram, index)
-                elif param == "t":  # osc time tag:
-                    val, index = osc_types.get_timetag(self._dgram, index)
+                getter = _PARAM_GETTERS.get(param)
+                if getter is not None:
+                    val, index = getter(dgram, index)
                 elif param == "T":  # True.
                     val = True
                 elif param == "F":  # False.
@@ -64,18 +85,22 @@ class OscMessage(object):
                     array = []
                     param_stack[-1].append(array)
                     param_stack.append(array)
+                    continue
                 elif param == "]":  # Array stop.
                     if len(param_stack) < 2:
                         raise ParseError('Unexpected closing bracket in type tag: {0}'.format(type_tag))
                     param_stack.pop()
+                    continue
                 # TODO: Support more exotic types as described in the specification.
                 else:
                     logging.warning('Unhandled parameter type: {0}'.format(param))
                     continue
-                if param not in "[]":
-                    param_stack[-1].append(val)
+                param_stack[-1].append(val)
             if len(param_stack) != 1:
                 raise ParseError('Missing closing bracket in type tag: {0}'.format(type_tag))
+            if index > end and end < len(dgram):
+                # Message inside a larger buffer (bundle element) read past its own end.
+                raise ParseError('Message is longer than its bundle element')
             self._parameters = params
         except osc_types.ParseError as pe:
             raise ParseError('Found incorrect datagram, ignoring it', pe)
@@ -93,12 +118,14 @@ class OscMessage(object):
     @property
     def size(self) -> int:
         """Returns the length of the datagram for this message."""
-        return len(self._dgram)
+        return self._end - self._start
 
     @property
     def dgram(self) -> bytes:
         """Returns the datagram from which this message was built."""
-        return self._dgram
+        if self._start == 0 and self._end == len(self._dgram):
+            return self._dgram
+        return self._dgram[self._start:self._end]
 
     @property
     def params(self) -> List[Any]:
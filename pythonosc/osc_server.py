@@ -3,8 +3,13 @@
 
 import asyncio
 import os
+import queue
+import select
+import socket
 import socketserver
+import threading
 
+from nxtools import logging
 from pythonosc import osc_bundle
 from pythonosc import osc_message
 from pythonosc.dispatcher import Dispatcher
@@ -98,6 +103,128 @@ if hasattr(os, "fork"):
         """
 
 
+class BatchingOSCUDPServer():
+    """OSC UDP server draining the socket in batches.
+
+    A receiver thread waits until the socket is readable and then reads up to
+    ``batch_size`` datagrams without blocking, handing them over as one batch
+    through a bounded queue to the thread running the dispatcher. When the queue
+    is full, the batch is dropped and counted instead of blocking the receiver,
+    so the kernel receive buffer keeps being drained.
+
+    Counters (``received``, ``parsed``, ``invalid``, ``dropped``) are only
+    incremented by a single thread each. A datagram whose handler raises is
+    counted as invalid and the error is logged (throttled), so one bad
+    datagram does not stop the dispatcher thread.
+    """
+
+    def __init__(self, server_address: Tuple[str, int], dispatcher: Dispatcher, rcvbuf: int = None,
+                 batch_size: int = 256, queue_size: int = 1024) -> None:
+        """Initialize
+
+        Args:
+            server_address: IP and port of server
+            dispatcher: Dispatcher this server will use
+            rcvbuf: Requested size of the socket receive buffer (SO_RCVBUF) in bytes
+            batch_size: Maximum number of datagrams read per wakeup
+            queue_size: Maximum number of batches waiting for the dispatcher
+        """
+        self._dispatcher = dispatcher
+        self._batch_size = batch_size
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._should_run = True
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        if rcvbuf:
+            self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        self.socket.bind(server_address)
+        self.socket.setblocking(False)
+        self.server_address = self.socket.getsockname()
+        self.received = 0
+        self.parsed = 0
+        self.invalid = 0
+        self.dropped = 0
+
+    @property
+    def dispatcher(self) -> Dispatcher:
+        return self._dispatcher
+
+    @property
+    def rcvbuf(self) -> int:
+        """Returns the actual size of the socket receive buffer."""
+        return self.socket.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+    def receive_batch(self, timeout: float = 0.5) -> List[Tuple[bytes, Tuple[str, int]]]:
+        """Waits for the socket to become readable and reads all pending datagrams, up to batch_size."""
+        batch = []
+        readable, _, _ = select.select([self.socket], [], [], timeout)
+        if not readable:
+            return batch
+        recvfrom = self.socket.recvfrom
+        for _ in range(self._batch_size):
+            try:
+                batch.append(recvfrom(65535))
+            except (BlockingIOError, InterruptedError):
+                break
+        return batch
+
+    def dispatch_batch(self, batch: List[Tuple[bytes, Tuple[str, int]]]) -> None:
+        """Parses datagrams of a batch and invokes their handlers."""
+        for data, client_address in batch:
+            if not _is_valid_request([data]):
+                self.invalid += 1
+                continue
+            try:
+                result = self._dispatcher.call_handlers_for_packet(data, client_address)
+            except Exception as e:
+                self.invalid += 1
+                logging.throttle.error(
+                    ("osc_handler", client_address[0], type(e)),
+                    "OSC handler failed for datagram from {}: {!r}".format(client_address[0], e)
+                )
+                continue
+            if result is False:
+                self.invalid += 1
+            else:
+                self.parsed += 1
+
+    def _dispatch_forever(self) -> None:
+        while True:
+            batch = self._queue.get()
+            if batch is None:
+                break
+            self.dispatch_batch(batch)
+
+    def serve_forever(self) -> None:
+        """Receives datagrams until shutdown() is called. Handlers run on a separate thread."""
+        dispatch_thread = threading.Thread(target=self._dispatch_forever, daemon=True)
+        dispatch_thread.start()
+        try:
+            while self._should_run:
+                try:
+                    batch = self.receive_batch()
+                except OSError:
+                    if not self._should_run:
+                        break
+                    raise
+                if not batch:
+                    continue
+                self.received += len(batch)
+                try:
+                    self._queue.put_nowait(batch)
+                except queue.Full:
+                    self.dropped += len(batch)
+        finally:
+            self._queue.put(None)
+            dispatch_thread.join()
+
+    def shutdown(self) -> None:
+        """Stops serve_forever() within its select timeout."""
+        self._should_run = False
+
+    def server_close(self) -> None:
+        self.socket.close()
+
+
 class AsyncIOOSCUDPServer():
     """Asynchronous OSC Server
 
@@ -117,15 +244,26 @@ class AsyncIOOSCUDPServer():
         self._server_address = server_address
         self._dispatcher = dispatcher
         self._loop = loop
+        self.received = 0
+        self.parsed = 0
+        self.invalid = 0
+        self.dropped = 0
 
     class _OSCProtocolFactory(asyncio.DatagramProtocol):
         """OSC protocol factory which passes datagrams to dispatcher"""
 
-        def __init__(self, dispatcher: Dispatcher) -> None:
+        def __init__(self, dispatcher: Dispatcher, server: "AsyncIOOSCUDPServer" = None) -> None:
             self.dispatcher = dispatcher
+            self.server = server
 
         def datagram_received(self, data: bytes, client_address: Tuple[str, int]) -> None:
-            self.dispatcher.call_handlers_for_packet(data, client_address)
+            result = self.dispatcher.call_handlers_for_packet(data, client_address)
+            if self.server is not None:
+                self.server.received += 1
+                if result is False:
+                    self.server.invalid += 1
+                else:
+                    self.server.parsed += 1
 
     def serve(self) -> None:
         """Creates a datagram endpoint and registers it with event loop.
@@ -142,7 +280,7 @@ class AsyncIOOSCUDPServer():
             Awaitable coroutine that returns transport and protocol objects
         """
         return self._loop.create_datagram_endpoint(
-            lambda: self._OSCProtocolFactory(self.dispatcher),
+            lambda: self._OSCProtocolFactory(self.dispatcher, self),
             local_addr=self._server_address)
 
     @property
@@ -149,6 +149,40 @@ class TestDispatcher(unittest.TestCase):
         with self.assertRaises(ValueError) as context:
             self.dispatcher.unmap("/unmap/exception", handlerobj)
 
+    def test_map_after_resolution_invalidates_cache(self):
+        self.dispatcher.map('/foo/bar', 1)
+        self.sortAndAssertSequenceEqual(
+            [Handler(1, [])], self.dispatcher.handlers_for_address("/foo/bar"))
+        self.dispatcher.map('/foo/*', 2)
+        self.sortAndAssertSequenceEqual(
+            [Handler(1, []), Handler(2, [])], self.dispatcher.handlers_for_address("/foo/bar"))
+
+    def test_default_handler_after_resolution_invalidates_cache(self):
+        self.sortAndAssertSequenceEqual([], self.dispatcher.handlers_for_address("/test"))
+        self.dispatcher.set_default_handler(1)
+        self.sortAndAssertSequenceEqual([Handler(1, [])], self.dispatcher.handlers_for_address("/test"))
+        self.dispatcher.set_default_handler(None)
+        self.sortAndAssertSequenceEqual([], self.dispatcher.handlers_for_address("/test"))
+
+    def test_map_caspar_layer_prefix(self):
+        self.dispatcher.map('/channel/*/stage/layer/*/', 1)
+        self.dispatcher.map('/channel/*/framerate', 2)
+        self.sortAndAssertSequenceEqual(
+            [Handler(1, [])],
+            self.dispatcher.handlers_for_address("/channel/1/stage/layer/10/foreground/file/time"))
+        self.sortAndAssertSequenceEqual(
+            [Handler(2, [])], self.dispatcher.handlers_for_address("/channel/2/framerate"))
+        self.sortAndAssertSequenceEqual(
+            [], self.dispatcher.handlers_for_address("/channel/2/mixer/audio/1/pFS"))
+
+    def test_cache_size_is_bounded(self):
+        dispatcher = Dispatcher(cache_size=2)
+        dispatcher.map('/foo/*', 1)
+        for i in range(10):
+            self.sortAndAssertSequenceEqual(
+                [Handler(1, [])], dispatcher.handlers_for_address("/foo/{}".format(i)))
+        self.assertEqual(2, dispatcher._resolve_cached.cache_info().currsize)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -125,6 +125,15 @@ class TestOscBundle(unittest.TestCase):
     def test_unknown_type(self):
         bundle = osc_bundle.OscBundle(_DGRAM_UNKNOWN_TYPE)
 
+    def test_messages_parsed_in_place(self):
+        bundle = osc_bundle.OscBundle(_DGRAM_TWO_MESSAGES_IN_BUNDLE)
+        first, second = bundle
+        self.assertEqual(b"/SYNC\x00\x00\x00,f\x00\x00?\x00\x00\x00", first.dgram)
+        self.assertEqual(16, first.size)
+        self.assertEqual(16, second.size)
+        self.assertAlmostEqual(0.5, first.params[0])
+        self.assertAlmostEqual(0.5, second.params[0])
+
 
 if __name__ == "__main__":
     unittest.main()
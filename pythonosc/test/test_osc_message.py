@@ -80,6 +80,19 @@ class TestOscMessage(unittest.TestCase):
         self.assertEqual(1, len(msg.params))
         self.assertTrue(type(msg.params[0]) == float)
 
+    def test_from_buffer(self):
+        buffer = b"garbage!" + _DGRAM_SWITCH_GOES_ON + b"garbage!"
+        msg = osc_message.OscMessage.from_buffer(buffer, 8, 8 + len(_DGRAM_SWITCH_GOES_ON))
+        self.assertEqual("/SYNC", msg.address)
+        self.assertAlmostEqual(0.5, msg.params[0])
+        self.assertEqual(_DGRAM_SWITCH_GOES_ON, msg.dgram)
+        self.assertEqual(len(_DGRAM_SWITCH_GOES_ON), msg.size)
+
+    def test_from_buffer_raises_when_reading_past_end(self):
+        buffer = _DGRAM_SWITCH_GOES_ON + b"\x00\x00\x00\x00"
+        self.assertRaises(
+            osc_message.ParseError, osc_message.OscMessage.from_buffer, buffer, 0, len(_DGRAM_SWITCH_GOES_ON) - 4)
+
     def test_no_params(self):
         msg = osc_message.OscMessage(_DGRAM_NO_PARAMS)
         self.assertEqual("/SYNC", msg.address)
@@ -1,3 +1,6 @@
+import time
+import socket
+import threading
 import unittest
 import unittest.mock
 
@@ -73,5 +76,101 @@ class TestUDPHandler(unittest.TestCase):
         mock_meth.assert_called_with("/SYNC")
 
 
+class TestBatchingOSCUDPServer(unittest.TestCase):
+    def setUp(self):
+        super().setUp()
+        self.dispatcher = dispatcher.Dispatcher()
+        self.server = osc_server.BatchingOSCUDPServer(("127.0.0.1", 0), self.dispatcher, batch_size=4)
+        self.client_address = ("127.0.0.1", 8080)
+
+    def tearDown(self):
+        self.server.server_close()
+        super().tearDown()
+
+    def test_dispatch_batch_counts(self):
+        mock_meth = unittest.mock.MagicMock()
+        self.dispatcher.map("/SYNC", mock_meth)
+        self.server.dispatch_batch([
+            (_SIMPLE_PARAM_INT_MSG, self.client_address),
+            (_SIMPLE_MSG_NO_PARAMS, self.client_address),
+            (b"junk", self.client_address),
+            (b"/SYNC\x00\x00\x00,i\x00\x00", self.client_address),
+        ])
+        self.assertEqual(2, mock_meth.call_count)
+        self.assertEqual(2, self.server.parsed)
+        self.assertEqual(2, self.server.invalid)
+
+    def test_dispatch_batch_survives_handler_errors(self):
+        failing = unittest.mock.MagicMock(side_effect=ValueError("invalid literal for int()"))
+        mock_meth = unittest.mock.MagicMock()
+        self.dispatcher.map("/SYNC", failing)
+        self.dispatcher.map("/SYNC2", mock_meth)
+        with unittest.mock.patch.object(osc_server.logging, "throttle") as throttle:
+            self.server.dispatch_batch([
+                (_SIMPLE_PARAM_INT_MSG, self.client_address),
+                (b"/SYNC2\x00\x00,\x00\x00\x00", self.client_address),
+            ])
+            self.server.dispatch_batch([(b"/SYNC2\x00\x00,\x00\x00\x00", self.client_address)])
+        self.assertEqual(1, failing.call_count)
+        self.assertEqual(2, mock_meth.call_count)
+        self.assertEqual(2, self.server.parsed)
+        self.assertEqual(1, self.server.invalid)
+        self.assertEqual(1, throttle.error.call_count)
+
+    def test_dispatcher_thread_survives_handler_errors(self):
+        mock_meth = unittest.mock.MagicMock()
+        self.dispatcher.map("/SYNC", unittest.mock.MagicMock(side_effect=ValueError))
+        self.dispatcher.map("/SYNC2", mock_meth)
+        thread = threading.Thread(target=self.server.serve_forever)
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        with unittest.mock.patch.object(osc_server.logging, "throttle"):
+            thread.start()
+            try:
+                client.sendto(_SIMPLE_PARAM_INT_MSG, self.server.server_address)
+                for i in range(3):
+                    client.sendto(b"/SYNC2\x00\x00,\x00\x00\x00", self.server.server_address)
+                deadline = time.time() + 2
+                while self.server.parsed < 3 and time.time() < deadline:
+                    time.sleep(0.01)
+            finally:
+                client.close()
+                self.server.shutdown()
+                thread.join()
+        self.assertEqual(3, self.server.parsed)
+        self.assertEqual(1, self.server.invalid)
+        self.assertEqual(3, mock_meth.call_count)
+
+    def test_receive_batch_drains_socket(self):
+        client = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        try:
+            for i in range(6):
+                client.sendto(_SIMPLE_PARAM_INT_MSG, self.server.server_address)
+            first = self.server.receive_batch(timeout=1)
+            second = self.server.receive_batch(timeout=1)
+        finally:
+            client.close()
+        self.assertEqual(4, len(first))
+        self.assertEqual(2, len(second))
+        self.assertEqual(_SIMPLE_PARAM_INT_MSG, first[0][0])
+
+    def test_receive_batch_timeout(self):
+        self.assertEqual([], self.server.receive_batch(timeout=0))
+
+
+class TestAsyncIOOSCUDPServer(unittest.TestCase):
+    def test_datagram_counts(self):
+        handler = unittest.mock.Mock()
+        d = dispatcher.Dispatcher()
+        d.map("/SYNC", handler)
+        server = osc_server.AsyncIOOSCUDPServer(("127.0.0.1", 0), d, unittest.mock.Mock())
+        protocol = server._OSCProtocolFactory(d, server)
+        protocol.datagram_received(_SIMPLE_PARAM_INT_MSG, ("127.0.0.1", 1234))
+        protocol.datagram_received(b"/SYNC", ("127.0.0.1", 1234))
+        self.assertEqual(2, server.received)
+        self.assertEqual(1, server.parsed)
+        self.assertEqual(1, server.invalid)
+        handler.assert_called_once_with("/SYNC", 4)
+
+
 if __name__ == "__main__":
     unittest.main()
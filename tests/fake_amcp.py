@@ -0,0 +1,89 @@
+"""Fake CasparCG AMCP server shared by tests and benchmarks"""
+
+import time
+import socket
+import _thread
+
+
+class FakeAmcpServer():
+    """Minimal CasparCG AMCP server answering from a dict of command responses.
+
+    `responses` maps upper-case commands to response strings (with CRLF line
+    endings). Unknown commands get "400 ERROR" followed by the command,
+    as from CasparCG 2.1+. A None response closes the connection without
+    answering the command. Every received chunk of commands is answered
+    after `delay` seconds, simulating network latency.
+    """
+
+    def __init__(self, responses, delay=0, host="127.0.0.1"):
+        self.responses = responses
+        self.delay = delay
+        self.received = []
+        self.round_trips = 0
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.bind((host, 0))
+        self.socket.listen(8)
+        self.port = self.socket.getsockname()[1]
+        _thread.start_new_thread(self.main, ())
+
+    def main(self):
+        while True:
+            try:
+                conn, addr = self.socket.accept()
+            except OSError:
+                return
+            _thread.start_new_thread(self.handle, (conn,))
+
+    def handle(self, conn):
+        buffer = b""
+        with conn:
+            while True:
+                try:
+                    data = conn.recv(65536)
+                except OSError:
+                    return
+                if not data:
+                    return
+                buffer += data
+                *commands, buffer = buffer.split(b"\r\n")
+                if not commands:
+                    continue
+                self.round_trips += 1
+                if self.delay:
+                    time.sleep(self.delay)
+                reply = ""
+                for command in commands:
+                    command = command.decode("utf-8").strip()
+                    self.received.append(command)
+                    response = self.responses.get(command.upper(), "400 ERROR\r\n{}\r\n".format(command))
+                    if response is None:
+                        conn.sendall(reply.encode("utf-8"))
+                        return
+                    reply += response
+                conn.sendall(reply.encode("utf-8"))
+
+    def close(self):
+        self.socket.close()
+
+
+def amcp_info_xml(video_mode="1080i5000"):
+    """Returns INFO [channel] response body (one CRLF terminated line, XML lines end with LF)"""
+    return "\n".join([
+            "<?xml version=\"1.0\" encoding=\"utf-8\"?>",
+            "<channel>",
+            "   <video-mode>{}</video-mode>".format(video_mode),
+            "   <stage></stage>",
+            "   <mixer></mixer>",
+            "</channel>",
+        ])
+
+
+def fake_amcp_responses(video_modes=["1080i5000", "1080p5000", "PAL", "1080p5994"]):
+    responses = {"VERSION" : "201 VERSION OK\r\n2.2.0 66a9e3e2 Stable\r\n"}
+    for id_channel, video_mode in enumerate(video_modes, 1):
+        responses["INFO {}".format(id_channel)] = "201 INFO OK\r\n{}\r\n".format(amcp_info_xml(video_mode))
+    responses["INFO"] = "200 INFO OK\r\n{}\r\n\r\n".format("\r\n".join([
+            "{} {} PLAYING".format(id_channel, video_mode)
+            for id_channel, video_mode in enumerate(video_modes, 1)
+        ]))
+    return responses
@@ -0,0 +1,116 @@
+import os
+import sys
+import unittest
+
+from nxtools import logging
+from nxtools.caspar import AmcpFramer, CasparCG
+
+from tests.fake_amcp import FakeAmcpServer, fake_amcp_responses
+
+
+def frame(data, chunk_size=None):
+    """Returns all responses framed from data fed in chunks of chunk_size bytes"""
+    framer = AmcpFramer()
+    result = []
+    chunk_size = chunk_size or len(data)
+    for i in range(0, len(data), chunk_size):
+        framer.feed(data[i:i+chunk_size])
+        while True:
+            response = framer.next()
+            if response is None:
+                break
+            result.append(response)
+    return result
+
+
+class TestAmcpFramer(unittest.TestCase):
+    STREAM = b"".join([
+            b"200 CLS OK\r\n\"AMB\"  MOVIE  1 20200101120000 1500 1/25\r\n\"GO1080P25\"  MOVIE  2 20200101120000 250 1/25\r\n\r\n",
+            b"201 VERSION OK\r\n2.2.0 66a9e3e2 Stable\r\n",
+            b"202 PLAY OK\r\n",
+            b"400 ERROR\r\nFOO 1\r\n",
+            b"200 TLS OK\r\n\r\n",
+            b"404 PLAY FAILED\r\n",
+        ])
+
+    EXPECTED = [
+            (200, "200 CLS OK", "\"AMB\"  MOVIE  1 20200101120000 1500 1/25\n\"GO1080P25\"  MOVIE  2 20200101120000 250 1/25"),
+            (201, "201 VERSION OK", "2.2.0 66a9e3e2 Stable"),
+            (202, "202 PLAY OK", None),
+            (400, "400 ERROR", "FOO 1"),
+            (200, "200 TLS OK", ""),
+            (404, "404 PLAY FAILED", None),
+        ]
+
+    def test_responses(self):
+        self.assertEqual(frame(self.STREAM), self.EXPECTED)
+
+    def test_chunked_input(self):
+        for chunk_size in [1, 2, 3, 7, 16]:
+            self.assertEqual(frame(self.STREAM, chunk_size), self.EXPECTED, chunk_size)
+
+    def test_empty_200_body(self):
+        self.assertEqual(frame(b"200 TLS OK\r\n\r\n202 PLAY OK\r\n"), [(200, "200 TLS OK", ""), (202, "202 PLAY OK", None)])
+
+    def test_400_without_command_line(self):
+        self.assertEqual(
+                frame(b"400 ERROR\r\n202 PLAY OK\r\n", 1),
+                [(400, "400 ERROR", None), (202, "202 PLAY OK", None)]
+            )
+
+    def test_incomplete_response(self):
+        framer = AmcpFramer()
+        framer.feed(b"200 CLS OK\r\nAMB\r\n")
+        self.assertIsNone(framer.next())
+        framer.feed(b"\r\n")
+        self.assertEqual(framer.next(), (200, "200 CLS OK", "AMB"))
+        self.assertIsNone(framer.next())
+
+
+class TestCasparCG(unittest.TestCase):
+    def setUp(self):
+        self.responses = fake_amcp_responses()
+        self.responses["PLAY 1-10 AMB"] = "202 PLAY OK\r\n"
+        self.server = FakeAmcpServer(self.responses)
+        self.caspar = CasparCG("127.0.0.1", self.server.port, timeout=2)
+
+    def tearDown(self):
+        self.caspar.close()
+        self.server.close()
+
+    def test_query_many_order(self):
+        queries = ["INFO 3", "VERSION", "INFO", "PLAY 1-10 AMB", "INFO 1"]
+        responses = self.caspar.query_many(queries)
+        self.assertEqual([r.code for r in responses], [201, 201, 200, 202, 201])
+        self.assertIn("<video-mode>PAL</video-mode>", responses[0].data)
+        self.assertTrue(responses[1].data.startswith("2.2.0"))
+        self.assertEqual(len(responses[2].lines), 4)
+        self.assertIn("<video-mode>1080i5000</video-mode>", responses[4].data)
+
+    def test_resync_after_error(self):
+        responses = self.caspar.query_many(["VERSION", "FOO 1", "INFO 2", "BAR", "INFO 4"])
+        self.assertEqual([r.code for r in responses], [201, 400, 201, 400, 201])
+        self.assertEqual(responses[1].data, "400 ERROR: FOO 1")
+        self.assertIn("<video-mode>1080p5000</video-mode>", responses[2].data)
+        self.assertIn("<video-mode>1080p5994</video-mode>", responses[4].data)
+        self.assertTrue(self.caspar.query("VERSION").data.startswith("2.2.0"))
+
+    def test_resync_after_disconnect(self):
+        self.responses["KILL"] = None
+        logging.file = open(os.devnull, "w")
+        try:
+            responses = self.caspar.query_many(["VERSION", "KILL", "INFO 1"])
+        finally:
+            logging.file.close()
+            logging.file = sys.stderr
+        self.assertEqual([r.code for r in responses], [500, 500, 500])
+        self.assertIsNone(self.caspar.connection)
+
+        # Next query reconnects and reads its own response
+        response = self.caspar.query("INFO 2")
+        self.assertEqual(response.code, 201)
+        self.assertIn("<video-mode>1080p5000</video-mode>", response.data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,239 @@
+import os
+import sys
+import socket
+import time
+import threading
+import unittest
+import unittest.mock
+
+from nxtools import logging
+from nxtools.logging import Logging, LogThrottle
+
+from promexp import Metrics
+from nxtools.caspar import CasparResponse
+from promexp.caspar import CasparMetricsProvider, parse_video_mode
+from promexp.common import settings
+from promexp.registry import MetricRegistry
+from pythonosc import osc_message_builder
+
+from tests.fake_amcp import FakeAmcpServer, fake_amcp_responses
+
+
+def create_provider(address):
+    provider = CasparMetricsProvider(dict(settings, caspar_host=None))
+    provider.address = address
+    return provider
+
+
+def message(address, *args):
+    builder = osc_message_builder.OscMessageBuilder(address=address)
+    for arg in args:
+        builder.add_arg(arg)
+    return builder.build().dgram
+
+
+def counters(state):
+    """Returns {key : value} of all counters of a collect() result"""
+    result = {}
+    for id_channel, layers in state["dropped"].items():
+        for layer, value in layers.items():
+            result["dropped", id_channel, layer] = value
+    for name in ["consume_time", "render_time"]:
+        for key, (counts, total) in state[name].items():
+            for i, count in enumerate(counts):
+                result[name, key, i] = count
+    result["generation"] = state["generation"]
+    return result
+
+
+class TestCasparSnapshot(unittest.TestCase):
+    def setUp(self):
+        switch_interval = sys.getswitchinterval()
+        sys.setswitchinterval(0.00001)
+        self.addCleanup(sys.setswitchinterval, switch_interval)
+        patcher = unittest.mock.patch.object(logging, "throttle", unittest.mock.Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_collect_during_osc_ingest(self, duration=1, readers=3):
+        provider = CasparMetricsProvider(dict(settings, caspar_host=None))
+        provider.fps = {id_channel : (50, 1) for id_channel in range(1, 5)}
+        provider.publish()
+        dispatcher = provider.create_dispatcher()
+
+        frames = []
+        for i in range(1000):
+            id_channel = 1 + i % 4
+            prefix = "/channel/{}/".format(id_channel)
+            frames.append([
+                    # Drop on a new layer: the drop counter dicts grow
+                    message(prefix + "stage/layer/{}/profiler/time".format(1 + i % 499), 0.03, 0.02),
+                    message(prefix + "profiler/time", 0.01, 0.02),
+                    message(prefix + "mixer/audio/{}/pFS".format(1 + i % 8), 0.5),
+                    message(prefix + "output/consume_time", 0.03 if i % 7 else 0.01),
+                ])
+
+        should_run = True
+        errors = []
+        reads = [0]
+
+        def writer():
+            i = 0
+            try:
+                while should_run:
+                    for dgram in frames[i % len(frames)]:
+                        dispatcher.call_handlers_for_packet(dgram, ("127.0.0.1", 6250))
+                    i += 1
+            except Exception as e:
+                errors.append(e)
+
+        def reader():
+            last = {}
+            while should_run:
+                try:
+                    for key, value in counters(provider.collect()).items():
+                        if value < last.get(key, 0):
+                            errors.append("{} went backwards".format(key))
+                        last[key] = value
+                except Exception as e:
+                    errors.append(e)
+                reads[0] += 1
+
+        threads = [threading.Thread(target=writer)] + [threading.Thread(target=reader) for i in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(duration)
+        should_run = False
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertGreater(reads[0], readers)
+        state = provider.collect()
+        self.assertEqual(sorted(state["dropped"]), [1, 2, 3, 4])
+        self.assertTrue(state["consume_time"] and state["render_time"] and state["peak_volume"])
+
+
+class TestCasparDiscovery(unittest.TestCase):
+    def create_provider(self, port):
+        provider = CasparMetricsProvider(dict(settings, caspar_host="127.0.0.1", amcp_port=port), threaded=False)
+        self.addCleanup(provider.caspar.close)
+        return provider
+
+    def test_parse_video_mode(self):
+        for video_mode, fps in [
+                    ("1080p2500", (25, 1)),
+                    ("2160p5994", (60000, 1001)),
+                    ("720p6000", (60, 1)),
+                    ("1080i5000", (25, 1)),
+                    ("1080i5994", (30000, 1001)),
+                    ("1080p2398", (24000, 1001)),
+                    ("PAL", (25, 1)),
+                    ("NTSC", (30000, 1001)),
+                ]:
+            self.assertEqual(parse_video_mode(video_mode), fps, video_mode)
+
+    def test_parse_unknown_video_mode(self):
+        with unittest.mock.patch.object(logging, "warning") as warning:
+            for video_mode in ["", None, "INVALID", "1080x5000"]:
+                self.assertEqual(parse_video_mode(video_mode), (25, 1), video_mode)
+        self.assertEqual(warning.call_count, 4)
+
+    def test_parse_channel_list(self):
+        provider = create_provider("10.0.0.1")
+        response = CasparResponse(200, "\n".join([
+                "1 1080i5000 PLAYING",
+                "2 2160p5994 PLAYING",
+                "",
+                "garbage",
+                "x 720p6000 PLAYING",
+                "3",
+                "4 720p6000",
+            ]))
+        self.assertEqual(provider.parse_channel_list(response), {1 : (25, 1), 2 : (60000, 1001), 4 : (60, 1)})
+        self.assertEqual(provider.parse_channel_list(CasparResponse(400, "400 ERROR: INFO")), {})
+
+    def test_bulk_info(self):
+        server = FakeAmcpServer(fake_amcp_responses(["1080i5000", "1080p2500", "2160p5994"]))
+        self.addCleanup(server.close)
+        provider = self.create_provider(server.port)
+        self.assertEqual(provider.fps, {1 : (25, 1), 2 : (25, 1), 3 : (60000, 1001)})
+        self.assertEqual(server.received, ["VERSION", "INFO"])
+
+    def test_batched_info_fallback(self):
+        video_modes = ["1080i5000", "720p6000", "PAL", "NTSC", "1080p2500"] * 2
+        responses = fake_amcp_responses(video_modes)
+        del responses["INFO"]
+        server = FakeAmcpServer(responses)
+        self.addCleanup(server.close)
+        provider = self.create_provider(server.port)
+        self.assertEqual(provider.fps, {
+                id_channel : parse_video_mode(video_mode)
+                for id_channel, video_mode in enumerate(video_modes, 1)
+            })
+        # Two batches of 8, stopped at the first error
+        self.assertEqual(server.received, ["VERSION", "INFO"] + ["INFO {}".format(i) for i in range(1, 17)])
+
+    def test_unreachable_server(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        with unittest.mock.patch.object(logging, "file", open(os.devnull, "w")):
+            provider = self.create_provider(port)
+        self.assertEqual(provider.fps, {})
+        self.assertEqual(provider.discover_channels(), {})
+
+
+class TestCasparRender(unittest.TestCase):
+    def test_render_time_histograms(self):
+        provider = create_provider("10.0.0.1")
+        provider.protocol = 2.2
+        provider.fps = {1 : (50, 1)}
+        provider.parse_channel_profiler("/channel/1/profiler/time", 0.01, 0.02)
+        provider.parse_stage("/channel/1/stage/layer/10/profiler/time", 0.01, 0.02)
+        provider.publish()
+
+        registry = MetricRegistry(dict(settings, prefix="", hostname="test", tags={}))
+        registry.begin()
+        Metrics.render_caspar(None, registry, provider, provider.collect())
+        lines = registry.finish().decode("utf-8").split("\n")
+
+        channel = [line for line in lines if line.startswith("casparcg_channel_render_time_ratio_count{")]
+        layer = [line for line in lines if line.startswith("casparcg_render_time_ratio_count{")]
+        self.assertEqual(len(channel), 1)
+        self.assertEqual(len(layer), 1)
+        self.assertNotIn("layer=", channel[0])
+        self.assertIn('layer="10"', layer[0])
+
+
+class TestCasparThrottle(unittest.TestCase):
+    def setUp(self):
+        logger = Logging()
+        logger.file = open(os.devnull, "w")
+        self.addCleanup(logger.file.close)
+        self.throttle = LogThrottle(logger, window=3600)
+        patcher = unittest.mock.patch.object(logging, "throttle", self.throttle)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_drop_warnings_are_throttled_per_server(self):
+        for address in ["10.0.0.1", "10.0.0.2"]:
+            provider = create_provider(address)
+            for i in range(3):
+                provider.parse_consume_time("/channel/1/output/consume_time", 0.1)
+                provider.parse_stage("/channel/1/stage/layer/10/profiler/time", 0.05, 0.04)
+
+        self.assertEqual(sorted(self.throttle.entries), [
+                ("consume", "10.0.0.1", 1),
+                ("consume", "10.0.0.2", 1),
+                ("stage", "10.0.0.1", 1, 10),
+                ("stage", "10.0.0.2", 1, 10),
+            ])
+        for count, msgtype, args in self.throttle.entries.values():
+            self.assertEqual(count, 3)
+            self.assertIn(args[1], ["10.0.0.1", "10.0.0.2"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import time
+import threading
+import unittest
+
+from promexp.collector import Collector
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestCollector(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+
+    def tearDown(self):
+        self.release.set()
+
+    def test_hung_disks_do_not_block_other_providers(self):
+        collector = Collector(workers=2)
+        collector.add("disk:/mnt/a", self.release.wait, interval=0.01, timeout=0.05, kind="disk")
+        collector.add("disk:/mnt/b", self.release.wait, interval=0.01, timeout=0.05, kind="disk")
+        collector.add("system", lambda: "system", interval=0.01)
+        collector.add("caspar", lambda: "caspar", interval=0.01, blocking=False)
+        collector.start()
+
+        self.assertTrue(wait_for(lambda: collector.get("system") == "system"))
+        self.assertTrue(wait_for(lambda: collector.get("caspar") == "caspar"))
+        self.assertEqual(collector.status["system"], (1, 0))
+        self.assertTrue(wait_for(lambda: collector.status.get("disk:/mnt/a") == (0, 1)))
+
+        self.release.set()
+        self.assertTrue(wait_for(lambda: collector.get("disk:/mnt/a") is True))
+        self.assertTrue(wait_for(lambda: collector.status.get("disk:/mnt/a") == (1, 0)))
+
+    def test_queued_job_is_not_flagged_as_timed_out(self):
+        collector = Collector(workers=1)
+        collector.add("disk:/mnt/a", self.release.wait, interval=0.01, timeout=0.05, kind="disk")
+        collector.add("disk:/mnt/b", lambda: "b", interval=0.01, timeout=0.05, kind="disk")
+        collector.start()
+
+        self.assertTrue(wait_for(lambda: collector.status.get("disk:/mnt/a") == (0, 1)))
+        time.sleep(0.2)
+        self.assertNotIn("disk:/mnt/b", collector.status)
+
+    def test_pool_sizes(self):
+        collector = Collector(workers=2)
+        for i in range(3):
+            collector.add("disk:{}".format(i), None, kind="disk")
+        collector.add("gpu", None)
+        collector.add("caspar_osc", None, blocking=False)
+        self.assertEqual(collector.pool_sizes(), {"disk" : 2, "gpu" : 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
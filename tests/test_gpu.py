@@ -0,0 +1,58 @@
+import os
+import time
+import unittest
+
+from promexp.gpu import NvidiaSmiSampler
+
+FAKE_SMI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fake-nvidia-smi")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestNvidiaSmiSampler(unittest.TestCase):
+    def test_parse_line(self):
+        sampler = NvidiaSmiSampler(FAKE_SMI)
+        sampler.parse_line(b"0, 00000000:01:00.0, 35, 12, 4, 0\n")
+        sampler.parse_line(b"1, 00000000:02:00.0, 80, [N/A], [Not Supported], [N/A]\n")
+        self.assertEqual([gpu["id"] for gpu in sampler()], ["00000000:01:00.0", "00000000:02:00.0"])
+        self.assertEqual(sampler.gpus[0]["utilization"], {"gpu" : 35, "memory" : 12, "encoder" : 4, "decoder" : 0})
+        self.assertEqual(sampler.gpus[1]["utilization"], {"gpu" : 80})
+
+    def test_malformed_lines_are_ignored(self):
+        sampler = NvidiaSmiSampler(FAKE_SMI)
+        for line in [b"2, 00000000:03:00.0\n", b"GPU is lost\n", b"\n", b"x, 00000000:03:00.0, 1, 2, 3, 4\n"]:
+            sampler.parse_line(line)
+        self.assertEqual(sampler.gpus, {})
+        self.assertEqual(sampler(), [])
+
+    def test_stale_values_are_not_returned(self):
+        sampler = NvidiaSmiSampler(FAKE_SMI)
+        sampler.parse_line(b"0, 00000000:01:00.0, 35, 12, 4, 0\n")
+        sampler.gpus[0]["updated_at"] -= 60
+        self.assertEqual(sampler(), [])
+
+    def test_stream_and_restart(self):
+        sampler = NvidiaSmiSampler(FAKE_SMI, interval=0.5)
+        self.assertIn("-lms", sampler.command)
+        self.assertEqual(sampler.command[-1], "500")
+        sampler.start()
+
+        self.assertTrue(wait_for(lambda: len(sampler()) == 2))
+        self.assertEqual(sampler()[1]["utilization"], {"gpu" : 80})
+        first_proc = sampler.proc
+
+        # The fake nvidia-smi exits: values are discarded and the process is restarted
+        self.assertTrue(wait_for(lambda: sampler() == []))
+        self.assertTrue(wait_for(lambda: sampler.proc is not first_proc and len(sampler()) == 2))
+        self.assertEqual(sampler()[0]["utilization"]["gpu"], 35)
+
+
+if __name__ == "__main__":
+    unittest.main()
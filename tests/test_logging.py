@@ -0,0 +1,184 @@
+import io
+import os
+import time
+import shutil
+import tempfile
+import threading
+import unittest
+import unittest.mock
+
+from nxtools.logging import FileLogWriter, LogThrottle, INFO, WARNING
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestFileLogWriter(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.stderr = io.StringIO()
+        patcher = unittest.mock.patch("sys.stderr", self.stderr)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def read(self, path):
+        if not os.path.exists(path):
+            return ""
+        with open(path) as f:
+            return f.read()
+
+    def test_recovers_after_write_errors(self):
+        logdir = os.path.join(self.tempdir, "logs")
+        path = os.path.join(logdir, "nebula.log")
+        # A file in place of the log directory makes open() fail
+        with open(logdir, "w"):
+            pass
+
+        writer = FileLogWriter(path)
+        self.addCleanup(writer.close)
+        writer(message_type=INFO, message="first")
+        self.assertTrue(wait_for(lambda: writer.failed == 1))
+        writer(message_type=INFO, message="second")
+        self.assertTrue(wait_for(lambda: writer.failed == 2))
+        self.assertIsNone(writer.file)
+        self.assertEqual(self.stderr.getvalue().count("Unable to write log file"), 1)
+
+        os.remove(logdir)
+        writer(message_type=INFO, message="third")
+        self.assertTrue(wait_for(lambda: "third" in self.read(path)))
+        content = self.read(path)
+        self.assertIn("2 log records could not be written", content)
+        self.assertNotIn("first", content)
+        self.assertEqual(writer.reported_failed, 2)
+        self.assertFalse(writer.failing)
+
+    def test_rotate(self):
+        path = os.path.join(self.tempdir, "nebula.log")
+        writer = FileLogWriter(path, max_size=100, backup_count=2)
+        for i in range(10):
+            writer(message_type=INFO, message="message {:02d} {}".format(i, "x" * 40))
+            self.assertTrue(wait_for(lambda: writer.queue.empty()))
+        writer.close()
+        self.assertTrue(os.path.exists(path + ".1"))
+        self.assertTrue(os.path.exists(path + ".2"))
+        self.assertFalse(os.path.exists(path + ".3"))
+        self.assertIn("message 09", self.read(path) + self.read(path + ".1"))
+        self.assertEqual(writer.failed, 0)
+
+
+class RecordingLogger():
+    def __init__(self):
+        self.messages = []
+        self.on_send = None
+
+    def _send(self, msgtype, *args):
+        self.messages.append(" ".join(str(arg) for arg in args))
+        if self.on_send:
+            self.on_send()
+
+
+class TestLogThrottle(unittest.TestCase):
+    def setUp(self):
+        self.logger = RecordingLogger()
+        self.throttle = LogThrottle(self.logger, window=5)
+        # Flushed and summarized by the test instead of the background thread
+        self.throttle.running = True
+
+    def test_summarize(self):
+        for i in range(3):
+            self.throttle.warning("a", "dropped frame on channel", 1)
+        self.throttle.warning("b", "dropped frame on channel", 2)
+        self.throttle.flush()
+        self.assertEqual(self.logger.messages, ["dropped frame on channel 1", "dropped frame on channel 2"])
+
+        entries = self.throttle.entries
+        self.throttle.summarize()
+        self.assertEqual(self.logger.messages[2], "dropped frame on channel 1 (repeated 2 times in last 5s)")
+        self.assertEqual(list(self.throttle.entries), ["a"])
+        self.assertIsNot(self.throttle.entries, entries)
+        self.assertEqual(list(entries), ["a", "b"])
+
+        # Quiet for a whole window: forgotten, the next message is logged again
+        self.throttle.summarize()
+        self.assertEqual(self.throttle.entries, {})
+        self.throttle.warning("a", "dropped frame on channel", 1)
+        self.throttle.flush()
+        self.assertEqual(self.logger.messages[-1], "dropped frame on channel 1")
+
+    def test_keys_added_while_summarizing_are_kept(self):
+        self.throttle.warning("a", "first")
+        self.throttle.warning("a", "first")
+        self.logger.on_send = lambda: self.throttle.log(WARNING, "c", "added")
+        self.throttle.summarize()
+        self.assertEqual(sorted(self.throttle.entries), ["a", "c"])
+
+
+class TestLogThrottleFlusher(unittest.TestCase):
+    def setUp(self):
+        self.stderr = io.StringIO()
+        patcher = unittest.mock.patch("sys.stderr", self.stderr)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_single_flusher(self):
+        barrier = threading.Barrier(8)
+
+        class RacingThrottle(LogThrottle):
+            """Holds every thread after it saw the flusher not running"""
+            @property
+            def running(self):
+                if not self._running and not self.lock.locked():
+                    barrier.wait(2)
+                return self._running
+
+            @running.setter
+            def running(self, value):
+                self._running = value
+
+        throttle = RacingThrottle(RecordingLogger())
+        with unittest.mock.patch("_thread.start_new_thread") as start_new_thread:
+            threads = [threading.Thread(target=throttle.warning, args=(i, "message", i)) for i in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(start_new_thread.call_count, 1)
+        self.assertEqual(len(throttle.pending), 8)
+
+    def test_errors_are_reported(self):
+        logger = RecordingLogger()
+        fail = threading.Event()
+        fail.set()
+
+        def on_send():
+            if fail.is_set():
+                raise OSError("disk full")
+        logger.on_send = on_send
+
+        throttle = LogThrottle(logger, tick=0.01)
+        throttle.warning("a", "first")
+        throttle.warning("b", "second")
+        self.assertTrue(wait_for(lambda: "disk full" in self.stderr.getvalue()))
+        throttle.warning("c", "third")
+        self.assertTrue(wait_for(lambda: not throttle.pending))
+        time.sleep(0.05)
+        self.assertEqual(self.stderr.getvalue().count("Unable to write throttled log messages"), 1)
+
+        # Reported again after writing succeeded in between
+        fail.clear()
+        throttle.warning("d", "fourth")
+        self.assertTrue(wait_for(lambda: not throttle.failing))
+        fail.set()
+        throttle.warning("e", "fifth")
+        self.assertTrue(wait_for(lambda: self.stderr.getvalue().count("Unable to write") == 2))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+import unittest
+
+from promexp.nvml import NvmlBackend, NvmlError
+
+NVML_ERROR_NOT_SUPPORTED = 3
+NVML_ERROR_UNINITIALIZED = 1
+
+
+class StubNvml():
+    """nvml* function table of two GPUs. The second one supports only some queries."""
+
+    def __init__(self, init_result=0):
+        self.init_result = init_result
+        self.devices = [
+                {
+                    "bus_id" : b"00000000:01:00.0",
+                    "utilization" : (35, 12),
+                    "encoder" : 4,
+                    "decoder" : 0,
+                    "memory" : (8 * 2**30, 6 * 2**30, 2 * 2**30),
+                    "temperature" : 61,
+                    "power" : 123456,
+                    "clocks" : {0 : 1500, 1 : 1500, 2 : 5000, 3 : 1300},
+                    "encoder_sessions" : 2,
+                },
+                {
+                    "utilization" : (80, 40),
+                    "temperature" : 70,
+                    "clocks" : {0 : 900},
+                },
+            ]
+
+    def nvmlInit_v2(self):
+        return self.init_result
+
+    def nvmlDeviceGetCount_v2(self, count):
+        count._obj.value = len(self.devices)
+        return 0
+
+    def nvmlDeviceGetHandleByIndex_v2(self, index, handle):
+        handle._obj.value = index.value + 1
+        return 0
+
+    def get(self, handle, key):
+        return self.devices[handle.value - 1].get(key)
+
+    def nvmlDeviceGetPciInfo_v3(self, handle, pci):
+        value = self.get(handle, "bus_id")
+        if value is None:
+            return NVML_ERROR_NOT_SUPPORTED
+        pci._obj.busId = value
+        return 0
+
+    def nvmlDeviceGetUtilizationRates(self, handle, utilization):
+        value = self.get(handle, "utilization")
+        if value is None:
+            return NVML_ERROR_NOT_SUPPORTED
+        utilization._obj.gpu, utilization._obj.memory = value
+        return 0
+
+    def uint_query(key, output=0):
+        """Returns nvmlDeviceGet* stub writing an unsigned int to argument `output` after the handle"""
+        def query(self, handle, *params):
+            value = params[output]
+            result = self.get(handle, key)
+            if result is None:
+                return NVML_ERROR_NOT_SUPPORTED
+            value._obj.value = result
+            return 0
+        return query
+
+    nvmlDeviceGetEncoderUtilization = uint_query("encoder")
+    nvmlDeviceGetDecoderUtilization = uint_query("decoder")
+    nvmlDeviceGetPowerUsage = uint_query("power")
+    nvmlDeviceGetEncoderStats = uint_query("encoder_sessions")
+    nvmlDeviceGetTemperature = uint_query("temperature", output=1)
+
+    def nvmlDeviceGetMemoryInfo(self, handle, memory):
+        value = self.get(handle, "memory")
+        if value is None:
+            return NVML_ERROR_NOT_SUPPORTED
+        memory._obj.total, memory._obj.free, memory._obj.used = value
+        return 0
+
+    def nvmlDeviceGetClockInfo(self, handle, clock_type, value):
+        clock = self.get(handle, "clocks").get(clock_type.value)
+        if clock is None:
+            return NVML_ERROR_NOT_SUPPORTED
+        value._obj.value = clock
+        return 0
+
+
+class TestNvmlBackend(unittest.TestCase):
+    def test_devices(self):
+        nvml = NvmlBackend(lib=StubNvml())
+        self.assertEqual([device_id for device_id, handle in nvml.devices], ["00000000:01:00.0", "1"])
+
+    def test_get_device(self):
+        first, second = NvmlBackend(lib=StubNvml())()
+        self.assertEqual(first, {
+                "id" : "00000000:01:00.0",
+                "utilization" : {"gpu" : 35, "memory" : 12, "encoder" : 4, "decoder" : 0},
+                "memory" : {"used" : 2 * 2**30, "total" : 8 * 2**30},
+                "temperature" : 61,
+                "power" : 123.456,
+                "clocks" : {"graphics" : 1500, "sm" : 1500, "memory" : 5000, "video" : 1300},
+                "encoder_sessions" : 2,
+            })
+
+        # Unsupported queries are omitted, the PCI bus id falls back to the index
+        self.assertEqual(second, {
+                "id" : "1",
+                "utilization" : {"gpu" : 80, "memory" : 40},
+                "temperature" : 70,
+                "clocks" : {"graphics" : 900},
+            })
+
+    def test_init_error(self):
+        with self.assertRaises(NvmlError) as context:
+            NvmlBackend(lib=StubNvml(init_result=NVML_ERROR_UNINITIALIZED))
+        self.assertEqual(context.exception.code, NVML_ERROR_UNINITIALIZED)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,69 @@
+import unittest
+
+from promexp.peak import PeakWindow
+
+
+class TestPeakWindow(unittest.TestCase):
+    def setUp(self):
+        # Ring of 5 one second buckets
+        self.peak = PeakWindow(5, resolution=1)
+
+    def observe(self, values):
+        for now, value in values:
+            self.peak.observe(value, now)
+
+    def assertPeak(self, result, expected):
+        self.assertIsNotNone(result)
+        for value, expected_value in zip(result, expected):
+            self.assertAlmostEqual(value, expected_value)
+
+    def test_no_data(self):
+        self.assertEqual(self.peak.size, 5)
+        self.assertIsNone(self.peak.get(5, 100))
+        self.observe([(10.5, 0.5)])
+        # Only older values
+        self.assertIsNone(self.peak.get(5, 15.5))
+        self.assertIsNone(self.peak.get(1, 11.5))
+
+    def test_max_min_mean(self):
+        self.observe([(10.1, 0.5), (10.9, 0.1), (11.5, 0.9), (12.0, 0.3)])
+        self.assertPeak(self.peak.get(5, 12.5), (0.9, 0.1, 0.45))
+        self.assertPeak(self.peak.get(3, 12.5), (0.9, 0.1, 0.45))
+
+    def test_window_shorter_than_ring(self):
+        self.observe([(10.5, 0.9), (11.5, 0.2), (12.5, 0.4)])
+        self.assertPeak(self.peak.get(2, 12.5), (0.4, 0.2, 0.3))
+        self.assertEqual(self.peak.get(1, 12.5), (0.4, 0.4, 0.4))
+        # Windows shorter than the resolution cover the current bucket
+        self.assertEqual(self.peak.get(0.1, 12.5), (0.4, 0.4, 0.4))
+
+    def test_window_longer_than_ring(self):
+        self.observe([(now + 0.5, now / 100) for now in range(10, 20)])
+        # Only the ring (5 buckets) is available
+        self.assertPeak(self.peak.get(60, 19.5), (0.19, 0.15, 0.17))
+        self.assertEqual(self.peak.get(60, 19.5), self.peak.get(5, 19.5))
+
+    def test_bucket_reuse_after_wrap(self):
+        self.observe([(10.5, 0.9), (10.6, 0.8)])
+        # Same slot five buckets later: the old values are discarded
+        self.observe([(15.5, 0.1)])
+        self.assertEqual(self.peak.ids.count(15), 1)
+        self.assertEqual(self.peak.get(5, 15.5), (0.1, 0.1, 0.1))
+        # A slot not reused since the ring wrapped is skipped
+        self.observe([(11.5, 0.7)])
+        self.assertEqual(self.peak.get(5, 16.5), (0.1, 0.1, 0.1))
+        self.assertIsNone(self.peak.get(5, 21.5))
+
+    def test_readers_get_identical_results(self):
+        self.observe([(10 + i / 10, i % 7 / 10) for i in range(50)])
+        state = (list(self.peak.ids), list(self.peak.maxs), list(self.peak.sums), list(self.peak.counts))
+        first = [self.peak.get(window, 14.95) for window in [1, 3, 5]]
+        second = [self.peak.get(window, 14.95) for window in [1, 3, 5]]
+        self.assertEqual(first, second)
+        self.assertIsNotNone(first[0])
+        # Reading has no side effect
+        self.assertEqual(state, (list(self.peak.ids), list(self.peak.maxs), list(self.peak.sums), list(self.peak.counts)))
+
+
+if __name__ == "__main__":
+    unittest.main()
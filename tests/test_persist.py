@@ -0,0 +1,162 @@
+import os
+import atexit
+import shutil
+import tempfile
+import unittest
+import unittest.mock
+
+from nxtools import logging
+
+from promexp.caspar import CasparMonitor
+from promexp.common import settings
+from promexp.persist import StateFile, HEADER
+
+from tests.fake_amcp import FakeAmcpServer, fake_amcp_responses
+
+
+def read_slots(path):
+    """Returns [(sequence, length), ...] of both slots"""
+    with open(path, "rb") as f:
+        raw = f.read()
+    slot_size = len(raw) // 2
+    result = []
+    for offset in [0, slot_size]:
+        magic, sequence, length, crc = HEADER.unpack_from(raw, offset)
+        result.append((sequence, length))
+    return result
+
+
+class TestStateFile(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.path = os.path.join(self.tempdir, "state")
+
+    def test_missing_directory_is_created(self):
+        path = os.path.join(self.tempdir, "var", "lib", "nebula-prometheus", "state")
+        state = StateFile(path)
+        self.assertEqual(state.data, {})
+        self.assertTrue(state.save({"a" : 1}))
+        state.close()
+        self.assertEqual(StateFile(path).data, {"a" : 1})
+
+    def test_slot_rotation(self):
+        state = StateFile(self.path, slot_size=256)
+        self.assertTrue(state.save({"a" : 1}))
+        self.assertEqual(read_slots(self.path), [(1, 7), (1, 7)])
+        self.assertFalse(state.save({"a" : 1}))
+        self.assertTrue(state.save({"a" : 22}))
+        self.assertEqual(read_slots(self.path), [(2, 8), (1, 7)])
+        self.assertTrue(state.save({"a" : 333}))
+        self.assertEqual(read_slots(self.path), [(2, 8), (3, 9)])
+        state.close()
+
+        state = StateFile(self.path, slot_size=256)
+        self.assertEqual(state.data, {"a" : 333})
+        self.assertEqual(state.sequence, 3)
+        # The first save after opening rebuilds the file, then slots alternate again
+        self.assertTrue(state.save({"a" : 4}))
+        self.assertEqual(read_slots(self.path), [(4, 7), (4, 7)])
+        self.assertTrue(state.save({"a" : 55}))
+        self.assertEqual(read_slots(self.path), [(4, 7), (5, 8)])
+        state.close()
+
+    def test_corrupted_latest_slot(self):
+        state = StateFile(self.path, slot_size=256)
+        state.save({"a" : 1})
+        state.save({"a" : 2})
+        state.close()
+
+        # Damage the payload of the latest slot (sequence 2, slot 0)
+        with open(self.path, "r+b") as f:
+            f.seek(HEADER.size + 2)
+            f.write(b"X")
+        with unittest.mock.patch.object(logging, "file", open(os.devnull, "w")):
+            state = StateFile(self.path, slot_size=256)
+        self.assertEqual(state.data, {"a" : 1})
+        self.assertEqual(state.sequence, 1)
+
+        # Saving rebuilds the file without the damaged slot
+        state.save({"a" : 3})
+        state.close()
+        self.assertEqual(read_slots(self.path), [(2, 7), (2, 7)])
+        self.assertEqual(StateFile(self.path).data, {"a" : 3})
+
+    def test_both_slots_invalid(self):
+        with open(self.path, "wb") as f:
+            f.write(b"garbage" * 100)
+        with unittest.mock.patch.object(logging, "file", open(os.devnull, "w")):
+            self.assertEqual(StateFile(self.path).data, {})
+
+    def test_grow(self):
+        state = StateFile(self.path, slot_size=64)
+        state.save({"a" : 1})
+        self.assertEqual(os.path.getsize(self.path), 128)
+
+        data = {"values" : list(range(100))}
+        self.assertTrue(state.save(data))
+        size = os.path.getsize(self.path)
+        self.assertGreaterEqual(size, 2 * (HEADER.size + len(str(data))))
+        self.assertEqual(size, 2 * state.slot_size)
+        self.assertFalse(os.path.exists(self.path + ".tmp"))
+
+        # Saves after growing use the new slots in place
+        data["values"].append(100)
+        self.assertTrue(state.save(data))
+        self.assertEqual(os.path.getsize(self.path), size)
+        state.close()
+
+        state = StateFile(self.path, slot_size=64)
+        self.assertEqual(state.data, data)
+        self.assertEqual(state.slot_size, size // 2)
+        state.close()
+
+
+class TestCasparMonitorState(unittest.TestCase):
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tempdir)
+        self.server = FakeAmcpServer(fake_amcp_responses(["1080i5000"]))
+        self.addCleanup(self.server.close)
+        self.settings = dict(
+                settings,
+                state_path=os.path.join(self.tempdir, "lib", "state"),
+                caspar_servers=[{"host" : "127.0.0.1", "amcp_port" : self.server.port}]
+            )
+        patcher = unittest.mock.patch.object(logging, "throttle", unittest.mock.Mock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def create_monitor(self):
+        monitor = CasparMonitor(self.settings, threaded=False)
+        atexit.unregister(monitor.save_at_exit)
+        self.addCleanup(monitor.providers[0].caspar.close)
+        return monitor
+
+    def test_restore(self):
+        monitor = self.create_monitor()
+        provider = monitor.providers[0]
+        for layer in [10, 10, 20]:
+            provider.parse_stage("/channel/1/stage/layer/{}/profiler/time".format(layer), 0.05, 0.04)
+        self.assertEqual(monitor.save(), {"saved" : True})
+        self.assertEqual(monitor.save(), {"saved" : False})
+        monitor.state.close()
+
+        monitor = self.create_monitor()
+        dropped = monitor.providers[0].collect()["dropped"]
+        self.assertEqual(dropped, {1 : {10 : 2, 20 : 1}})
+        monitor.state.close()
+
+    def test_save_at_exit_logs_errors(self):
+        monitor = self.create_monitor()
+        # A file in place of the state directory
+        with open(os.path.join(self.tempdir, "lib"), "w"):
+            pass
+        with unittest.mock.patch.object(logging, "error") as error:
+            monitor.save_at_exit()
+        self.assertEqual(error.call_count, 1)
+        self.assertIn("Unable to save state file", error.call_args[0][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+from promexp.registry import MetricRegistry
+
+
+class TestMetricRegistry(unittest.TestCase):
+    def setUp(self):
+        self.settings = {"prefix" : "nebula", "hostname" : "playout1", "tags" : {}}
+        self.registry = MetricRegistry(self.settings)
+
+    def render(self, *samples):
+        self.registry.begin()
+        for name, value, tags in samples:
+            self.registry.add(name, value, **tags)
+        return self.registry.finish().decode("utf-8")
+
+    def test_format(self):
+        self.settings["tags"] = {"site" : "prague"}
+        self.assertEqual(
+                self.render(("cpu_usage", 12.5, {"core" : 0}), ("uptime_seconds", 10, {})),
+                "nebula_cpu_usage{core=\"0\", hostname=\"playout1\", site=\"prague\"} 12.5\n"
+                "nebula_uptime_seconds{hostname=\"playout1\", site=\"prague\"} 10\n"
+            )
+
+    def test_no_prefix(self):
+        self.settings["prefix"] = ""
+        self.assertEqual(self.render(("up", 1, {})), "up{hostname=\"playout1\"} 1\n")
+
+    def test_label_escaping(self):
+        output = self.render(("disk_usage", 1, {"mountpoint" : "C:\\Media \"A\"\nB"}))
+        self.assertEqual(
+                output,
+                "nebula_disk_usage{mountpoint=\"C:\\\\Media \\\"A\\\"\\nB\", hostname=\"playout1\"} 1\n"
+            )
+        self.assertEqual(output.count("\n"), 1)
+
+    def test_histogram(self):
+        self.registry.begin()
+        self.registry.add_histogram("render_time_ratio", (0.5, 1), [3, 2, 1], 4.5, channel=1)
+        self.assertEqual(self.registry.finish().decode("utf-8"), "".join([
+                "nebula_render_time_ratio_bucket{channel=\"1\", le=\"0.5\", hostname=\"playout1\"} 3\n",
+                "nebula_render_time_ratio_bucket{channel=\"1\", le=\"1\", hostname=\"playout1\"} 5\n",
+                "nebula_render_time_ratio_bucket{channel=\"1\", le=\"+Inf\", hostname=\"playout1\"} 6\n",
+                "nebula_render_time_ratio_sum{channel=\"1\", hostname=\"playout1\"} 4.5\n",
+                "nebula_render_time_ratio_count{channel=\"1\", hostname=\"playout1\"} 6\n",
+            ]))
+
+    def test_prefix_cache(self):
+        self.render(("up", 1, {"a" : 1}))
+        prefix = self.registry.series["up", ("a", 1)]
+        self.assertEqual(self.render(("up", 2, {"a" : 1})), "nebula_up{a=\"1\", hostname=\"playout1\"} 2\n")
+        self.assertIs(self.registry.series["up", ("a", 1)], prefix)
+
+    def test_cache_invalidated_on_global_tag_change(self):
+        self.render(("up", 1, {}))
+        self.settings["tags"] = {"site" : "prague"}
+        self.assertEqual(self.render(("up", 1, {})), "nebula_up{hostname=\"playout1\", site=\"prague\"} 1\n")
+        self.settings["hostname"] = "playout2"
+        self.assertEqual(self.render(("up", 1, {})), "nebula_up{hostname=\"playout2\", site=\"prague\"} 1\n")
+        self.settings["prefix"] = "casparcg"
+        self.assertEqual(self.render(("up", 1, {})), "casparcg_up{hostname=\"playout2\", site=\"prague\"} 1\n")
+        self.assertEqual(len(self.registry.series), 1)
+
+    def test_cache_reset_over_max_series(self):
+        registry = self.registry = MetricRegistry(self.settings, max_series=3)
+        self.render(*[("up", 1, {"id" : i}) for i in range(3)])
+        self.assertEqual(len(registry.series), 3)
+        self.render(*[("up", 1, {"id" : i}) for i in range(3, 5)])
+        self.assertEqual(len(registry.series), 5)
+        # Over the limit: dropped before the next scrape
+        output = self.render(("up", 1, {"id" : 0}))
+        self.assertEqual(len(registry.series), 1)
+        self.assertEqual(output, "nebula_up{id=\"0\", hostname=\"playout1\"} 1\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
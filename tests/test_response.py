@@ -0,0 +1,72 @@
+import gzip
+import unittest
+
+from promexp.response import CachedResponse, accepts_gzip, etag_matches
+
+
+class TestAcceptsGzip(unittest.TestCase):
+    def test_accepts_gzip(self):
+        for header in [
+                    "gzip",
+                    "GZIP",
+                    "deflate, gzip",
+                    "gzip;q=0.5",
+                    "gzip; q=1.0",
+                    "*",
+                    "identity, *;q=0.1",
+                    "*;q=0, gzip",
+                    "gzip;q=abc",
+                    "gzip;q=",
+                    "gzip;level=1;q=1",
+                ]:
+            self.assertTrue(accepts_gzip(header), header)
+
+    def test_rejects_gzip(self):
+        for header in [
+                    None,
+                    "",
+                    "identity",
+                    "deflate, br",
+                    "gzip;q=0",
+                    "gzip;q=0.000",
+                    "*;q=0",
+                    "gzip;q=0, *",
+                    "*;q=abc, gzip;q=0",
+                    "x-gzipped",
+                ]:
+            self.assertFalse(accepts_gzip(header), header)
+
+
+class TestEtagMatches(unittest.TestCase):
+    def test_etag_matches(self):
+        etag = "\"1f-0a0b0c0d\""
+        self.assertTrue(etag_matches(etag, etag))
+        self.assertTrue(etag_matches("\"x\", " + etag, etag))
+        self.assertTrue(etag_matches("W/" + etag, etag))
+        self.assertTrue(etag_matches("*", etag))
+        self.assertFalse(etag_matches(None, etag))
+        self.assertFalse(etag_matches("", etag))
+        self.assertFalse(etag_matches("\"1f-0a0b0c0e\"", etag))
+        self.assertFalse(etag_matches(etag[1:-1], etag))
+
+
+class TestCachedResponse(unittest.TestCase):
+    def test_get(self):
+        response = CachedResponse(31, b"metric 1\n")
+        body, etag, encoding = response.get("gzip")
+        self.assertEqual(gzip.decompress(body), b"metric 1\n")
+        self.assertEqual(encoding, "gzip")
+        self.assertEqual(etag, response.gzip_etag)
+
+        body, identity_etag, encoding = response.get("gzip;q=abc, *;q=0")
+        self.assertEqual(encoding, "gzip")
+
+        body, identity_etag, encoding = response.get(None)
+        self.assertEqual(body, b"metric 1\n")
+        self.assertIsNone(encoding)
+        self.assertNotEqual(identity_etag, etag)
+        self.assertTrue(identity_etag.startswith("\"1f-"))
+
+
+if __name__ == "__main__":
+    unittest.main()
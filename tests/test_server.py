@@ -0,0 +1,109 @@
+import time
+import socket
+import _thread
+import unittest
+import http.client
+
+from promexp.server import MetricsRequestHandler, PooledHTTPServer
+from promexp.response import CachedResponse
+
+
+class Parent():
+    get_info = "Test"
+
+    def __init__(self):
+        self.cached_response = CachedResponse(1, b"metric 1\n")
+        self.metrics = self
+
+    def response(self):
+        return self.cached_response
+
+
+class TestPooledHTTPServer(unittest.TestCase):
+    def setUp(self):
+        self.httpd = PooledHTTPServer(("127.0.0.1", 0), MetricsRequestHandler, workers=2, request_timeout=5)
+        self.httpd.parent = Parent()
+        _thread.start_new_thread(self.httpd.serve_forever, ())
+        self.port = self.httpd.server_address[1]
+        self.connections = []
+
+    def tearDown(self):
+        for conn in self.connections:
+            conn.close()
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def connect(self):
+        conn = http.client.HTTPConnection("127.0.0.1", self.port, timeout=10)
+        self.connections.append(conn)
+        return conn
+
+    def get(self, conn):
+        conn.request("GET", "/metrics")
+        response = conn.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b"metric 1\n")
+        self.assertFalse(response.will_close)
+
+    def test_idle_keep_alive_clients_do_not_block_workers(self):
+        idle = [self.connect() for i in range(4)]
+        for conn in idle:
+            self.get(conn)
+
+        start_time = time.perf_counter()
+        self.get(self.connect())
+        self.assertLess(time.perf_counter() - start_time, 1)
+
+        # Idle connections are served again on their next request
+        for conn in idle:
+            self.get(conn)
+
+    def test_pipelined_requests(self):
+        sock = socket.create_connection(("127.0.0.1", self.port), timeout=5)
+        self.addCleanup(sock.close)
+        sock.sendall(b"GET /metrics HTTP/1.1\r\nHost: x\r\n\r\nGET /metrics HTTP/1.1\r\nHost: x\r\n\r\n")
+        data = b""
+        while data.count(b"metric 1\n") < 2:
+            chunk = sock.recv(4096)
+            self.assertTrue(chunk)
+            data += chunk
+        self.assertEqual(data.count(b"HTTP/1.1 200"), 2)
+
+    def test_not_modified(self):
+        conn = self.connect()
+        conn.request("GET", "/metrics", headers={"Accept-Encoding" : "gzip"})
+        response = conn.getresponse()
+        response.read()
+        etag = response.getheader("ETag")
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+
+        conn.request("GET", "/metrics", headers={"Accept-Encoding" : "gzip", "If-None-Match" : etag})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 304)
+        self.assertEqual(response.read(), b"")
+        self.assertEqual(response.getheader("ETag"), etag)
+
+        # The identity representation has a different ETag
+        conn.request("GET", "/metrics", headers={"If-None-Match" : etag})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.read(), b"metric 1\n")
+
+    def test_malformed_accept_encoding(self):
+        conn = self.connect()
+        conn.request("GET", "/metrics", headers={"Accept-Encoding" : "gzip;q=abc"})
+        response = conn.getresponse()
+        self.assertEqual(response.status, 200)
+        self.assertEqual(response.getheader("Content-Encoding"), "gzip")
+        response.read()
+
+    def test_idle_connection_expires(self):
+        self.httpd.request_timeout = 0.2
+        conn = self.connect()
+        self.get(conn)
+        time.sleep(1.5)
+        self.assertEqual(len(self.httpd.selector.get_map()), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,86 @@
+import time
+import threading
+import unittest
+
+from promexp.singleflight import SingleFlight
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+class TestSingleFlight(unittest.TestCase):
+    def run_concurrently(self, flight, func, callers=8, key="metrics"):
+        """Calls flight.do from `callers` threads while func is in progress. Returns their outcomes."""
+        release = threading.Event()
+        outcomes = []
+
+        def blocking_func():
+            release.wait(5)
+            return func()
+
+        def caller():
+            try:
+                outcomes.append(("result", flight.do(key, blocking_func)))
+            except Exception as e:
+                outcomes.append(("error", e))
+
+        threads = [threading.Thread(target=caller) for i in range(callers)]
+        for thread in threads:
+            thread.start()
+        # Every caller but the leader is waiting for the leader's call
+        self.assertTrue(wait_for(lambda: flight.fresh + flight.coalesced == callers))
+        release.set()
+        for thread in threads:
+            thread.join()
+        return outcomes
+
+    def test_shared_result(self):
+        flight = SingleFlight()
+        calls = []
+        result = object()
+
+        def func():
+            calls.append(1)
+            return result
+
+        outcomes = self.run_concurrently(flight, func)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(len(outcomes), 8)
+        for kind, value in outcomes:
+            self.assertEqual(kind, "result")
+            self.assertIs(value, result)
+        self.assertEqual((flight.fresh, flight.coalesced), (1, 7))
+        self.assertEqual(flight.calls, {})
+
+        # A call after the flight finished runs again
+        self.assertEqual(flight.do("metrics", lambda: 2), 2)
+        self.assertEqual((flight.fresh, flight.coalesced), (2, 7))
+
+    def test_shared_exception(self):
+        flight = SingleFlight()
+        error = ValueError("render failed")
+
+        def func():
+            raise error
+
+        outcomes = self.run_concurrently(flight, func, callers=4)
+        self.assertEqual(outcomes, [("error", error)] * 4)
+        self.assertEqual((flight.fresh, flight.coalesced), (1, 3))
+        self.assertEqual(flight.calls, {})
+        self.assertEqual(flight.do("metrics", lambda: "recovered"), "recovered")
+
+    def test_keys_are_independent(self):
+        flight = SingleFlight()
+        self.assertEqual(flight.do(1, lambda: "a"), "a")
+        self.assertEqual(flight.do(2, lambda: "b"), "b")
+        self.assertEqual((flight.fresh, flight.coalesced), (2, 0))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,97 @@
+import unittest
+import unittest.mock
+
+from promexp.caspar import CasparMetricsProvider
+from promexp.common import settings
+from promexp.stage import StageStore
+
+
+class TestStageStore(unittest.TestCase):
+    def setUp(self):
+        self.store = StageStore(max_age=10)
+        self.store.tick(100)
+
+    def test_slots(self):
+        store = self.store
+        prefix = "/channel/1/stage/layer/10/"
+        self.assertEqual(
+                store.update(prefix + "foreground/file/time", (12.5, 60.0)),
+                ((1, 10), "foreground/file/time", ("fg_time", "fg_duration"))
+            )
+        store.update(prefix + "foreground/file/name", ("AMB.mov",))
+        store.update(prefix + "foreground/paused", (True,))
+        store.update(prefix + "profiler/time", (0.01, 0.02))
+        store.update(prefix + "background/producer", ("empty",))
+        self.assertEqual(store.update(prefix + "foreground/file/video/width", (1920,))[2], None)
+
+        layer = store.get(1, 10)
+        self.assertEqual((layer.fg_time, layer.fg_duration), (12.5, 60.0))
+        self.assertEqual(layer.fg_name, "AMB.mov")
+        self.assertTrue(layer.fg_paused)
+        self.assertEqual((layer.profiler_real, layer.profiler_expected), (0.01, 0.02))
+        self.assertEqual(layer.bg_producer, "empty")
+        self.assertIsNone(layer.fg_path)
+        self.assertEqual(layer.extra, {"foreground/file/video/width" : (1920,)})
+        self.assertEqual(layer.updated_at, 100)
+        self.assertIsNone(store.get(1, 20))
+
+    def test_invalid_address(self):
+        for address in ["/channel/x/stage/layer/10/paused", "/channel/1/stage/layer", "/channel"]:
+            self.assertIsNone(self.store.update(address, (1,)), address)
+        self.assertEqual(self.store.layers, {})
+
+    def test_address_cache(self):
+        first = self.store.update("/channel/1/stage/layer/10/foreground/paused", (False,))
+        second = self.store.update("/channel/1/stage/layer/10/profiler/time", (0.01, 0.02))
+        self.assertIs(first[0], second[0])
+        third = self.store.update("/channel/1/stage/layer/10/foreground/paused", (True,))
+        self.assertEqual(third, first)
+        self.assertIs(third[1], first[1])
+        self.assertEqual(len(self.store.addresses), 2)
+
+    def test_max_addresses(self):
+        store = StageStore(max_addresses=3)
+        for id_layer in range(1, 5):
+            store.update("/channel/1/stage/layer/{}/foreground/paused".format(id_layer), (True,))
+        # The address cache is reset when full, layer state is kept
+        self.assertEqual(len(store.addresses), 1)
+        self.assertEqual(len(store.layers), 4)
+        self.assertTrue(store.get(1, 1).fg_paused)
+
+    def test_eviction(self):
+        store = self.store
+        store.update("/channel/1/stage/layer/10/foreground/paused", (True,))
+        store.tick(108)
+        store.update("/channel/1/stage/layer/20/foreground/paused", (True,))
+
+        store.tick(109.5)
+        self.assertEqual(sorted(store.layers), [(1, 10), (1, 20)])
+        store.tick(110.5)
+        self.assertEqual(sorted(store.layers), [(1, 20)])
+        self.assertIsNone(store.get(1, 10))
+
+        # Evicting runs at most once per second
+        store.tick(117.9)
+        store.tick(118.5)
+        self.assertEqual(sorted(store.layers), [(1, 20)])
+        store.tick(118.9)
+        self.assertEqual(store.layers, {})
+
+
+class TestProviderEviction(unittest.TestCase):
+    def test_eviction_without_consume_time(self):
+        provider = CasparMetricsProvider(dict(settings, caspar_host=None, caspar_layer_timeout=10))
+        provider.fps = {1 : (50, 1)}
+        with unittest.mock.patch("time.time", return_value=1000):
+            provider.parse_framerate("/channel/1/framerate", 50, 1)
+            provider.parse_stage("/channel/1/stage/layer/10/foreground/paused", False)
+        self.assertIsNotNone(provider.stage.get(1, 10))
+        self.assertEqual(provider.stage.get(1, 10).updated_at, 1000)
+
+        with unittest.mock.patch("time.time", return_value=1020):
+            provider.parse_channel_profiler("/channel/1/profiler/time", 0.01, 0.02)
+        self.assertIsNone(provider.stage.get(1, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()